@@ -0,0 +1,242 @@
+# admission.py
+"""
+Admission control for separations and remixes.
+
+Each request is given an estimated cost before any work starts: processing
+seconds and peak memory, from the audio duration and the requested
+operations (see separation_cost and remix_cost). Two per-instance budgets
+are enforced:
+
+- Backlog: the estimated seconds of all admitted, unfinished work may not
+  exceed ADMISSION_BACKLOG_SECONDS. Requests beyond it are rejected at once
+  with 429 and a Retry-After of roughly how long the excess takes to drain.
+- Memory: admitted work starts only while the estimated memory of running
+  work fits in ADMISSION_MEMORY_MB. Up to ADMISSION_MAX_WAITING requests
+  wait for room, each for at most ADMISSION_MAX_WAIT_SECONDS; beyond that
+  they are rejected too.
+
+A single request larger than a budget is still admitted when nothing else
+is outstanding, so long tracks are slow rather than impossible.
+
+The ratio of measured to estimated seconds is exported per kind, together
+with rejection counts, so the cost factors below can be tuned against real
+traffic.
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+import metrics
+from batch_scheduler import BATCH_MAX_SIZE, padded_length
+from chunked_separation import CHUNK_SECONDS, CHUNK_PARALLELISM, CHUNK_THRESHOLD_SECONDS, SAMPLE_RATE
+from jobs import JOB_WORKERS
+
+logger = logging.getLogger("remixer-backend.admission")
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_BACKLOG_SECONDS = float(os.environ.get('ADMISSION_BACKLOG_SECONDS', '900'))
+ADMISSION_MEMORY_BYTES = int(os.environ.get('ADMISSION_MEMORY_MB', '3072')) * 1024 * 1024
+ADMISSION_MAX_WAITING = int(os.environ.get('ADMISSION_MAX_WAITING', '16'))
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get('ADMISSION_MAX_WAIT_SECONDS', '120'))
+# Assumed duration of audio that cannot be measured up front (e.g. a URL not yet downloaded).
+DEFAULT_AUDIO_SECONDS = float(os.environ.get('ADMISSION_DEFAULT_AUDIO_SECONDS', '300'))
+
+# Cost factors per second of input audio, for the 2-stem model on one core.
+SEPARATION_SECONDS_PER_AUDIO_SECOND = float(os.environ.get('COST_SEPARATION_SECONDS_PER_AUDIO_SECOND', '0.15'))
+SEPARATION_BYTES_PER_AUDIO_SECOND = float(os.environ.get('COST_SEPARATION_MB_PER_AUDIO_SECOND', '6')) * 1024 * 1024
+REMIX_SECONDS_PER_AUDIO_SECOND = float(os.environ.get('COST_REMIX_SECONDS_PER_AUDIO_SECOND', '0.03'))
+REMIX_BYTES_PER_AUDIO_SECOND = float(os.environ.get('COST_REMIX_MB_PER_AUDIO_SECOND', '3')) * 1024 * 1024
+# Tempo/pitch changes run the phase vocoder, which dominates a remix.
+STRETCH_FACTOR = 4.0
+
+
+class Overloaded(Exception):
+    """Raised when a request does not fit the instance's budgets."""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Cost:
+    def __init__(self, seconds, memory_bytes):
+        self.seconds = seconds
+        self.memory_bytes = memory_bytes
+
+    def __repr__(self):
+        return f"Cost({self.seconds:.1f}s, {self.memory_bytes / 2**20:.0f} MB)"
+
+
+def separation_cost(audio_seconds, stems=2):
+    """Estimated cost of separating audio_seconds of audio into `stems` stems."""
+    scale = 1.0 + 0.25 * (stems - 2)
+    # Long tracks are separated window by window, so memory stops growing with length.
+    windows = 1
+    resident_seconds = audio_seconds
+    if audio_seconds > CHUNK_THRESHOLD_SECONDS:
+        windows = max(CHUNK_PARALLELISM, 1) + 1
+        resident_seconds = CHUNK_SECONDS
+    if BATCH_MAX_SIZE > 1:
+        # A batched waveform is padded to whole Spleeter segments. Every
+        # member of a batch holds its own reservation, so together they
+        # cover the peak of the shared forward pass.
+        resident_seconds = padded_length(int(resident_seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    resident_seconds *= windows
+    return Cost(SEPARATION_SECONDS_PER_AUDIO_SECOND * audio_seconds * scale,
+                SEPARATION_BYTES_PER_AUDIO_SECOND * resident_seconds * scale)
+
+
+def remix_cost(audio_seconds, variants):
+    """Estimated cost of rendering the given variants (dicts with tempo/pitch/reverb) of one stem pair."""
+    seconds = 0.0
+    for variant in variants:
+        factor = 1.0
+        if float(variant.get('tempo', 1.0)) != 1.0 or float(variant.get('pitch', 0)) != 0:
+            factor += STRETCH_FACTOR
+        seconds += REMIX_SECONDS_PER_AUDIO_SECOND * audio_seconds * factor
+    # The stems are decoded once; each variant's transformed stems are held until it is encoded.
+    memory = REMIX_BYTES_PER_AUDIO_SECOND * audio_seconds * (1 + 0.5 * (len(variants) - 1))
+    return Cost(seconds, memory)
+
+
+class Ticket:
+    """An admitted request. start() waits for memory; finish() returns its share of the budgets."""
+
+    def __init__(self, controller, kind, cost):
+        self.controller = controller
+        self.kind = kind
+        self.cost = cost
+        self.started_at = None
+        self.released = False
+
+    def start(self):
+        self.controller._start(self)
+        self.started_at = time.perf_counter()
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started_at if self.started_at is not None else None
+        self.controller._release(self, elapsed)
+
+    def cancel(self):
+        """Returns the reservation of a request that will not run."""
+        self.controller._release(self, None)
+
+
+class AdmissionController:
+    def __init__(self, backlog_seconds=ADMISSION_BACKLOG_SECONDS, memory_bytes=ADMISSION_MEMORY_BYTES,
+                 max_waiting=ADMISSION_MAX_WAITING, max_wait_seconds=ADMISSION_MAX_WAIT_SECONDS,
+                 workers=JOB_WORKERS):
+        self.backlog_seconds = backlog_seconds
+        self.memory_bytes = memory_bytes
+        self.max_waiting = max_waiting
+        self.max_wait_seconds = max_wait_seconds
+        self.workers = max(workers, 1)
+        self._changed = threading.Condition()
+        self.backlog = 0.0
+        self.memory_in_use = 0
+        self.running = 0
+        self.waiting = 0
+        self.outstanding = 0
+
+    def _reject(self, kind, reason, message, retry_after):
+        metrics.admission_rejections.inc(kind=kind, reason=reason)
+        logger.warning(f"Rejected {kind}: {message}")
+        raise Overloaded(message, reason, max(1, math.ceil(retry_after)))
+
+    def reserve(self, kind, cost):
+        """Admits a request against the backlog budget, or raises Overloaded. Returns a Ticket."""
+        with self._changed:
+            if self.outstanding and self.backlog + cost.seconds > self.backlog_seconds:
+                excess = self.backlog + cost.seconds - self.backlog_seconds
+                self._reject(kind, 'backlog',
+                             f"{self.backlog:.0f}s of work already admitted, {cost.seconds:.0f}s more "
+                             f"exceeds the {self.backlog_seconds:.0f}s budget", excess / self.workers)
+            self.backlog += cost.seconds
+            self.outstanding += 1
+        return Ticket(self, kind, cost)
+
+    def _fits(self, cost):
+        return self.running == 0 or self.memory_in_use + cost.memory_bytes <= self.memory_bytes
+
+    def _start(self, ticket):
+        with self._changed:
+            if not self._fits(ticket.cost):
+                if self.waiting >= self.max_waiting:
+                    self._release_locked(ticket)
+                    self._reject(ticket.kind, 'queue', f"{self.waiting} requests already waiting for memory",
+                                 self.backlog / self.workers)
+                self.waiting += 1
+                try:
+                    fits = self._changed.wait_for(lambda: self._fits(ticket.cost), self.max_wait_seconds)
+                finally:
+                    self.waiting -= 1
+                if not fits:
+                    self._release_locked(ticket)
+                    self._reject(ticket.kind, 'timeout',
+                                 f"no memory for {ticket.cost} within {self.max_wait_seconds:.0f}s",
+                                 self.backlog / self.workers)
+            self.memory_in_use += ticket.cost.memory_bytes
+            self.running += 1
+
+    def _release_locked(self, ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        self.backlog = max(self.backlog - ticket.cost.seconds, 0.0)
+        self.outstanding -= 1
+        self._changed.notify_all()
+
+    def _release(self, ticket, elapsed):
+        with self._changed:
+            if ticket.released:
+                return
+            if ticket.started_at is not None:
+                self.memory_in_use -= ticket.cost.memory_bytes
+                self.running -= 1
+            self._release_locked(ticket)
+        if elapsed is not None and ticket.cost.seconds > 0:
+            metrics.admission_cost_ratio.observe(elapsed / ticket.cost.seconds, kind=ticket.kind)
+
+    def guard(self, ticket, fn, on_reject=None):
+        """
+        Returns fn wrapped to start ticket before running and finish it after.
+        If no memory frees up in time the wrapper calls on_reject (if given)
+        and returns a 429 payload instead of calling fn.
+        """
+        def guarded(*args, **kwargs):
+            try:
+                ticket.start()
+            except Overloaded as e:
+                if on_reject is not None:
+                    on_reject()
+                return {'error': str(e), 'retry_after': e.retry_after}, 429
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                ticket.finish()
+        return guarded
+
+    def state(self):
+        with self._changed:
+            return {
+                'backlog_seconds': round(self.backlog, 1),
+                'backlog_budget_seconds': self.backlog_seconds,
+                'memory_mb': round(self.memory_in_use / 2**20, 1),
+                'memory_budget_mb': round(self.memory_bytes / 2**20, 1),
+                'running': self.running,
+                'waiting': self.waiting,
+            }
+
+
+# Shared by every request handled in this process.
+controller = AdmissionController()
+metrics.registry.register(metrics.Gauge(
+    'remixer_admission_backlog_seconds', 'Estimated seconds of admitted, unfinished work.',
+    lambda: controller.backlog))
+metrics.registry.register(metrics.Gauge(
+    'remixer_admission_memory_bytes', 'Estimated memory of running work.', lambda: controller.memory_in_use))
+metrics.registry.register(metrics.Gauge(
+    'remixer_admission_waiting', 'Admitted requests waiting for memory.', lambda: controller.waiting))
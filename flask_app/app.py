@@ -2,15 +2,37 @@
 # Date: 2025-06-22
 # This comment is used to trigger a new deployment via GitHub push.
 
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
 from flask_cors import CORS
+import io
+import math
 import os
 import logging
+import threading
 from audio_separator import separate_audio
-from yt_audio_downloader import download_youtube_audio  # <-- FIXED: removed flask_app. prefix
-from audio_processor import process_remix
+from yt_audio_downloader import download_youtube_audio, DOWNLOAD_FOLDER  # <-- FIXED: removed flask_app. prefix
+from audio_processor import process_remix, process_remix_batch, render_preview, PREVIEW_SECONDS
+from separator_pool import pool as separator_pool, DEFAULT_MODEL, MODELS, UnknownModel, resolve_model
+from jobs import queue as job_queue, QueueFull
+from upload_stream import StreamingRequest, stream_to_file, UPLOAD_MAX_BYTES
+import metrics
+import profiling
+import progress
+import workspace
+import artifact_storage
+import audio_io
+import admission
+import stem_store
+from transcode_cache import transcodes, content_digest, etag_for, TRANSCODE_CACHE_MAX_BYTES
+from output_store import (OutputStore, Collector, OUTPUT_STORE_MAX_BYTES, UPLOAD_STORE_MAX_BYTES,
+                          DOWNLOAD_STORE_MAX_BYTES, SCRATCH_TTL_SECONDS)
 
 app = Flask(__name__)
+# Uploaded files are streamed into the upload folder and hashed while they arrive.
+app.request_class = StreamingRequest
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
 CORS(app)  # Allow requests from your frontend
 
 # Set up logging
@@ -20,140 +42,520 @@ logging.basicConfig(
 )
 logger = logging.getLogger("remixer-backend")
 
+# cProfile/tracemalloc for requests sent with X-Profile (PROFILING_ENABLED=1 only).
+profiling.install(app)
+
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Every distinct tempo/pitch of a batch is held in memory until its variants are encoded.
+BATCH_MAX_VARIANTS = int(os.environ.get('BATCH_MAX_VARIANTS', '8'))
+
+# Uploads, YouTube downloads, stems and remixes expire after STORE_TTL_HOURS
+# unused and are kept under per-directory quotas; stale scratch is cleared too.
+stores = [
+    OutputStore(UPLOAD_FOLDER, max_bytes=UPLOAD_STORE_MAX_BYTES),
+    OutputStore(OUTPUT_FOLDER, max_bytes=OUTPUT_STORE_MAX_BYTES),
+    OutputStore(DOWNLOAD_FOLDER, name='downloads', max_bytes=DOWNLOAD_STORE_MAX_BYTES),
+    OutputStore(workspace.SCRATCH_DIR, name='scratch', ttl_seconds=SCRATCH_TTL_SECONDS),
+    OutputStore(transcodes.root, name='transcodes', max_bytes=TRANSCODE_CACHE_MAX_BYTES),
+]
+store_collector = Collector(stores)
+store_collector.start()
+
+# gunicorn runs SSE_MAX_STREAMS threads on top of GUNICORN_THREADS so idle
+# event streams can park (see gunicorn.conf.py). Separations, remixes,
+# previews and transcodes that run in the request thread take a slot here
+# first, so no more than GUNICORN_THREADS of them run at once, as before.
+INLINE_WORK_SLOTS = int(os.environ.get('GUNICORN_THREADS', '8'))
+inline_work = threading.BoundedSemaphore(INLINE_WORK_SLOTS)
+
+def touch_artifact(path):
+    """Marks the stored entry holding path as in use, deferring its expiry."""
+    for store in stores:
+        store.touch(path)
 
 @app.route('/')
 def index():
     return {'status': 'Backend running!'}
 
-@app.route('/upload', methods=['POST'])
-def upload_audio():
-    logger.info("Received upload request")
-    if 'file' not in request.files:
-        logger.warning("No file part in request")
-        return jsonify({'error': 'No file part'}), 400
-    file = request.files['file']
-    if file.filename == '':
-        logger.warning("No selected file")
-        return jsonify({'error': 'No selected file'}), 400
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(filepath)
-    logger.info(f"Saved uploaded file to {filepath}")
-    # Call the audio separation function
-    output_dir = os.path.join(OUTPUT_FOLDER, os.path.splitext(file.filename)[0])
+def wants_async():
+    """True when the client asked for a job ID instead of waiting for the result."""
+    flag = request.args.get('async') or request.form.get('async')
+    if flag is None and request.is_json:
+        flag = (request.get_json(silent=True) or {}).get('async')
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def overloaded(payload, retry_after):
+    response = jsonify(payload)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def stem_seconds(path):
+    """Duration of a stem in seconds, read from its .npy copy when it has one."""
+    stored = stem_store.load(path)
+    if stored is not None:
+        return stored[0].shape[1] / stored[1]
+    return audio_io.probe(path)['duration']
+
+def audio_seconds(path, decoded_path=None):
+    """Duration of an input or stem for cost estimates, without decoding it; a default if unknown."""
+    try:
+        if decoded_path and os.path.exists(decoded_path):
+            return os.path.getsize(decoded_path) / (4 * 2 * audio_io.CANONICAL_SAMPLE_RATE)
+        return stem_seconds(path)
+    except Exception as e:
+        logger.warning(f"Could not measure {path} for admission, assuming the default duration: {e}")
+        return admission.DEFAULT_AUDIO_SECONDS
+
+def run_or_enqueue(kind, fn, *args, cost=None, on_reject=None):
+    """
+    Runs fn inline, or queues it and returns 202 with the job ID when async was requested.
+    With a cost, the work first passes admission control: 429 and Retry-After if the
+    instance is over budget, otherwise it may wait briefly for memory before running.
+    on_reject is called if the work is turned away (429 or 503) and fn will never run.
+    """
+    ticket = None
+    if cost is not None and admission.ADMISSION_ENABLED:
+        try:
+            ticket = admission.controller.reserve(kind, cost)
+        except admission.Overloaded as e:
+            if on_reject is not None:
+                on_reject()
+            return overloaded({'error': f'Server busy: {e}', 'retry_after': e.retry_after}, e.retry_after)
+        fn = admission.controller.guard(ticket, fn, on_reject=on_reject)
+    if not wants_async():
+        with inline_work:
+            payload, status = fn(*args)
+        if status == 429:
+            return overloaded(payload, payload.get('retry_after', 1))
+        return jsonify(payload), status
+    try:
+        job = job_queue.submit(kind, profiling.wrap(fn, kind), *args)
+    except QueueFull as e:
+        logger.warning(f"Rejected {kind} job: {e}")
+        if ticket is not None:
+            ticket.cancel()
+        if on_reject is not None:
+            on_reject()
+        return jsonify({'error': 'Too many pending jobs, try again later'}), 503
+    return jsonify({
+        'message': 'Job queued',
+        'job_id': job.id,
+        'status_url': f"/jobs/{job.id}",
+        'result_url': f"/jobs/{job.id}/result"
+    }), 202
+
+def requested_model(data):
+    """Returns the separator model asked for by `stems` (2/4/5) or `model` in data."""
+    return resolve_model(stems=data.get('stems'), model=data.get('model'))
+
+def stem_folder_name(base, model_name):
+    """Keeps the stems of different layouts of one track apart."""
+    if model_name == DEFAULT_MODEL:
+        return base
+    return f"{base}_{len(MODELS[model_name]['stems'])}stems"
+
+def publish_stems(stem_path):
+    """Hands the separated stems next to stem_path to the storage backend ahead of their download."""
+    if not stem_path:
+        return
+    stem_dir = os.path.dirname(stem_path)
+    artifact_storage.publish([os.path.join(stem_dir, name) for name in sorted(os.listdir(stem_dir)) if name.endswith('.wav')])
+
+def discard_upload(filepath, decoded_path=None):
+    """Removes an upload, and its early decode, whose separation was turned away."""
+    for path in (filepath, decoded_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def separate_upload(filepath, stem_folder, source_digest=None, decoded_path=None, model_name=DEFAULT_MODEL):
+    output_dir = os.path.join(OUTPUT_FOLDER, stem_folder)
     os.makedirs(output_dir, exist_ok=True)
     try:
-        separate_audio(filepath, output_dir)
+        vocals_path, _ = separate_audio(filepath, output_dir, model_name=model_name,
+                                        source_digest=source_digest, decoded_path=decoded_path)
+        publish_stems(vocals_path)
         logger.info(f"Audio separated for {filepath}")
     except Exception as e:
         logger.error(f"Audio separation failed: {e}")
-        return jsonify({'error': f'Audio separation failed: {str(e)}'}), 500
+        return {'error': f'Audio separation failed: {str(e)}'}, 500
+    finally:
+        if decoded_path and os.path.exists(decoded_path):
+            os.remove(decoded_path)
     # Optionally, list the output files for download
     stems = os.listdir(output_dir)
     stem_urls = [
-        f"/download/{os.path.splitext(file.filename)[0]}/{stem}"
+        f"/download/{stem_folder}/{stem}"
         for stem in stems
     ]
-    return jsonify({
+    return {
         'message': 'File uploaded and split!',
         'stems': stem_urls
-    })
+    }, 200
+
+@app.route('/upload', methods=['POST'])
+def upload_audio():
+    logger.info("Received upload request")
+    if request.mimetype == 'multipart/form-data':
+        if 'file' not in request.files:
+            logger.warning("No file part in request")
+            return jsonify({'error': 'No file part'}), 400
+        file = request.files['file']
+        if file.filename == '':
+            logger.warning("No selected file")
+            return jsonify({'error': 'No selected file'}), 400
+        # Already written to the upload folder while the body was parsed.
+        upload = file.stream
+        filename = secure_filename(file.filename)
+        if not filename:
+            upload.close()
+            logger.warning(f"Rejected upload file name {file.filename!r}")
+            return jsonify({'error': 'Invalid file name'}), 400
+    else:
+        # Raw request body, e.g. curl --data-binary @song.flac '/upload?filename=song.flac'
+        raw_filename = request.args.get('filename') or request.headers.get('X-Filename')
+        if not raw_filename:
+            logger.warning("No filename for raw upload")
+            return jsonify({'error': 'No filename'}), 400
+        filename = secure_filename(raw_filename)
+        if not filename:
+            logger.warning(f"Rejected upload file name {raw_filename!r}")
+            return jsonify({'error': 'Invalid file name'}), 400
+        upload = stream_to_file(request.stream, app.config['UPLOAD_FOLDER'])
+    try:
+        model_name = requested_model(request.form if request.mimetype == 'multipart/form-data' else request.args)
+    except UnknownModel as e:
+        upload.close()
+        return jsonify({'error': str(e)}), 400
+    filepath = upload.commit(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    logger.info(f"Saved uploaded file to {filepath} ({upload.size} bytes, sha256 {upload.hexdigest()})")
+    # Call the audio separation function
+    stem_folder = stem_folder_name(os.path.splitext(filename)[0], model_name)
+    cost = admission.separation_cost(audio_seconds(filepath, upload.decoded_path), len(MODELS[model_name]['stems']))
+    return run_or_enqueue('separate', separate_upload, filepath, stem_folder,
+                          upload.hexdigest(), upload.decoded_path, model_name, cost=cost,
+                          on_reject=lambda: discard_upload(filepath, upload.decoded_path))
 
-@app.route('/download/<stem_folder>/<filename>')
+def send_artifact(folder, filepath):
+    """
+    Serves a stored file through the storage backend (file, X-Accel-Redirect
+    or presigned URL), with a content-hash ETag. ?format=opus|mp3|flac|ogg|wav
+    serves an encoded variant from the transcode cache instead.
+    """
+    full_path = safe_join(folder, filepath)
+    if full_path is None or not os.path.isfile(full_path):
+        logger.error(f"File not found or is not a file: {folder}/{filepath}")
+        return jsonify({'error': 'File not found'}), 404
+    fmt = (request.args.get('format') or '').lower() or None
+    if fmt is not None and fmt not in audio_io.FORMATS:
+        return jsonify({'error': f"Unsupported format {fmt!r}; choose one of {sorted(audio_io.FORMATS)}"}), 400
+    touch_artifact(full_path)
+    base, ext = os.path.splitext(os.path.basename(full_path))
+    if fmt == ext.lstrip('.').lower():
+        fmt = None
+    digest = content_digest(full_path)
+    etag = etag_for(digest, fmt)
+    # Revalidation needs no file access or encoding, whatever the backend.
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    if fmt is None:
+        return artifact_storage.storage.download(full_path, etag=etag)
+    with inline_work:
+        variant = transcodes.get(full_path, digest, fmt)
+    # Recently used variants survive garbage collection longest.
+    touch_artifact(variant)
+    return artifact_storage.storage.download(variant, filename=f"{base}.{fmt}", etag=etag,
+                                             mimetype=audio_io.MIME_TYPES[fmt])
+
+@app.route('/download/<stem_folder>/<path:filename>')
 def download_stem(stem_folder, filename):
-    dir_path = os.path.join(OUTPUT_FOLDER, stem_folder)
-    logger.info(f"Download request for {dir_path}/{filename}")
+    logger.info(f"Download request for {OUTPUT_FOLDER}/{stem_folder}/{filename}")
     try:
-        return send_from_directory(dir_path, filename, as_attachment=True)
+        return send_artifact(OUTPUT_FOLDER, f"{stem_folder}/{filename}")
     except Exception as e:
         logger.error(f"Download failed: {e}")
         return jsonify({'error': f'Could not download file: {str(e)}'}), 500
 
-@app.route('/process', methods=['POST'])
-def process_audio():
-    data = request.json
-    logger.info(f"Received remix process request: {data}")
-    # Expecting: {"vocals_path": ..., "accompaniment_path": ..., "tempo": ..., "pitch": ..., "reverb": ...}
+def resolve_stem_paths(data):
+    """Returns absolute (vocals, accompaniment) paths from a remix request, or None if either is missing."""
     vocals_path = data.get('vocals_path')
     accompaniment_path = data.get('accompaniment_path')
-    tempo = float(data.get('tempo', 1.0))
-    pitch = float(data.get('pitch', 0))
-    reverb = float(data.get('reverb', 0.0))
-    output_dir = OUTPUT_FOLDER
-
     if not vocals_path or not accompaniment_path:
-        return jsonify({'error': 'Missing vocals or accompaniment path'}), 400
-
+        return None
     # Convert relative to absolute paths if needed
-    vocals_abs = vocals_path if os.path.isabs(vocals_path) else os.path.join(output_dir, vocals_path)
-    acc_abs = accompaniment_path if os.path.isabs(accompaniment_path) else os.path.join(output_dir, accompaniment_path)
-    remix_output_dir = os.path.dirname(vocals_abs)
+    vocals_abs = vocals_path if os.path.isabs(vocals_path) else os.path.join(OUTPUT_FOLDER, vocals_path)
+    acc_abs = accompaniment_path if os.path.isabs(accompaniment_path) else os.path.join(OUTPUT_FOLDER, accompaniment_path)
+    touch_artifact(vocals_abs)
+    touch_artifact(acc_abs)
+    return vocals_abs, acc_abs
 
+def remix(vocals_abs, acc_abs, remix_output_dir, tempo, pitch, reverb):
     try:
         remix_path = process_remix(vocals_abs, acc_abs, remix_output_dir, tempo=tempo, pitch=pitch, reverb=reverb)
         if remix_path and os.path.exists(remix_path):
+            artifact_storage.publish([remix_path])
             remix_rel = os.path.relpath(remix_path, OUTPUT_FOLDER).replace('\\', '/')
             logger.info(f"Remix created at {remix_path}")
-            return jsonify({'message': 'Remix created!', 'remix_url': f"/download/{remix_rel}"})
+            return {'message': 'Remix created!', 'remix_url': f"/download/{remix_rel}"}, 200
         else:
             logger.error("Remix failed: output file not found")
-            return jsonify({'error': 'Remix failed'}), 500
+            return {'error': 'Remix failed'}, 500
     except Exception as e:
         logger.error(f"Remix error: {e}")
+        return {'error': str(e)}, 500
+
+@app.route('/process', methods=['POST'])
+def process_audio():
+    data = request.json
+    logger.info(f"Received remix process request: {data}")
+    # Expecting: {"vocals_path": ..., "accompaniment_path": ..., "tempo": ..., "pitch": ..., "reverb": ...}
+    tempo = float(data.get('tempo', 1.0))
+    pitch = float(data.get('pitch', 0))
+    reverb = float(data.get('reverb', 0.0))
+
+    stem_paths = resolve_stem_paths(data)
+    if stem_paths is None:
+        return jsonify({'error': 'Missing vocals or accompaniment path'}), 400
+    vocals_abs, acc_abs = stem_paths
+    remix_output_dir = os.path.dirname(vocals_abs)
+
+    cost = admission.remix_cost(audio_seconds(vocals_abs), [{'tempo': tempo, 'pitch': pitch, 'reverb': reverb}])
+    return run_or_enqueue('remix', remix, vocals_abs, acc_abs, remix_output_dir, tempo, pitch, reverb, cost=cost)
+
+def remix_batch(vocals_abs, acc_abs, remix_output_dir, variants):
+    try:
+        remix_paths = process_remix_batch(vocals_abs, acc_abs, remix_output_dir, variants)
+        artifact_storage.publish(remix_paths)
+    except Exception as e:
+        logger.error(f"Batch remix error: {e}")
+        return {'error': str(e)}, 500
+    remix_rels = [os.path.relpath(path, OUTPUT_FOLDER).replace('\\', '/') for path in remix_paths]
+    remix_urls = [f"/download/{remix_rel}" for remix_rel in remix_rels]
+    logger.info(f"Batch of {len(remix_paths)} remixes created in {remix_output_dir}")
+    return {'message': 'Remixes created!', 'remix_urls': remix_urls}, 200
+
+VARIANT_FIELDS = ('tempo', 'pitch', 'reverb', 'vocals_gain', 'acc_gain')
+
+def variant_error(variant):
+    """Returns what is wrong with one /process_batch variant, or None if it is usable."""
+    if not isinstance(variant, dict):
+        return 'must be an object'
+    for field in VARIANT_FIELDS:
+        if field not in variant:
+            continue
+        try:
+            value = float(variant[field])
+        except (TypeError, ValueError):
+            return f'{field} must be a number'
+        if not math.isfinite(value):
+            return f'{field} must be finite'
+    return None
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    data = request.json
+    logger.info(f"Received batch remix request: {data}")
+    # Expecting: {"vocals_path": ..., "accompaniment_path": ..., "variants": [{"tempo": ..., "pitch": ..., "reverb": ...}, ...]}
+    variants = data.get('variants')
+    if not isinstance(variants, list) or not variants:
+        return jsonify({'error': 'Missing variants'}), 400
+    if len(variants) > BATCH_MAX_VARIANTS:
+        return jsonify({'error': f'At most {BATCH_MAX_VARIANTS} variants per batch'}), 400
+    for i, variant in enumerate(variants):
+        error = variant_error(variant)
+        if error:
+            return jsonify({'error': f'Variant {i}: {error}'}), 400
+    stem_paths = resolve_stem_paths(data)
+    if stem_paths is None:
+        return jsonify({'error': 'Missing vocals or accompaniment path'}), 400
+    vocals_abs, acc_abs = stem_paths
+    cost = admission.remix_cost(audio_seconds(vocals_abs), variants)
+    return run_or_enqueue('remix_batch', remix_batch, vocals_abs, acc_abs, os.path.dirname(vocals_abs), variants,
+                          cost=cost)
+
+@app.route('/preview', methods=['POST'])
+def preview_audio():
+    """Renders a short low-rate excerpt for auditioning settings; /process does the full export."""
+    data = request.json
+    logger.info(f"Received remix preview request: {data}")
+    # Same fields as /process, plus optional "offset" and "duration" in seconds.
+    stem_paths = resolve_stem_paths(data)
+    if stem_paths is None:
+        return jsonify({'error': 'Missing vocals or accompaniment path'}), 400
+    vocals_abs, acc_abs = stem_paths
+    try:
+        tempo = float(data.get('tempo', 1.0))
+        pitch = float(data.get('pitch', 0))
+        reverb = float(data.get('reverb', 0.0))
+        offset = float(data.get('offset', 0.0))
+        duration = float(data.get('duration', PREVIEW_SECONDS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'tempo, pitch, reverb, offset and duration must be numbers'}), 400
+    # Written so that NaN fails the checks too.
+    if not 0 < tempo < math.inf:
+        return jsonify({'error': 'tempo must be a positive number'}), 400
+    if not -math.inf < pitch < math.inf:
+        return jsonify({'error': 'pitch must be a finite number of semitones'}), 400
+    if not 0 <= reverb <= 1:
+        return jsonify({'error': 'reverb must be between 0 and 1'}), 400
+    if not 0 <= offset < math.inf:
+        return jsonify({'error': 'offset must be a non-negative number of seconds'}), 400
+    if not duration > 0:
+        return jsonify({'error': 'duration must be a positive number of seconds'}), 400
+    if not (os.path.isfile(vocals_abs) and os.path.isfile(acc_abs)):
+        return jsonify({'error': 'Stem not found'}), 404
+    try:
+        # offset is in remix time, which runs 1/tempo as long as the stems.
+        remix_seconds = stem_seconds(vocals_abs) / tempo
+    except Exception as e:
+        logger.error(f"Could not read {vocals_abs} for a preview: {e}")
+        return jsonify({'error': f'Could not read stem: {e}'}), 500
+    if offset >= remix_seconds:
+        return jsonify({'error': f'offset is past the end of the remix ({remix_seconds:.1f}s)'}), 400
+    try:
+        with inline_work:
+            preview = render_preview(
+                vocals_abs, acc_abs,
+                tempo=tempo,
+                pitch=pitch,
+                reverb=reverb,
+                offset=offset,
+                duration=duration
+            )
+    except Exception as e:
+        logger.error(f"Preview error: {e}")
         return jsonify({'error': str(e)}), 500
+    return send_file(io.BytesIO(preview), mimetype='audio/ogg', download_name='preview.ogg')
 
-@app.route('/process_url', methods=['POST'])
-def process_url():
-    data = request.get_json()
-    url = data.get('url')
-    logger.info(f"Received process_url request: {url}")
-    if not url:
-        logger.warning("No URL provided in process_url request")
-        return jsonify({'error': 'No URL provided'}), 400
+def download_and_separate(url, model_name=DEFAULT_MODEL):
     try:
-        downloaded_audio_filepath = download_youtube_audio(url, output_path=UPLOAD_FOLDER)
+        # Downloads live in DOWNLOAD_FOLDER, out of reach of /upload file names.
+        downloaded_audio_filepath = download_youtube_audio(url)
         if downloaded_audio_filepath:
             logger.info(f"Audio downloaded: {downloaded_audio_filepath}")
+            touch_artifact(downloaded_audio_filepath)
             original_filename = os.path.basename(downloaded_audio_filepath)
             filename_without_ext = os.path.splitext(original_filename)[0]
-            separation_output_dir = os.path.join(UPLOAD_FOLDER, filename_without_ext)
+            separation_output_dir = os.path.join(UPLOAD_FOLDER, stem_folder_name(filename_without_ext, model_name))
             os.makedirs(separation_output_dir, exist_ok=True)
-            vocals_path, accompaniment_path = separate_audio(downloaded_audio_filepath, separation_output_dir)
+            vocals_path, accompaniment_path = separate_audio(downloaded_audio_filepath, separation_output_dir,
+                                                             model_name=model_name)
             if vocals_path and accompaniment_path:
                 logger.info(f"Audio separated for {downloaded_audio_filepath}")
-                return jsonify({
+                publish_stems(vocals_path)
+                stem_paths = {
+                    os.path.splitext(name)[0]: os.path.relpath(os.path.join(separation_output_dir, name),
+                                                               UPLOAD_FOLDER).replace('\\', '/')
+                    for name in sorted(os.listdir(separation_output_dir)) if name.endswith('.wav')
+                }
+                return {
                     'message': 'Audio downloaded and processed successfully!',
                     'original_filename': original_filename,
+                    'model': model_name,
                     'vocals_path': os.path.relpath(vocals_path, UPLOAD_FOLDER).replace('\\', '/'),
-                    'accompaniment_path': os.path.relpath(accompaniment_path, UPLOAD_FOLDER).replace('\\', '/')
-                })
+                    'accompaniment_path': os.path.relpath(accompaniment_path, UPLOAD_FOLDER).replace('\\', '/'),
+                    'stem_paths': stem_paths
+                }, 200
             else:
                 logger.error(f"Failed to separate audio for {downloaded_audio_filepath}")
-                return jsonify({'error': 'Failed to process audio after download'}), 500
+                return {'error': 'Failed to process audio after download'}, 500
         else:
             logger.error(f"Failed to download audio from URL: {url}")
-            return jsonify({'error': 'Failed to download audio.'}), 500
+            return {'error': 'Failed to download audio.'}, 500
     except Exception as e:
         logger.error(f"Error processing URL {url}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+@app.route('/process_url', methods=['POST'])
+def process_url():
+    data = request.get_json()
+    url = data.get('url')
+    logger.info(f"Received process_url request: {url}")
+    if not url:
+        logger.warning("No URL provided in process_url request")
+        return jsonify({'error': 'No URL provided'}), 400
+    try:
+        model_name = requested_model(data)
+    except UnknownModel as e:
+        return jsonify({'error': str(e)}), 400
+    # The track length is only known after the download.
+    cost = admission.separation_cost(admission.DEFAULT_AUDIO_SECONDS, len(MODELS[model_name]['stems']))
+    return run_or_enqueue('process_url', download_and_separate, url, model_name, cost=cost)
 
 @app.route('/download_separated/<path:filepath>')
 def download_separated_file(filepath):
-    full_path = os.path.join(UPLOAD_FOLDER, filepath)
-    logger.info(f"Attempting to send file from: {full_path}")
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
-        logger.error(f"File not found or is not a file: {full_path}")
-        return jsonify({'error': 'File not found'}), 404
+    logger.info(f"Attempting to send file from: {os.path.join(UPLOAD_FOLDER, filepath)}")
     try:
-        return send_file(full_path, as_attachment=True)
+        return send_artifact(UPLOAD_FOLDER, filepath)
     except Exception as e:
-        logger.error(f"Error sending file {full_path}: {str(e)}")
+        logger.error(f"Error sending file {filepath}: {str(e)}")
         return jsonify({'error': 'Could not send file'}), 500
 
+# Job status and results for requests submitted with async=1
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job', 'job_id': job_id}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job', 'job_id': job_id}), 404
+    if not job.done:
+        return jsonify(job.to_dict()), 202
+    if job.status_code == 429:
+        # Turned away by admission control after it was queued; same answer as a synchronous request.
+        return overloaded(job.result, job.result.get('retry_after', 1))
+    return jsonify(job.result), job.status_code
+
+# Live job progress as Server-Sent Events (status, download, separation and remix stages)
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job', 'job_id': job_id}), 404
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', '-1'))
+    except ValueError:
+        last_version = -1
+    if not progress.acquire_stream():
+        return jsonify({'error': 'Too many open event streams, poll /jobs/<job_id> instead'}), 503
+    response = Response(progress.event_stream(job, last_version), mimetype='text/event-stream')
+    response.call_on_close(progress.release_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Separator model status: whether the model is loaded and warm vs cold usage
+@app.route('/separator')
+def separator_status():
+    return jsonify({
+        'models': separator_pool.stats(),
+        'loaded': separator_pool.loaded(),
+        'memory': separator_pool.memory(),
+        'available': {name: list(info['stems']) for name, info in MODELS.items()},
+    }), 200
+
+# Admission control budgets and current use
+@app.route('/admission')
+def admission_status():
+    return jsonify(admission.controller.state()), 200
+
+# Per-stage latency, cache and memory metrics for Prometheus
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 # Health check endpoint for Cloud Run
 @app.route('/healthz')
 def healthz():
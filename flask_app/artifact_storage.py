@@ -0,0 +1,166 @@
+# artifact_storage.py
+"""
+Where stems and remixes are served from.
+
+Downloads should not tie up an app thread streaming a large WAV, so each
+backend answers a download with a response that hands the transfer to
+something else:
+
+- LocalStorage (STORAGE_BACKEND=local, the default) keeps artifacts on the
+  local disk. With X_ACCEL_PREFIX set, downloads return an empty response
+  carrying `X-Accel-Redirect: <prefix>/<key>` and nginx sends the file from an
+  internal location. Without it, Flask sends the file itself, as before.
+- ObjectStorage (STORAGE_BACKEND=s3) copies artifacts to an S3-compatible
+  bucket (AWS, GCS interoperability, MinIO via S3_ENDPOINT_URL) and
+  redirects downloads to a presigned URL.
+
+Artifacts are addressed by their path relative to the working directory
+(e.g. output/song/song/vocals.wav), which doubles as the object key and the
+X-Accel path. The processing code keeps working on the local files either
+way; the object store only serves downloads.
+"""
+import logging
+import mimetypes
+import os
+import threading
+from urllib.parse import quote
+
+from flask import Response, redirect, send_file
+
+logger = logging.getLogger("remixer-backend.storage")
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+# nginx internal location that maps to the app's working directory, e.g. /protected.
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '').rstrip('/')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
+S3_REGION = os.environ.get('S3_REGION', '')
+PRESIGNED_URL_SECONDS = int(os.environ.get('PRESIGNED_URL_SECONDS', '3600'))
+
+
+def key_for(path):
+    """Returns the storage key of a local artifact path: its path relative to the working directory."""
+    relative = os.path.relpath(os.path.abspath(path), os.getcwd())
+    if relative.startswith(os.pardir):
+        raise ValueError(f"{path} is outside the artifact directories")
+    return relative.replace(os.sep, '/')
+
+
+def content_type(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def content_disposition(filename):
+    """An attachment header value that survives non-ASCII file names."""
+    fallback = filename.encode('ascii', 'replace').decode().replace('"', '')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+class LocalStorage:
+    name = 'local'
+
+    def __init__(self, accel_prefix=X_ACCEL_PREFIX):
+        self.accel_prefix = accel_prefix
+
+    def put(self, path):
+        """Artifacts are already where they are served from."""
+        return None
+
+    def download(self, path, filename=None, etag=None, mimetype=None):
+        """
+        Returns a response that delivers the file at path as an attachment.
+        Range and If-None-Match/If-Range requests are answered with 206/304
+        (by Flask, or by nginx behind X-Accel-Redirect).
+        """
+        filename = filename or os.path.basename(path)
+        mimetype = mimetype or content_type(filename)
+        if not self.accel_prefix:
+            # Relative paths would be resolved against the app's root_path, not the working directory.
+            return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                             download_name=filename, conditional=True, etag=etag or True)
+        response = Response(status=200)
+        response.headers['X-Accel-Redirect'] = quote(f"{self.accel_prefix}/{key_for(path)}")
+        response.headers['Content-Type'] = mimetype
+        response.headers['Content-Disposition'] = content_disposition(filename)
+        if etag:
+            response.set_etag(etag)
+        return response
+
+
+class ObjectStorage:
+    name = 's3'
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, client=None, expires_seconds=PRESIGNED_URL_SECONDS):
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set for the s3 storage backend")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires_seconds = expires_seconds
+        self._client = client
+        self._lock = threading.Lock()
+        # Object key -> (mtime, size) of the local file last uploaded under it.
+        self._uploaded = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                's3', endpoint_url=S3_ENDPOINT_URL or None, region_name=S3_REGION or None)
+        return self._client
+
+    def object_key(self, path):
+        return self.prefix + key_for(path)
+
+    def put(self, path, mimetype=None):
+        """Uploads the file at path unless this version of it is already in the bucket. Returns the object key."""
+        key = self.object_key(path)
+        info = os.stat(path)
+        version = (info.st_mtime, info.st_size)
+        with self._lock:
+            if self._uploaded.get(key) == version:
+                return key
+        self.client.upload_file(path, self.bucket, key, ExtraArgs={'ContentType': mimetype or content_type(path)})
+        with self._lock:
+            self._uploaded[key] = version
+        logger.info(f"Uploaded {path} to s3://{self.bucket}/{key}")
+        return key
+
+    def url(self, key, filename):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key, 'ResponseContentDisposition': content_disposition(filename)},
+            ExpiresIn=self.expires_seconds)
+
+    def download(self, path, filename=None, etag=None, mimetype=None):
+        """
+        Redirects to a presigned URL for path, uploading it first if needed.
+        The object store answers Range and conditional requests itself.
+        """
+        key = self.put(path, mimetype)
+        return redirect(self.url(key, filename or os.path.basename(path)), code=302)
+
+
+def make_storage(backend=STORAGE_BACKEND):
+    if backend == 'local':
+        return LocalStorage()
+    if backend == 's3':
+        return ObjectStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; use 'local' or 's3'")
+
+
+def publish(paths):
+    """
+    Copies finished artifacts to the storage backend ahead of their first
+    download. Failures are logged, not raised: downloads retry the upload.
+    """
+    for path in paths:
+        try:
+            storage.put(path)
+        except Exception as e:
+            logger.warning(f"Could not publish {path} to {storage.name} storage: {e}")
+
+
+storage = make_storage()
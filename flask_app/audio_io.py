@@ -0,0 +1,279 @@
+# audio_io.py
+"""
+Audio decoding and encoding through ffmpeg pipes.
+
+Every input format is decoded by ffmpeg straight into float32 samples,
+resampled once to the requested (by default canonical) rate, and streamed
+into a preallocated (channels, samples) NumPy array. Encoding goes the other
+way: float32 samples are piped into ffmpeg, which writes the target format.
+This replaces the separate librosa/pydub/soundfile code paths so every stage
+sees the same dtype, layout and sample rate.
+"""
+import json
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+import metrics
+
+FFMPEG = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+CANONICAL_SAMPLE_RATE = 44100
+
+_READ_BLOCK_FRAMES = 1 << 16
+
+# Output format name -> (ffmpeg muxer, codec arguments).
+FORMATS = {
+    'wav': ('wav', ['-c:a', 'pcm_s16le']),
+    'flac': ('flac', ['-c:a', 'flac']),
+    'mp3': ('mp3', ['-c:a', 'libmp3lame', '-b:a', '192k']),
+    'ogg': ('ogg', ['-c:a', 'libvorbis', '-q:a', '4']),
+    'opus': ('ogg', ['-c:a', 'libopus', '-b:a', '96k']),
+}
+
+MIME_TYPES = {
+    'wav': 'audio/wav',
+    'flac': 'audio/flac',
+    'mp3': 'audio/mpeg',
+    'ogg': 'audio/ogg',
+    'opus': 'audio/ogg',
+}
+
+
+class AudioIOError(Exception):
+    """Raised when ffmpeg or ffprobe fails."""
+
+
+def probe(path):
+    """Returns {'duration', 'sample_rate', 'channels'} for the first audio stream of path."""
+    result = subprocess.run(
+        [FFPROBE, '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'stream=sample_rate,channels:format=duration', '-of', 'json', path],
+        capture_output=True)
+    if result.returncode != 0:
+        raise AudioIOError(f"ffprobe failed for {path}: {result.stderr.decode(errors='replace').strip()}")
+    info = json.loads(result.stdout)
+    if not info.get('streams'):
+        raise AudioIOError(f"No audio stream in {path}")
+    stream = info['streams'][0]
+    return {
+        'duration': float(info.get('format', {}).get('duration', 0.0)),
+        'sample_rate': int(stream['sample_rate']),
+        'channels': int(stream['channels']),
+    }
+
+
+def _drain(pipe):
+    """
+    Reads pipe to the end on a background thread so a chatty ffmpeg cannot
+    block on a full stderr buffer. Returns a function that waits and returns
+    the collected text.
+    """
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.append(pipe.read()), daemon=True)
+    reader.start()
+
+    def collect():
+        reader.join()
+        return b''.join(chunks).decode(errors='replace').strip()
+    return collect
+
+
+def _decode_command(path, sr, channels, offset, duration):
+    cmd = [FFMPEG, '-v', 'error', '-nostdin']
+    if offset:
+        cmd += ['-ss', f"{offset:.6f}"]
+    if duration is not None:
+        cmd += ['-t', f"{duration:.6f}"]
+    return cmd + ['-i', path, '-f', 'f32le', '-acodec', 'pcm_f32le',
+                  '-ac', str(channels), '-ar', str(sr), 'pipe:1']
+
+
+def iter_blocks(path, sr=CANONICAL_SAMPLE_RATE, channels=None, offset=0.0, duration=None, info=None):
+    """
+    Streams path through ffmpeg, yielding float32 (channels, frames) blocks.
+    sr=None keeps the native sample rate; channels=None keeps the native layout.
+    """
+    if sr is None or channels is None:
+        info = info or probe(path)
+        sr = sr or info['sample_rate']
+        channels = channels or info['channels']
+    process = subprocess.Popen(
+        _decode_command(path, sr, channels, offset, duration),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = _drain(process.stderr)
+    frame_bytes = 4 * channels
+    pending = b''
+    try:
+        while True:
+            chunk = process.stdout.read(_READ_BLOCK_FRAMES * frame_bytes)
+            if not chunk:
+                break
+            chunk = pending + chunk
+            usable = len(chunk) - len(chunk) % frame_bytes
+            pending = chunk[usable:]
+            if usable:
+                yield np.frombuffer(chunk[:usable], dtype=np.float32).reshape(-1, channels).T
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise AudioIOError(f"ffmpeg failed to decode {path}: {errors()}")
+
+
+def load(path, sr=CANONICAL_SAMPLE_RATE, channels=None, offset=0.0, duration=None):
+    """
+    Decodes path (any format ffmpeg reads) into a float32 (channels, samples)
+    array at sample rate sr (None keeps the native rate).
+    The output is allocated once from the probed duration, so peak memory is
+    the decoded size plus one read block.
+    Returns (audio, sample_rate).
+    """
+    with metrics.stage('decode'):
+        return _load(path, sr, channels, offset, duration)
+
+
+def _load(path, sr, channels, offset, duration):
+    info = probe(path)
+    sr = sr or info['sample_rate']
+    channels = channels or info['channels']
+    available = max(info['duration'] - offset, 0.0)
+    seconds = available if duration is None else min(duration, available)
+    # A little headroom absorbs rounding in the probed duration and resampler.
+    out = np.empty((channels, int(round(seconds * sr)) + sr // 10), dtype=np.float32)
+    filled = 0
+    for block in iter_blocks(path, sr, channels, offset, duration):
+        n = block.shape[1]
+        if filled + n > out.shape[1]:
+            out = np.concatenate([out, np.empty((channels, filled + n - out.shape[1]), dtype=np.float32)], axis=1)
+        out[:, filled:filled + n] = block
+        filled += n
+    return out[:, :filled], sr
+
+
+class PipeDecoder:
+    """
+    Decodes audio while it is still arriving. feed() passes encoded bytes to
+    ffmpeg, which writes interleaved float32 frames to out_path as it goes;
+    finish() waits for the decode and reports whether it succeeded.
+    Containers that need random access (e.g. MP4 with the index at the end)
+    cannot be decoded from a pipe, so callers must be ready to fall back to
+    decoding the finished file.
+    """
+
+    def __init__(self, out_path, sr=CANONICAL_SAMPLE_RATE, channels=2):
+        self.out_path = out_path
+        self.sample_rate = sr
+        self.channels = channels
+        self.failed = False
+        self._process = subprocess.Popen(
+            [FFMPEG, '-v', 'error', '-y', '-i', 'pipe:0', '-f', 'f32le', '-acodec', 'pcm_f32le',
+             '-ac', str(channels), '-ar', str(sr), out_path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self._errors = _drain(self._process.stderr)
+
+    def feed(self, data):
+        if self.failed:
+            return
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg gave up on this input; the upload itself carries on.
+            self.failed = True
+
+    def finish(self):
+        """Returns True if out_path holds the complete decoded audio."""
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            self.failed = True
+        if self._process.wait() != 0:
+            self.failed = True
+        if self.failed and os.path.exists(self.out_path):
+            os.remove(self.out_path)
+        return not self.failed
+
+    def abort(self):
+        self.failed = True
+        self._process.kill()
+        self.finish()
+
+
+def load_raw(path, channels=2):
+    """Memory-maps a PipeDecoder output file as a read-only (samples, channels) float32 array."""
+    return np.memmap(path, dtype=np.float32, mode='r').reshape(-1, channels)
+
+
+def _encode_command(target, sr, channels, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    muxer, codec_args = FORMATS[fmt]
+    return [FFMPEG, '-v', 'error', '-nostdin', '-y',
+            '-f', 'f32le', '-ar', str(sr), '-ac', str(channels), '-i', 'pipe:0',
+            *codec_args, '-f', muxer, target]
+
+
+class StreamWriter:
+    """
+    Encodes audio to a file incrementally. write() takes float32
+    (channels, frames) blocks; close() finishes the file.
+    """
+
+    def __init__(self, path, sr, channels, fmt=None):
+        fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower() or 'wav'
+        self.channels = channels
+        self._process = subprocess.Popen(
+            _encode_command(path, sr, channels, fmt),
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._errors = _drain(self._process.stderr)
+        self._path = path
+
+    def write(self, block):
+        # ffmpeg expects interleaved frames.
+        self._process.stdin.write(np.ascontiguousarray(block.T, dtype=np.float32).tobytes())
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise AudioIOError(f"ffmpeg failed to encode {self._path}: {self._errors()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save(path, y, sr, fmt=None):
+    """Encodes a float32 (channels, samples) array to path; the format follows the extension (WAV is 16-bit PCM)."""
+    with metrics.stage('encode'), StreamWriter(path, sr, y.shape[0], fmt) as writer:
+        for start in range(0, y.shape[1], _READ_BLOCK_FRAMES):
+            writer.write(y[:, start:start + _READ_BLOCK_FRAMES])
+
+
+def transcode(src, dest, fmt=None):
+    """Re-encodes the audio file src as dest in one ffmpeg pass; the format follows dest's extension."""
+    fmt = fmt or os.path.splitext(dest)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    muxer, codec_args = FORMATS[fmt]
+    with metrics.stage('encode'):
+        result = subprocess.run(
+            [FFMPEG, '-v', 'error', '-nostdin', '-y', '-i', src, '-vn', *codec_args, '-f', muxer, dest],
+            capture_output=True)
+    if result.returncode != 0:
+        raise AudioIOError(f"ffmpeg failed to transcode {src} to {fmt}: {result.stderr.decode(errors='replace').strip()}")
+
+
+def encode(y, sr, fmt='ogg'):
+    """Encodes a float32 (channels, samples) array in memory. Returns the encoded bytes."""
+    with metrics.stage('encode'):
+        process = subprocess.Popen(
+            _encode_command('pipe:1', sr, y.shape[0], fmt),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errors = process.communicate(np.ascontiguousarray(y.T, dtype=np.float32).tobytes())
+    if process.returncode != 0:
+        raise AudioIOError(f"ffmpeg failed to encode {fmt}: {errors.decode(errors='replace').strip()}")
+    return output
@@ -1,106 +1,14 @@
-import yt_dlp
 import os
-from spleeter.separator import Separator
-from spleeter.utils.logging import logger
-import librosa
-import soundfile as sf
-from pydub import AudioSegment, effects
-import numpy as np
+from audio_separator import separate_audio
+from yt_audio_downloader import download_youtube_audio
+import progress
+import remix_engine
+import workspace
 
-def download_youtube_audio(url, output_path='.'):
-    """
-    Downloads the audio from a YouTube video as an MP3 file.
-
-    Args:
-        url (str): The URL of the YouTube video.
-        output_path (str): The directory where the audio file will be saved.
-                            Defaults to the current directory.
-
-    Returns:
-        str: The filename of the downloaded audio, or None if it fails.
-    """
-    try:
-        # Configuration for yt-dlp to get the best audio and convert to mp3.
-        # The 'outtmpl' setting determines the output filename.
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            # This template creates a filename like "Video Title.mp3"
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-            'noplaylist': True,  # Ensures only the single video is downloaded
-        }
-
-        print(f"Starting download for: {url}")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=True)
-            # After download, the final filename is created by yt-dlp
-            # We can construct it from the info dictionary
-            filename = ydl.prepare_filename(info_dict)
-            # The extension is changed by the postprocessor, so we adjust it
-            base, _ = os.path.splitext(filename)
-            final_filename = base + '.mp3'
-
-        print(f"\nSuccessfully downloaded audio.")
-        print(f"File saved as: {final_filename}")
-        return final_filename
-
-    except yt_dlp.utils.DownloadError as e:
-        print(f"Error: Invalid YouTube URL or download failed. Details: {e}")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return None
-
-
-def separate_audio(audio_file_path, output_dir='output'):
-    """
-    Separates an audio file into vocal and accompaniment tracks using Spleeter.
-
-    Args:
-        audio_file_path (str): The path to the input audio file (e.g., "MySong.mp3").
-        output_dir (str): The directory to save the separated files.
-    """
-    # Check if the audio file exists before processing
-    if not os.path.exists(audio_file_path):
-        print(f"Error: Cannot find the file '{audio_file_path}'.")
-        # Return None or raise an exception to indicate failure
-        return None, None
-
-    try:
-        # Spleeter can be very verbose; this reduces the log noise.
-        logger.setLevel('ERROR')
-
-        # Initialize the separator. It will download models on the first run.
-        # 'spleeter:2stems' separates audio into 'vocals' and 'accompaniment'.
-        separator = Separator('spleeter:2stems')
-
-        print(f"Processing '{audio_file_path}'... This may take a moment.")
-
-        # The separation process creates a new folder within the output_dir.
-        # The folder will be named after the input file (without extension).
-        separator.separate_to_file(audio_file_path, output_dir)
-
-        # Determine the name of the folder where results are saved
-        output_folder_name = os.path.splitext(os.path.basename(audio_file_path))[0]
-        full_output_path = os.path.join(output_dir, output_folder_name)
-
-        print("\n-------------------------------------------")
-        print("Separation Complete!")
-        print(f"Files saved in: '{full_output_path}'")
-        vocals_path = os.path.join(full_output_path, "vocals.wav")
-        accompaniment_path = os.path.join(full_output_path, "accompaniment.wav")
-        print(f"  - Vocals:     {vocals_path}")
-        print(f"  - Instrumental: {accompaniment_path}")
-        print("-------------------------------------------")
-        return vocals_path, accompaniment_path
-
-    except Exception as e:
-        print(f"An error occurred during the separation process: {e}")
-        return None, None
+PREVIEW_SECONDS = 15
+PREVIEW_MAX_SECONDS = 30
+PREVIEW_SAMPLE_RATE = 22050
+PREVIEW_PREROLL_SECONDS = 1.0
 
 
 def change_tempo(input_path, output_path, tempo_factor):
@@ -111,9 +19,8 @@ def change_tempo(input_path, output_path, tempo_factor):
         output_path (str): Path to save the tempo-changed audio.
         tempo_factor (float): >1.0 speeds up, <1.0 slows down.
     """
-    y, sr = librosa.load(input_path, sr=None)
-    y_stretch = librosa.effects.time_stretch(y, tempo_factor)
-    sf.write(output_path, y_stretch, sr)
+    y, sr = remix_engine.load_stem(input_path)
+    remix_engine.save(output_path, remix_engine.time_stretch(y, tempo_factor), sr)
 
 def change_pitch(input_path, output_path, n_steps):
     """
@@ -123,9 +30,8 @@ def change_pitch(input_path, output_path, n_steps):
         output_path (str): Path to save the pitch-shifted audio.
         n_steps (float): Number of semitones to shift (positive or negative).
     """
-    y, sr = librosa.load(input_path, sr=None)
-    y_shift = librosa.effects.pitch_shift(y, sr, n_steps)
-    sf.write(output_path, y_shift, sr)
+    y, sr = remix_engine.load_stem(input_path)
+    remix_engine.save(output_path, remix_engine.pitch_shift(y, sr, n_steps), sr)
 
 def add_reverb(input_path, output_path, reverb_amount=0.5):
     """
@@ -135,14 +41,8 @@ def add_reverb(input_path, output_path, reverb_amount=0.5):
         output_path (str): Path to save the audio with reverb.
         reverb_amount (float): 0.0 (none) to 1.0 (max)
     """
-    audio = AudioSegment.from_file(input_path)
-    # Simple reverb: overlay a delayed, quieter version of the audio
-    delay_ms = 80
-    decay = reverb_amount
-    reverb = audio - (10 * (1 - decay))
-    reverb = reverb.fade(to_gain=-120, start=0, duration=delay_ms)
-    combined = audio.overlay(reverb, position=delay_ms)
-    combined.export(output_path, format="wav")
+    y, sr = remix_engine.load_stem(input_path)
+    remix_engine.save(output_path, remix_engine.reverb(y, sr, reverb_amount), sr)
 
 def mix_stems(vocals_path, accompaniment_path, output_path, vocals_gain=0, acc_gain=0):
     """
@@ -154,48 +54,91 @@ def mix_stems(vocals_path, accompaniment_path, output_path, vocals_gain=0, acc_g
         vocals_gain (float): dB gain for vocals.
         acc_gain (float): dB gain for accompaniment.
     """
-    vocals = AudioSegment.from_file(vocals_path)
-    acc = AudioSegment.from_file(accompaniment_path)
-    vocals = vocals + vocals_gain
-    acc = acc + acc_gain
-    remix = acc.overlay(vocals)
-    remix.export(output_path, format="wav")
-
-def process_remix(vocals_path, accompaniment_path, output_dir, tempo=1.0, pitch=0, reverb=0.0):
+    vocals, sr = remix_engine.load_stem(vocals_path)
+    acc, _ = remix_engine.load_stem(accompaniment_path, sr=sr)
+    remix = remix_engine.mix(
+        remix_engine.apply_gain(vocals, vocals_gain),
+        remix_engine.apply_gain(acc, acc_gain)
+    )
+    remix_engine.save(output_path, remix, sr)
+
+def process_remix(vocals_path, accompaniment_path, output_dir, tempo=1.0, pitch=0, reverb=0.0,
+                  vocals_gain=0, acc_gain=0, parallelism=None):
     """
     Applies tempo, pitch, and reverb to stems and mixes them.
+    Each stem is decoded once and processed in memory; only the remix is written.
+    It is encoded in a private scratch directory and then moved into
+    output_dir under a unique name, so concurrent remixes of one song never
+    overwrite each other.
+    parallelism caps how many stem channels are processed at once
+    (defaults to REMIX_PARALLELISM; 1 runs serially).
     Returns the path to the remixed file.
     """
-    # Temp files for processing
-    vocals_tmp = os.path.join(output_dir, "vocals_tmp.wav")
-    acc_tmp = os.path.join(output_dir, "acc_tmp.wav")
-    vocals_proc = vocals_path
-    acc_proc = accompaniment_path
-    # Tempo
-    if tempo != 1.0:
-        change_tempo(vocals_proc, vocals_tmp, tempo)
-        change_tempo(acc_proc, acc_tmp, tempo)
-        vocals_proc = vocals_tmp
-        acc_proc = acc_tmp
-    # Pitch
-    if pitch != 0:
-        change_pitch(vocals_proc, vocals_tmp, pitch)
-        change_pitch(acc_proc, acc_tmp, pitch)
-        vocals_proc = vocals_tmp
-        acc_proc = acc_tmp
-    # Reverb (only on vocals for demo)
-    if reverb > 0.0:
-        add_reverb(vocals_proc, vocals_tmp, reverb)
-        vocals_proc = vocals_tmp
-    # Mix
-    remix_path = os.path.join(output_dir, "remix.wav")
-    mix_stems(vocals_proc, acc_proc, remix_path)
-    # Clean up temp files if needed
-    for f in [vocals_tmp, acc_tmp]:
-        if os.path.exists(f):
-            os.remove(f)
+    progress.report('remix', 0.0, step='decode')
+    vocals, sr = remix_engine.load_stem(vocals_path)
+    # Decode the accompaniment at the vocals' rate so the stems line up.
+    acc, _ = remix_engine.load_stem(accompaniment_path, sr=sr)
+    progress.report('remix', 0.1, step='render')
+    remix = remix_engine.render(
+        vocals, acc, sr,
+        tempo=tempo, pitch=pitch, reverb_amount=reverb,
+        vocals_gain=vocals_gain, acc_gain=acc_gain, parallelism=parallelism
+    )
+    progress.report('remix', 0.9, step='encode')
+    with workspace.scratch() as scratch_dir:
+        scratch_path = os.path.join(scratch_dir, "remix.wav")
+        remix_engine.save(scratch_path, remix, sr)
+        remix_path = workspace.publish(scratch_path, os.path.join(output_dir, workspace.unique_name("remix", ".wav")))
+    progress.report('remix', 1.0, step='done')
     return remix_path
 
+def process_remix_batch(vocals_path, accompaniment_path, output_dir, variants, parallelism=None):
+    """
+    Renders several remixes of one stem pair. variants is a list of dicts
+    with optional tempo, pitch, reverb, vocals_gain and acc_gain keys.
+    The stems are decoded once and each channel is analyzed once for all
+    variants (see remix_engine.render_batch). Each remix is encoded as soon
+    as it is rendered, so finished variants do not pile up in memory.
+    Returns the paths of the remixed files, in the order of variants.
+    """
+    progress.report('remix', 0.0, step='decode')
+    vocals, sr = remix_engine.load_stem(vocals_path)
+    acc, _ = remix_engine.load_stem(accompaniment_path, sr=sr)
+    progress.report('remix', 0.1, step='render')
+    remixes = remix_engine.render_batch(vocals, acc, sr, variants, parallelism=parallelism)
+    remix_paths = []
+    batch_name = workspace.unique_name("remix", "")
+    with workspace.scratch() as scratch_dir:
+        for i, remix in enumerate(remixes):
+            progress.report('remix', 0.1 + 0.9 * i / len(variants), step='encode', variant=i)
+            scratch_path = os.path.join(scratch_dir, f"remix_{i}.wav")
+            remix_engine.save(scratch_path, remix, sr)
+            del remix
+            remix_paths.append(workspace.publish(scratch_path, os.path.join(output_dir, f"{batch_name}_{i}.wav")))
+    progress.report('remix', 1.0, step='done')
+    return remix_paths
+
+def render_preview(vocals_path, accompaniment_path, tempo=1.0, pitch=0, reverb=0.0,
+                   offset=0.0, duration=PREVIEW_SECONDS, sample_rate=PREVIEW_SAMPLE_RATE, fmt='ogg'):
+    """
+    Renders a short, low-sample-rate excerpt of a remix for auditioning
+    slider settings.
+    offset and duration are in seconds of the remix (after the tempo change).
+    Only the matching part of each stem is decoded, plus a little pre-roll so
+    the reverb tail entering the excerpt is audible. Excerpts bypass the
+    transformed-stem cache, which only full remixes can reuse.
+    Returns the encoded excerpt as bytes (Ogg Vorbis by default).
+    """
+    duration = min(duration, PREVIEW_MAX_SECONDS)
+    source_start = max(offset * tempo - PREVIEW_PREROLL_SECONDS, 0.0)
+    source_duration = (offset + duration) * tempo - source_start
+    vocals, sr = remix_engine.load_stem(vocals_path, sr=sample_rate, offset=source_start, duration=source_duration)
+    acc, _ = remix_engine.load_stem(accompaniment_path, sr=sr, offset=source_start, duration=source_duration)
+    remix = remix_engine.render(vocals, acc, sr, tempo=tempo, pitch=pitch, reverb_amount=reverb, cache=None)
+    # Drop the pre-roll, which lasts (offset * tempo - source_start) / tempo in the remix.
+    skip = int(round((offset - source_start / tempo) * sr))
+    return remix_engine.encode(remix[:, skip:skip + int(duration * sr)], sr, fmt)
+
 
 if __name__ == '__main__':
     # --- USAGE ---
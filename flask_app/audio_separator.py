@@ -1,48 +1,139 @@
+import logging
 import os
-from spleeter.separator import Separator
-from spleeter.utils.logging import logger
+import numpy as np
+import audio_io
+import metrics
+import progress
+from separator_pool import DEFAULT_MODEL, stem_names
+from batch_scheduler import scheduler
+from separation_cache import cache, cache_key
+import stem_store
+from chunked_separation import separate_to_file_chunked, probe_duration, CHUNK_THRESHOLD_SECONDS
 
-def separate_audio(audio_file_path, output_dir='output'):
+logger = logging.getLogger("remixer-backend.separation")
+
+def separate_audio(audio_file_path, output_dir='output', model_name=DEFAULT_MODEL, source_digest=None, decoded_path=None):
     """
     Separates an audio file into vocal and accompaniment tracks.
 
     Args:
         audio_file_path (str): The path to the input audio file (e.g., "MySong.mp3").
         output_dir (str): The directory to save the separated files.
+        model_name (str): The Spleeter model to use (see separator_pool.MODELS).
+        source_digest (str): SHA-256 hex digest of the file, if already known (e.g. hashed during upload).
+        decoded_path (str): Stereo float32 frames of the file at 44.1 kHz, if it was decoded during upload.
+
+    Returns:
+        tuple: Paths to the vocals and accompaniment files, or (None, None) if it fails.
+        Models with more stems also write drums.wav, bass.wav, etc. next to them;
+        their accompaniment.wav is the sum of every stem except the vocals.
     """
     # Check if the audio file exists before processing
     if not os.path.exists(audio_file_path):
-        print(f"Error: Cannot find the file '{audio_file_path}'.")
-        print("Please make sure the file name is correct and it's in the same directory.")
-        return
+        logger.error(f"Cannot find the file '{audio_file_path}'")
+        return None, None
 
     try:
-        # Spleeter can be very verbose; this reduces the log noise.
-        logger.setLevel('ERROR')
-
-        # Initialize the separator. It will download models on the first run.
-        # 'spleeter:2stems' separates audio into 'vocals' and 'accompaniment'.
-        separator = Separator('spleeter:2stems')
-
-        print(f"Processing '{audio_file_path}'... This may take a moment.")
-        
-        # The separation process creates a new folder within the output_dir.
+        # Determine the name of the folder where results are saved.
         # The folder will be named after the input file (without extension).
-        separator.separate_to_file(audio_file_path, output_dir)
-        
-        # Determine the name of the folder where results are saved
         output_folder_name = os.path.splitext(os.path.basename(audio_file_path))[0]
         full_output_path = os.path.join(output_dir, output_folder_name)
+        vocals_path = os.path.join(full_output_path, "vocals.wav")
+        accompaniment_path = os.path.join(full_output_path, "accompaniment.wav")
+        stem_paths = [os.path.join(full_output_path, f"{name}.wav") for name in stem_names(model_name)]
+        if accompaniment_path not in stem_paths:
+            stem_paths.append(accompaniment_path)
+
+        # Identical audio separated earlier (under any filename) is served from the cache.
+        if source_digest:
+            key = cache_key(source_digest, model_name)
+        else:
+            key = cache.key_for(audio_file_path, model_name)
+        placed = cache.materialize(key, full_output_path)
+        if placed:
+            logger.info(f"Reusing cached stems for '{audio_file_path}' in '{full_output_path}'")
+            progress.report('separation', 1.0, cached=True)
+            # Entries cached before .npy copies existed only hold the WAVs. Any
+            # sidecars already in the folder belong to whatever was separated
+            # there before (possibly another song of the same name), so they
+            # are rebuilt from the cached WAVs rather than reused.
+            for stem_path in stem_paths:
+                for sidecar in stem_store.sidecar_paths(stem_path):
+                    if os.path.basename(sidecar) not in placed and os.path.exists(sidecar):
+                        os.remove(sidecar)
+                stem_store.write_npy(stem_path)
+            return vocals_path, accompaniment_path
+
+        # Stems left by an earlier cache hit are hard links into the cache;
+        # unlink them so this separation does not overwrite cached audio in place.
+        stem_files = list(stem_paths)
+        stem_files += [sidecar for path in stem_paths for sidecar in stem_store.sidecar_paths(path)]
+        for stale_path in stem_files:
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
 
-        print("\n-------------------------------------------")
-        print("Separation Complete!")
-        print(f"Files saved in: '{full_output_path}'")
-        print(f"  - Vocals:       vocals.wav")
-        print(f"  - Instrumental: accompaniment.wav")
-        print("-------------------------------------------")
+        logger.info(f"Separating '{audio_file_path}'")
+        progress.report('separation', 0.0)
+        # Audio decoded during the upload is memory-mapped instead of decoded again.
+        decoded = None
+        if decoded_path and os.path.exists(decoded_path) and os.path.getsize(decoded_path):
+            decoded = audio_io.load_raw(decoded_path)
+            duration = len(decoded) / audio_io.CANONICAL_SAMPLE_RATE
+        else:
+            duration = probe_duration(audio_file_path)
+        metrics.input_audio_seconds.observe(duration)
+        # Long tracks are separated in overlapping windows to bound memory use.
+        chunked = duration > CHUNK_THRESHOLD_SECONDS
+
+        # Separators are loaded once per process and shared by every request;
+        # the scheduler batches this request's audio with concurrent ones.
+        # 'spleeter:2stems' separates audio into 'vocals' and 'accompaniment';
+        # the 4/5-stem models split the accompaniment further.
+        separator = scheduler.model(model_name)
+        if chunked:
+            separate_to_file_chunked(separator, audio_file_path, output_dir, decoded=decoded)
+        else:
+            if decoded is None:
+                waveform, _ = audio_io.load(audio_file_path, sr=audio_io.CANONICAL_SAMPLE_RATE, channels=2)
+                decoded = waveform.T
+            os.makedirs(full_output_path, exist_ok=True)
+            prediction = separator.separate(decoded)
+            for stem_name, stem in prediction.items():
+                stem_path = os.path.join(full_output_path, f"{stem_name}.wav")
+                audio_io.save(stem_path, stem.T, audio_io.CANONICAL_SAMPLE_RATE)
+                # Raw float32 copies let remixes memory-map the stems instead of decoding them;
+                # they are written from the prediction, not decoded back from the WAV.
+                stem_store.write_array(stem_path, stem.T, audio_io.CANONICAL_SAMPLE_RATE)
+        if not os.path.exists(accompaniment_path):
+            others = [path for path in stem_paths if path not in (vocals_path, accompaniment_path)]
+            write_accompaniment(others, accompaniment_path)
+        cache.store(key, stem_files)
+        progress.report('separation', 1.0)
+
+        logger.info(f"Separation complete, stems saved in '{full_output_path}'")
+        return vocals_path, accompaniment_path
 
     except Exception as e:
-        print(f"An error occurred during the separation process: {e}")
+        logger.error(f"An error occurred during the separation process: {e}")
+        return None, None
+
+def write_accompaniment(stem_paths, accompaniment_path, block_frames=1 << 18):
+    """
+    Writes the sum of stem_paths (which must have .npy copies) as
+    accompaniment_path, with its own .npy copy, block by block, so
+    multi-stem separations can be remixed like 2-stem ones.
+    """
+    stored = [stem_store.load(path) for path in stem_paths]
+    arrays = [array for array, _ in stored]
+    sample_rate = stored[0][1]
+    channels = arrays[0].shape[0]
+    length = min(array.shape[1] for array in arrays)
+    with audio_io.StreamWriter(accompaniment_path, sample_rate, channels, fmt='wav') as writer, \
+            stem_store.NpyWriter(accompaniment_path, sample_rate, channels, length) as copy:
+        for start in range(0, length, block_frames):
+            block = np.clip(sum(np.asarray(array[:, start:start + block_frames]) for array in arrays), -1.0, 1.0)
+            writer.write(block)
+            copy.write(block)
 
 if __name__ == '__main__':
     # --- USAGE ---
@@ -0,0 +1,211 @@
+# batch_scheduler.py
+"""
+Batched inference across concurrent separation requests.
+
+Spleeter cuts the spectrogram of its input into fixed-length segments
+(512 STFT frames of 1024 samples) and runs them through the network as one
+batch. Separating several waveforms therefore costs one forward pass if
+they are laid end to end in a single input, instead of one small pass each
+competing for the same cores.
+
+separate(model_name, waveform) queues the waveform. The first caller for a
+model waits SEPARATION_BATCH_WINDOW_MS for others to join (or until
+SEPARATION_BATCH_MAX are queued), takes the model from the separator pool,
+and runs what was queued by then as one input. A batch is also limited to
+SEPARATION_BATCH_MAX_SECONDS of packed audio, which bounds the memory of
+the forward pass; queued requests that do not fit wait for the next batch.
+A waveform that leaves no room for another runs at once, without waiting,
+and a single longer one still runs, alone. Each waveform starts on a
+segment boundary and is preceded by at least one STFT frame of silence, so
+it sees the same segmentation and padding as when separated alone. The
+stems are cut back out and returned to each caller.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+import metrics
+from chunked_separation import CHUNK_THRESHOLD_SECONDS
+from separator_pool import pool
+
+logger = logging.getLogger("remixer-backend.batching")
+
+# How long the first request waits for others before the batch runs.
+BATCH_WINDOW_SECONDS = float(os.environ.get('SEPARATION_BATCH_WINDOW_MS', '50')) / 1000
+# Waveforms per forward pass; 1 disables batching.
+BATCH_MAX_SIZE = int(os.environ.get('SEPARATION_BATCH_MAX', '4'))
+# Spleeter's segment length (T=512 frames x 1024 hop); waveforms start on multiples of it.
+BATCH_ALIGN_SAMPLES = int(os.environ.get('SEPARATION_BATCH_ALIGN_SAMPLES', str(512 * 1024)))
+# Silence kept between waveforms: one STFT frame, as Spleeter prepends to its input.
+BATCH_GUARD_SAMPLES = 4096
+# Packed input length per forward pass, at 44.1 kHz. Tracks up to the chunking
+# threshold are already separated in one pass, so by default a batch needs no
+# more memory than the longest unchunked track, and songs batch with each other.
+BATCH_MAX_SAMPLES = int(float(os.environ.get('SEPARATION_BATCH_MAX_SECONDS', str(CHUNK_THRESHOLD_SECONDS))) * 44100)
+
+
+def padded_length(samples, align=BATCH_ALIGN_SAMPLES, guard=BATCH_GUARD_SAMPLES):
+    """Samples a waveform of the given length takes up in a packed input, guard and alignment included."""
+    end = samples + guard
+    if align > 1:
+        end = -(-end // align) * align
+    return end
+
+
+def pack(waveforms, align=BATCH_ALIGN_SAMPLES, guard=BATCH_GUARD_SAMPLES):
+    """
+    Lays (samples, channels) waveforms end to end in one zero-padded array.
+    Each starts at a multiple of align and is followed by at least guard
+    samples of silence. Returns (packed, offsets).
+    """
+    offsets = []
+    end = 0
+    for waveform in waveforms:
+        offsets.append(end)
+        end += padded_length(len(waveform), align, guard)
+    packed = np.zeros((end, waveforms[0].shape[1]), dtype=np.float32)
+    for offset, waveform in zip(offsets, waveforms):
+        packed[offset:offset + len(waveform)] = waveform
+    return packed, offsets
+
+
+def unpack(prediction, waveforms, offsets):
+    """Splits a {stem: array} prediction of a packed input back into one dict per waveform."""
+    return [
+        {name: stem[offset:offset + len(waveform)] for name, stem in prediction.items()}
+        for waveform, offset in zip(waveforms, offsets)
+    ]
+
+
+class _Request:
+    def __init__(self, waveform):
+        self.waveform = waveform
+        self.result = None
+        self.error = None
+        self.finished = False
+        # Set when the request is finished or has been made the next leader.
+        self.wake = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result, self.error, self.finished = result, error, True
+        self.wake.set()
+
+
+class BatchScheduler:
+    """
+    Collects waveforms from concurrent callers and separates them in
+    batches, one model at a time as the separator pool allows.
+    """
+
+    def __init__(self, separator_pool=None, window_seconds=BATCH_WINDOW_SECONDS, max_batch=BATCH_MAX_SIZE,
+                 align=BATCH_ALIGN_SAMPLES, max_samples=BATCH_MAX_SAMPLES):
+        self._pool = separator_pool or pool
+        self.window_seconds = window_seconds
+        self.max_batch = max(1, max_batch)
+        self.align = align
+        self.max_samples = max_samples
+        self._changed = threading.Condition()
+        self._queues = {}
+        # Models whose queue has a request acting as leader.
+        self._leading = set()
+
+    def separate(self, model_name, waveform):
+        """
+        Separates a (samples, channels) waveform with model_name, batched with
+        whatever other callers submit meanwhile. Returns {stem_name: array}.
+        """
+        request = _Request(np.asarray(waveform, dtype=np.float32))
+        with self._changed:
+            queue = self._queues.setdefault(model_name, [])
+            queue.append(request)
+            lead = model_name not in self._leading
+            self._leading.add(model_name)
+            self._changed.notify_all()
+        if not lead:
+            request.wake.wait()
+        if not request.finished:
+            self._lead(model_name)
+        request.wake.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def model(self, model_name):
+        """Returns an object whose separate(waveform) goes through this scheduler."""
+        return _ModelHandle(self, model_name)
+
+    def _batch_size(self, queue):
+        """
+        How many requests from the head of queue make up the next batch: at
+        most max_batch, packed into at most max_samples, and at least one.
+        """
+        count = end = 0
+        for request in queue[:self.max_batch]:
+            end += padded_length(len(request.waveform), self.align)
+            if count and end > self.max_samples:
+                break
+            count += 1
+        return count
+
+    def _full(self, queue):
+        """True when the next batch cannot take another request, so there is no point waiting."""
+        count = self._batch_size(queue)
+        packed = sum(padded_length(len(request.waveform), self.align) for request in queue[:count])
+        # Even the shortest waveform takes up one aligned segment.
+        return count < len(queue) or count >= self.max_batch or packed + padded_length(1, self.align) > self.max_samples
+
+    def _lead(self, model_name):
+        with self._changed:
+            self._changed.wait_for(lambda: self._full(self._queues[model_name]), self.window_seconds)
+        batch = []
+        try:
+            # Requests that arrive while an earlier batch holds the model join this one.
+            with self._pool.acquire(model_name) as separator:
+                with self._changed:
+                    queue = self._queues[model_name]
+                    count = self._batch_size(queue)
+                    batch, self._queues[model_name] = queue[:count], queue[count:]
+                    if self._queues[model_name]:
+                        # The first request left over collects the next batch.
+                        self._queues[model_name][0].wake.set()
+                    else:
+                        self._leading.discard(model_name)
+                results = self._run(separator, batch)
+        except Exception as e:
+            if not batch:
+                # The model could not be acquired (e.g. it failed to load): fail everything queued.
+                with self._changed:
+                    batch, self._queues[model_name] = self._queues[model_name], []
+                    self._leading.discard(model_name)
+            for request in batch:
+                request.finish(error=e)
+            return
+        for request, result in zip(batch, results):
+            request.finish(result=result)
+
+    def _run(self, separator, batch):
+        waveforms = [request.waveform for request in batch]
+        metrics.separation_batch_size.observe(len(batch))
+        with metrics.stage('inference'):
+            if len(waveforms) == 1:
+                return [separator.separate(waveforms[0])]
+            packed, offsets = pack(waveforms, self.align)
+            logger.info(f"Separating {len(waveforms)} requests in one batch ({len(packed) / 44100:.1f}s of audio)")
+            return unpack(separator.separate(packed), waveforms, offsets)
+
+
+class _ModelHandle:
+    """Separator-like view of one model, for code that calls separator.separate()."""
+
+    def __init__(self, scheduler, model_name):
+        self._scheduler = scheduler
+        self._model_name = model_name
+
+    def separate(self, waveform):
+        return self._scheduler.separate(self._model_name, waveform)
+
+
+# Shared by every request handled in this process.
+scheduler = BatchScheduler()
@@ -0,0 +1,333 @@
+# benchmark.py
+"""
+Benchmarks for the audio pipeline.
+
+Generates synthetic tracks of several lengths and channel counts, times each
+processing stage (separate_audio, change_tempo, change_pitch, add_reverb,
+mix_stems, process_remix) and the /upload, /process and /preview endpoints
+through the Flask test client, and reports throughput in seconds of audio
+processed per second. Results are compared against a stored baseline and
+regressions beyond the tolerance are flagged (exit status 1). A missing
+baseline is an error (exit status 2) unless --allow-missing-baseline is
+given, so a CI job that lost its baseline does not pass silently.
+
+Everything runs offline in a scratch directory. When Spleeter or its model
+weights are not available, a stub separator stands in for the model, so
+inference numbers are then meaningless but every other stage is real.
+
+Usage (from flask_app/):
+    python benchmark.py                      # run and compare with benchmark_baseline.json
+    python benchmark.py --save-baseline      # run and store the results as the new baseline
+    python benchmark.py --allow-missing-baseline   # just report when there is no baseline yet
+    python benchmark.py --lengths 10 --channels 2 --repeat 1
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import audio_io  # noqa: E402
+import metrics  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'benchmark_baseline.json')
+DEFAULT_LENGTHS = (10, 30, 120)
+DEFAULT_CHANNELS = (1, 2)
+DEFAULT_TOLERANCE = 0.2
+SAMPLE_RATE = audio_io.CANONICAL_SAMPLE_RATE
+STUB_MODEL = 'stub'
+
+
+def synthetic_track(seconds, channels, sr=SAMPLE_RATE, seed=0):
+    """
+    A deterministic music-like test signal: a few harmonic tones with a
+    vibrato (the "voice"), a bass line, noise bursts on the beat, and a
+    little hiss. Returns float32 (channels, samples).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    voice = sum(0.15 / k * np.sin(2 * np.pi * k * 220 * t + 3 * np.sin(2 * np.pi * 5 * t)) for k in range(1, 5))
+    bass = 0.2 * np.sin(2 * np.pi * 55 * t)
+    beat = (t * 2) % 1.0
+    drums = 0.3 * rng.standard_normal(len(t)) * np.exp(-beat * 30)
+    mono = voice + bass + drums + 0.01 * rng.standard_normal(len(t))
+    if channels == 1:
+        return mono[np.newaxis].astype(np.float32)
+    # Slightly different mixes per channel so stereo is not just duplicated mono.
+    pans = np.linspace(0.8, 1.2, channels)
+    return np.clip(np.stack([voice * pan + bass + drums / pan for pan in pans]), -1, 1).astype(np.float32)
+
+
+class StubSeparator:
+    """
+    Stands in for a Spleeter separator when the model is unavailable: the
+    mid channel becomes "vocals" and the remainder "accompaniment".
+    """
+
+    def separate(self, waveform):
+        vocals = np.repeat(waveform.mean(axis=1, keepdims=True), waveform.shape[1], axis=1) * 0.5
+        return {'vocals': vocals, 'accompaniment': waveform - vocals}
+
+    def separate_to_file(self, audio_file_path, output_dir):
+        waveform, sr = audio_io.load(audio_file_path, sr=SAMPLE_RATE, channels=2)
+        stem_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(audio_file_path))[0])
+        os.makedirs(stem_dir, exist_ok=True)
+        for name, stem in self.separate(waveform.T).items():
+            audio_io.save(os.path.join(stem_dir, f"{name}.wav"), stem.T, sr)
+
+
+def spleeter_available(model_name='spleeter:2stems'):
+    """True if Spleeter is installed and the model weights are already on disk (no download needed)."""
+    try:
+        import spleeter  # noqa: F401
+    except ImportError:
+        return False
+    model_dir = os.path.join(os.environ.get('MODEL_PATH', 'pretrained_models'), model_name.split(':')[-1])
+    return os.path.isdir(model_dir)
+
+
+def time_call(fn, repeat, setup=None):
+    """Runs fn `repeat` times (after setup() each time) and returns the median wall time."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def stage_totals():
+    """Current cumulative seconds per pipeline stage, from the metrics registry."""
+    return {name: metrics.stage_seconds.total(stage=name) for name in metrics.STAGES}
+
+
+class Benchmark:
+    def __init__(self, workdir, model, repeat):
+        self.workdir = workdir
+        self.model = model
+        self.repeat = repeat
+        self.results = {}
+        # The app creates uploads/, output/ and cache/ relative to the working
+        # directory, so import it only once inside the scratch directory.
+        os.chdir(workdir)
+        import audio_processor
+        import audio_separator
+        import stem_cache
+        from app import app
+        from separation_cache import SeparationCache
+        from batch_scheduler import BatchScheduler
+        from separator_pool import SeparatorPool
+
+        self.audio_processor = audio_processor
+        self.audio_separator = audio_separator
+        self.stem_cache = stem_cache
+        self.client = app.test_client()
+        if model == STUB_MODEL:
+            audio_separator.scheduler = BatchScheduler(SeparatorPool(factory=lambda name: StubSeparator()))
+        self.separation_cache = SeparationCache(os.path.join(workdir, 'bench-cache'))
+        audio_separator.cache = self.separation_cache
+        self.warm_up()
+
+    def warm_up(self):
+        """Runs every stage once on a short clip so JIT compilation and imports are not timed."""
+        import remix_engine
+
+        y = synthetic_track(1, 2)
+        remix_engine.render(y, y, SAMPLE_RATE, tempo=1.1, pitch=1, reverb_amount=0.3, cache=None)
+        remix_engine.time_stretch(y, 1.25)
+        remix_engine.pitch_shift(y, SAMPLE_RATE, 2)
+        audio_io.encode(y, SAMPLE_RATE, 'ogg')
+
+    def cold(self):
+        """Forgets cached separations and transformed stems so each run does the full work."""
+        shutil.rmtree(self.separation_cache.root, ignore_errors=True)
+        os.makedirs(self.separation_cache.root)
+        self.stem_cache.transformed_stems.clear()
+
+    def record(self, name, seconds, audio_seconds, stages=None):
+        entry = {
+            'seconds': round(seconds, 4),
+            'throughput': round(audio_seconds / seconds, 3) if seconds > 0 else None,
+        }
+        if stages:
+            entry['stages'] = {stage: round(value, 4) for stage, value in stages.items() if value > 0}
+        self.results[name] = entry
+        print(f"  {name:<32} {seconds:9.3f} s {entry['throughput']:>10} audio s/s")
+
+    def timed_endpoint(self, name, audio_seconds, request, setup=None):
+        """Times an endpoint call and records how its time splits across pipeline stages."""
+        def run():
+            response = request()
+            if response.status_code != 200:
+                raise RuntimeError(f"{name} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+        before = stage_totals()
+        seconds = time_call(run, self.repeat, setup)
+        after = stage_totals()
+        stages = {stage: (after[stage] - before[stage]) / self.repeat for stage in metrics.STAGES}
+        self.record(name, seconds, audio_seconds, stages)
+
+    def run_case(self, seconds, channels):
+        label = f"{seconds}s_{channels}ch"
+        print(f"{label}:")
+        inputs = os.path.join(self.workdir, 'inputs')
+        os.makedirs(inputs, exist_ok=True)
+        source = os.path.join(inputs, f"track_{label}.wav")
+        audio_io.save(source, synthetic_track(seconds, channels), SAMPLE_RATE)
+        ap = self.audio_processor
+        scratch = os.path.join(self.workdir, 'scratch', label)
+        os.makedirs(scratch, exist_ok=True)
+
+        stems_dir = os.path.join(scratch, 'stems')
+        paths = {}
+
+        def separate():
+            paths['stems'] = self.audio_separator.separate_audio(source, stems_dir, model_name=self.model_name)
+            if paths['stems'][0] is None:
+                raise RuntimeError("separate_audio failed")
+
+        self.record(f"separate_audio/{label}", time_call(separate, self.repeat, self.cold), seconds)
+        vocals, accompaniment = paths['stems']
+        out = os.path.join(scratch, 'out.wav')
+        stages = [
+            ('change_tempo', lambda: ap.change_tempo(vocals, out, 1.25)),
+            ('change_pitch', lambda: ap.change_pitch(vocals, out, 2)),
+            ('add_reverb', lambda: ap.add_reverb(vocals, out, 0.5)),
+            ('mix_stems', lambda: ap.mix_stems(vocals, accompaniment, out, vocals_gain=-3)),
+            ('process_remix', lambda: ap.process_remix(vocals, accompaniment, scratch, tempo=1.1, pitch=1, reverb=0.3)),
+        ]
+        for name, fn in stages:
+            self.record(f"{name}/{label}", time_call(fn, self.repeat, self.cold), seconds)
+
+        with open(source, 'rb') as f:
+            source_bytes = f.read()
+        upload_name = f"upload_{label}.wav"
+        self.timed_endpoint(
+            f"POST /upload/{label}", seconds,
+            lambda: self.client.post(
+                '/upload', data={'file': (io.BytesIO(source_bytes), upload_name)},
+                content_type='multipart/form-data'),
+            self.cold)
+        stem_folder = os.path.splitext(upload_name)[0]
+        remix_request = {
+            'vocals_path': f"{stem_folder}/{stem_folder}/vocals.wav",
+            'accompaniment_path': f"{stem_folder}/{stem_folder}/accompaniment.wav",
+            'tempo': 1.1, 'pitch': 1, 'reverb': 0.3,
+        }
+        self.timed_endpoint(
+            f"POST /process/{label}", seconds,
+            lambda: self.client.post('/process', json=remix_request), self.cold)
+        preview_seconds = min(ap.PREVIEW_SECONDS, seconds)
+        self.timed_endpoint(
+            f"POST /preview/{label}", preview_seconds,
+            lambda: self.client.post('/preview', json=dict(remix_request, duration=preview_seconds)), self.cold)
+
+    @property
+    def model_name(self):
+        return 'spleeter:2stems' if self.model == STUB_MODEL else self.model
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares throughput per benchmark with a baseline.
+    Returns a list of (name, baseline throughput, current throughput, change)
+    for every benchmark that got slower by more than tolerance (0.2 = 20%).
+    """
+    regressions = []
+    for name, entry in results.items():
+        reference = baseline.get(name)
+        if not reference or not reference.get('throughput') or not entry.get('throughput'):
+            continue
+        change = entry['throughput'] / reference['throughput'] - 1.0
+        if change < -tolerance:
+            regressions.append((name, reference['throughput'], entry['throughput'], change))
+    return regressions
+
+
+def environment(model):
+    return {
+        'model': model,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lengths', type=int, nargs='+', default=list(DEFAULT_LENGTHS), help='track lengths in seconds')
+    parser.add_argument('--channels', type=int, nargs='+', default=list(DEFAULT_CHANNELS), help='channel counts')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the median is reported')
+    parser.add_argument('--model', default='auto', help="'auto', 'stub' or a Spleeter model name")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--allow-missing-baseline', action='store_true',
+                        help='exit 0 instead of 2 when the baseline file does not exist')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed throughput drop (0.2 = 20%%)')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args(argv)
+    baseline_missing = not args.save_baseline and not os.path.exists(args.baseline)
+    if baseline_missing and not args.allow_missing_baseline:
+        # Checked before the run, which can take minutes.
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one "
+              "or --allow-missing-baseline to skip the comparison.", file=sys.stderr)
+        return 2
+
+    model = args.model
+    if model == 'auto':
+        model = 'spleeter:2stems' if spleeter_available() else STUB_MODEL
+    if model == STUB_MODEL:
+        print("Spleeter model not available; using the stub separator (inference timings are not representative).")
+    workdir = tempfile.mkdtemp(prefix='remixer-bench-')
+    cwd = os.getcwd()
+    try:
+        bench = Benchmark(workdir, model, args.repeat)
+        for seconds in args.lengths:
+            for channels in args.channels:
+                bench.run_case(seconds, channels)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'environment': environment(model), 'results': bench.results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if baseline_missing:
+        print(f"No baseline at {args.baseline}; nothing to compare with.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('environment', {}).get('model') != model:
+        print(f"Baseline was recorded with model {baseline.get('environment', {}).get('model')!r}, not {model!r}; "
+              "inference timings are not comparable.")
+    regressions = compare(bench.results, baseline.get('results', {}), args.tolerance)
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+        return 0
+    print("Regressions:")
+    for name, before, after, change in regressions:
+        print(f"  {name:<32} {before:>10} -> {after:>10} audio s/s ({change:+.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# chunked_separation.py
+"""
+Bounded-memory separation for long tracks.
+
+The input is separated in overlapping windows. Consecutive windows are
+crossfaded across the overlap and the stitched stems are streamed to disk,
+so peak memory depends on the window length rather than the track length.
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import audio_io
+import progress
+import stem_store
+
+SAMPLE_RATE = 44100
+CHUNK_SECONDS = float(os.environ.get('SEPARATION_CHUNK_SECONDS', '30'))
+CHUNK_OVERLAP_SECONDS = float(os.environ.get('SEPARATION_CHUNK_OVERLAP_SECONDS', '2'))
+# Windows decoded/separated ahead of the one being written.
+CHUNK_PARALLELISM = int(os.environ.get('SEPARATION_CHUNK_PARALLELISM', '1'))
+# Tracks longer than this are separated in chunks; shorter ones in one pass.
+CHUNK_THRESHOLD_SECONDS = float(os.environ.get('SEPARATION_CHUNK_THRESHOLD_SECONDS', '600'))
+
+
+def iter_windows(total_samples, window, overlap):
+    """
+    Yields (start, length) windows covering total_samples, each overlapping
+    the previous one by `overlap` samples. The last window is always longer
+    than the overlap so it can be crossfaded in full.
+    """
+    if overlap >= window:
+        raise ValueError("overlap must be shorter than the window")
+    hop = window - overlap
+    start = 0
+    while True:
+        length = min(window, total_samples - start)
+        yield start, length
+        if start + length >= total_samples:
+            return
+        start += hop
+
+
+def _crossfade(tail, head):
+    """Linear crossfade from tail into head; both are (samples, channels)."""
+    n = len(tail)
+    fade_in = ((np.arange(n, dtype=np.float32) + 0.5) / n)[:, np.newaxis]
+    return tail * (1.0 - fade_in) + head[:n] * fade_in
+
+
+def stitch(separated_windows, overlap, write):
+    """
+    Joins per-window stems into continuous streams.
+
+    separated_windows yields {stem_name: (samples, channels) array} per
+    window, in order. write(stem_name, frames) is called with stitched audio
+    as soon as it is final; only one overlap's worth of audio per stem is
+    held back between windows.
+    """
+    tails = {}
+    for stems in separated_windows:
+        for name, audio in stems.items():
+            tail = tails.get(name)
+            if tail is not None:
+                n = min(len(tail), len(audio))
+                audio = np.concatenate([_crossfade(tail[:n], audio), audio[n:]])
+            cut = max(len(audio) - overlap, 0)
+            write(name, audio[:cut])
+            tails[name] = audio[cut:]
+    for name, tail in tails.items():
+        write(name, tail)
+
+
+def separate_windows(load_window, separate, total_samples, window, overlap, parallelism=CHUNK_PARALLELISM):
+    """
+    Yields separate(load_window(start, length)) for each window in order.
+    With parallelism > 1, up to that many later windows are loaded and
+    separated while earlier results are consumed.
+    """
+    def run(start, length):
+        waveform = load_window(start, length)
+        # Decoders are not always sample-exact when seeking; keep the window
+        # length fixed so overlaps stay aligned.
+        if len(waveform) < length:
+            waveform = np.pad(waveform, ((0, length - len(waveform)), (0, 0)))
+        return {name: stem[:length] for name, stem in separate(waveform[:length]).items()}
+
+    windows = iter_windows(total_samples, window, overlap)
+    if parallelism <= 1:
+        for start, length in windows:
+            yield run(start, length)
+        return
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='chunk') as executor:
+        pending = deque()
+        for start, length in windows:
+            pending.append(executor.submit(run, start, length))
+            if len(pending) > parallelism:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def separate_to_file_chunked(separator, audio_file_path, output_dir, sample_rate=SAMPLE_RATE,
+                             chunk_seconds=CHUNK_SECONDS, overlap_seconds=CHUNK_OVERLAP_SECONDS,
+                             parallelism=CHUNK_PARALLELISM, decoded=None):
+    """
+    Separates audio_file_path window by window with a Spleeter separator
+    (anything with a thread-safe separate(waveform), such as a
+    batch_scheduler model handle), writing <output_dir>/<file name>/<stem>.wav like separate_to_file does,
+    and each stem's .npy/.json copy (see stem_store) from the same stitched audio.
+    decoded, if given, is the already decoded stereo (samples, channels)
+    audio at sample_rate (typically a memmap); windows are sliced from it
+    instead of decoded from the file.
+    Returns {stem_name: path}.
+    """
+    if decoded is not None:
+        total_samples = len(decoded)
+    else:
+        total_samples = int(round(probe_duration(audio_file_path) * sample_rate))
+    stem_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(audio_file_path))[0])
+    os.makedirs(stem_dir, exist_ok=True)
+
+    def load_window(start, length):
+        if decoded is not None:
+            return np.array(decoded[start:start + length])
+        # Spleeter takes stereo (samples, channels) waveforms.
+        waveform, _ = audio_io.load(
+            audio_file_path, sr=sample_rate, channels=2,
+            offset=start / sample_rate, duration=length / sample_rate)
+        return waveform.T
+
+    writers = {}
+    arrays = {}
+    paths = {}
+
+    def write(name, frames):
+        if name not in writers:
+            paths[name] = os.path.join(stem_dir, f"{name}.wav")
+            writers[name] = audio_io.StreamWriter(paths[name], sample_rate, frames.shape[1], fmt='wav')
+            arrays[name] = stem_store.NpyWriter(paths[name], sample_rate, frames.shape[1], total_samples)
+        writers[name].write(frames.T)
+        arrays[name].write(frames.T)
+
+    window = int(chunk_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    window_count = sum(1 for _ in iter_windows(total_samples, window, overlap))
+
+    def reporting(windows):
+        for index, stems in enumerate(windows, 1):
+            progress.report('separation', index / window_count, window=index, windows=window_count)
+            yield stems
+
+    try:
+        stitch(
+            reporting(separate_windows(load_window, separator.separate, total_samples, window, overlap, parallelism)),
+            overlap,
+            write)
+    except BaseException:
+        for array in arrays.values():
+            array.abort()
+        raise
+    finally:
+        for writer in writers.values():
+            writer.close()
+    for array in arrays.values():
+        array.close()
+    return paths
+
+
+def probe_duration(audio_file_path):
+    """Returns the duration of an audio file in seconds, read with ffprobe."""
+    return audio_io.probe(audio_file_path)['duration']
@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+"""
+Gunicorn settings for the remixer backend.
+
+Values here are defaults; GUNICORN_CMD_ARGS (set by Cloud Run) still
+overrides them.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+# Job state (jobs.py) lives in the worker process, so scale with threads
+# rather than processes.
+worker_class = 'gthread'
+# Each open /jobs/<id>/events stream parks one thread (see progress.py), so
+# the pool has room for SSE_MAX_STREAMS of them on top of the request
+# threads. Threads are only started when needed. Separations and remixes
+# run in the request thread unless async=1 is sent; app.py caps those at
+# GUNICORN_THREADS at a time so they cannot spread onto the stream threads.
+threads = int(os.environ.get('GUNICORN_THREADS', '8')) + int(os.environ.get('SSE_MAX_STREAMS', '256'))
+
+
+def post_worker_init(worker):
+    # Load the separator model when the worker boots instead of on the first
+    # request. This runs in the worker rather than the master because the
+    # TensorFlow runtime does not survive a fork.
+    from separator_pool import pool, WARMUP_ON_BOOT, DEFAULT_MODEL
+    if WARMUP_ON_BOOT:
+        try:
+            pool.warm_up(DEFAULT_MODEL)
+        except Exception as e:
+            worker.log.error(f"Separator warm-up failed: {e}")
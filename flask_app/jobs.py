@@ -0,0 +1,149 @@
+# jobs.py
+"""
+In-process job queue for long-running separation and remix work.
+
+Handlers submit a callable and get a job ID back immediately; a bounded pool
+of worker threads runs the jobs. Job state lives in this process, so the app
+is meant to run as a single gunicorn worker process with several threads.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import progress
+
+logger = logging.getLogger("remixer-backend.jobs")
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', str(os.cpu_count() or 1)))
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', '32'))
+JOB_HISTORY_LIMIT = int(os.environ.get('JOB_HISTORY_LIMIT', '500'))
+# Progress updates within a stage closer together than this are coalesced.
+PROGRESS_MIN_INTERVAL = 0.25
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds JOB_QUEUE_LIMIT unfinished jobs."""
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # The JSON payload and HTTP status the synchronous endpoint would return.
+        self.result = None
+        self.status_code = None
+        # Latest progress report; version increases on every visible change.
+        self.progress = None
+        self.version = 0
+        self._changed = threading.Condition()
+        self._last_notified = 0.0
+
+    def _notify(self):
+        with self._changed:
+            self.version += 1
+            self._last_notified = time.monotonic()
+            self._changed.notify_all()
+
+    def set_status(self, status):
+        self.status = status
+        self._notify()
+
+    def set_progress(self, stage, fraction=None, detail=None):
+        """
+        Records the latest progress. Frequent updates within one stage are
+        coalesced so watchers are woken at most every PROGRESS_MIN_INTERVAL.
+        """
+        previous = self.progress
+        self.progress = {'stage': stage, 'fraction': fraction, **(detail or {})}
+        if (previous is None or previous['stage'] != stage or fraction in (0.0, 1.0)
+                or time.monotonic() - self._last_notified >= PROGRESS_MIN_INTERVAL):
+            self._notify()
+
+    def wait_for_change(self, version, timeout):
+        """Waits until the job's version is past `version`. Returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version > version, timeout)
+
+    @property
+    def done(self):
+        return self.status in (FINISHED, FAILED)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': self.progress,
+            'version': self.version,
+        }
+
+
+class JobQueue:
+    """
+    Runs submitted callables on a fixed-size thread pool.
+
+    Each callable returns a (payload, status_code) pair, the same shape the
+    synchronous handlers produce, so a job result can be replayed verbatim.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_LIMIT, history=JOB_HISTORY_LIMIT):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._max_pending = max_pending
+        self._history = history
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.done)
+            if pending >= self._max_pending:
+                raise QueueFull(f"{pending} jobs already pending")
+            job = Job(kind)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job.started_at = time.time()
+        job.set_status(RUNNING)
+        try:
+            with progress.bind(job):
+                job.result, job.status_code = fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Job {job.id} raised: {e}")
+            job.result, job.status_code = {'error': str(e)}, 500
+        job.finished_at = time.time()
+        job.set_status(FINISHED if job.status_code < 400 else FAILED)
+        logger.info(f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s")
+
+    def _prune(self):
+        """Drops the oldest finished jobs beyond the history limit."""
+        excess = len(self._jobs) - self._history
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+
+# Shared by every request handled in this process.
+queue = JobQueue()
@@ -0,0 +1,205 @@
+# metrics.py
+"""
+Process-wide metrics in the Prometheus text exposition format.
+
+The pipeline stages (download, decode, inference, tempo, pitch, reverb, mix,
+encode) record their wall time with `stage()`. Together with cache counters,
+the duration of separated audio and the process's peak RSS, the registry is
+served on /metrics for Prometheus to scrape.
+"""
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ('download', 'decode', 'inference', 'tempo', 'pitch', 'reverb', 'mix', 'encode')
+
+# Seconds; stage calls range from a few milliseconds (mix) to minutes (inference).
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+AUDIO_DURATION_BUCKETS = (30, 60, 120, 180, 240, 300, 450, 600, 900, 1200, 1800, 3600)
+BATCH_SIZE_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16)
+COST_RATIO_BUCKETS = (0.125, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0, 8.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', list(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from a callback at scrape time."""
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        super().__init__(name, documentation)
+        self._read = read
+
+    def _samples(self):
+        value = self._read()
+        return [] if value is None else [('', [], value)]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[0][-1] if entry else 0
+
+    def total(self, **labels):
+        """Sum of all observed values."""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[1] if entry else 0.0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                samples.append(('_bucket', labels + [('le', _format_value(bound))], count))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns every registered metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+registry = Registry()
+stage_seconds = registry.register(Histogram(
+    'remixer_stage_seconds', 'Wall time of one call of a pipeline stage.', ['stage']))
+input_audio_seconds = registry.register(Histogram(
+    'remixer_input_audio_seconds', 'Duration of audio submitted for separation.',
+    buckets=AUDIO_DURATION_BUCKETS))
+cache_requests = registry.register(Counter(
+    'remixer_cache_requests_total', 'Cache lookups by cache and result (hit or miss).', ['cache', 'result']))
+separation_batch_size = registry.register(Histogram(
+    'remixer_separation_batch_size', 'Separation requests run in one forward pass.',
+    buckets=BATCH_SIZE_BUCKETS))
+store_evictions = registry.register(Counter(
+    'remixer_store_evictions_total', 'Entries removed from managed storage by store and reason (ttl or quota).',
+    ['store', 'reason']))
+admission_rejections = registry.register(Counter(
+    'remixer_admission_rejections_total', 'Requests turned away by admission control, by kind and reason.',
+    ['kind', 'reason']))
+admission_cost_ratio = registry.register(Histogram(
+    'remixer_admission_cost_ratio', 'Measured over estimated seconds of admitted work (1 = accurate cost model).',
+    ['kind'], buckets=COST_RATIO_BUCKETS))
+registry.register(Gauge(
+    'remixer_peak_rss_bytes', 'Peak resident set size of the worker process.', peak_rss_bytes))
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as one call of pipeline stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+
+
+def record_cache(cache_name, hit):
+    cache_requests.inc(cache=cache_name, result='hit' if hit else 'miss')
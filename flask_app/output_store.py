@@ -0,0 +1,204 @@
+# output_store.py
+"""
+Lifecycle management for uploads, separated stems and remixes.
+
+Each top-level entry of a managed directory (an uploaded file, a stem
+folder with its remixes) is one unit of garbage collection. Entries that
+have not been used for STORE_TTL_HOURS are deleted; if a directory is still
+over its quota, the least recently used entries go next. Anything used in
+the last STORE_MIN_AGE_SECONDS is left alone even over quota, so files a
+running job depends on are not pulled out from under it.
+
+"Used" means written, or marked with touch() when a request reads it (stem
+downloads, remixes). touch() records the time on a marker file under
+<root>/.access rather than on the entry itself, so reading a file never
+changes its mtime, which content digests and storage versions are keyed on.
+A background thread runs collect() on every store every
+STORE_GC_INTERVAL_SECONDS.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger("remixer-backend.store")
+
+STORE_TTL_SECONDS = float(os.environ.get('STORE_TTL_HOURS', '24')) * 3600
+OUTPUT_STORE_MAX_BYTES = int(os.environ.get('OUTPUT_STORE_MAX_MB', '10240')) * 1024 * 1024
+UPLOAD_STORE_MAX_BYTES = int(os.environ.get('UPLOAD_STORE_MAX_MB', '10240')) * 1024 * 1024
+DOWNLOAD_STORE_MAX_BYTES = int(os.environ.get('DOWNLOAD_STORE_MAX_MB', '10240')) * 1024 * 1024
+STORE_MIN_AGE_SECONDS = float(os.environ.get('STORE_MIN_AGE_SECONDS', '3600'))
+STORE_GC_INTERVAL_SECONDS = float(os.environ.get('STORE_GC_INTERVAL_SECONDS', '300'))
+# Per-store directory of access markers, one empty file per touched entry.
+ACCESS_DIR = '.access'
+# Scratch files outlive their job only if a worker died mid-job.
+SCRATCH_TTL_SECONDS = float(os.environ.get('SCRATCH_TTL_HOURS', '6')) * 3600
+
+
+def _entry_usage(path):
+    """Returns (last used time, size in bytes) of a file or directory tree."""
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return 0.0, 0
+    if not os.path.isdir(path):
+        return info.st_mtime, info.st_size
+    last_used, size = info.st_mtime, 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                file_info = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            last_used = max(last_used, file_info.st_mtime)
+            size += file_info.st_size
+    return last_used, size
+
+
+class OutputStore:
+    def __init__(self, root, name=None, ttl_seconds=STORE_TTL_SECONDS, max_bytes=None,
+                 min_age_seconds=STORE_MIN_AGE_SECONDS):
+        self.root = root
+        self.name = name or os.path.basename(os.path.normpath(root))
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_for(self, path):
+        """The top-level entry of this store that contains path, or None."""
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        if relative == '.' or relative.startswith(os.pardir):
+            return None
+        return os.path.join(self.root, relative.split(os.sep)[0])
+
+    def _marker_for(self, entry):
+        return os.path.join(self.root, ACCESS_DIR, os.path.basename(entry))
+
+    def touch(self, path):
+        """Marks the entry containing path as just used, leaving its files' mtimes alone."""
+        entry = self._entry_for(path)
+        if entry is None or os.path.basename(entry) == ACCESS_DIR or not os.path.exists(entry):
+            return
+        marker = self._marker_for(entry)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker, 'a'):
+            pass
+        os.utime(marker)
+
+    def entries(self):
+        """Returns [(path, last used, size)] for every entry, least recently used first."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if name == ACCESS_DIR:
+                continue
+            path = os.path.join(self.root, name)
+            last_used, size = _entry_usage(path)
+            try:
+                last_used = max(last_used, os.stat(self._marker_for(path)).st_mtime)
+            except FileNotFoundError:
+                pass
+            entries.append((path, last_used, size))
+        entries.sort(key=lambda entry: entry[1])
+        return entries
+
+    def usage(self):
+        return sum(size for _, _, size in self.entries())
+
+    def _remove(self, path, reason):
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+            return False
+        try:
+            os.remove(self._marker_for(path))
+        except FileNotFoundError:
+            pass
+        metrics.store_evictions.inc(store=self.name, reason=reason)
+        return True
+
+    def _drop_stale_markers(self):
+        """Removes access markers of entries deleted by other means (e.g. discarded uploads)."""
+        access_dir = os.path.join(self.root, ACCESS_DIR)
+        try:
+            names = os.listdir(access_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not os.path.lexists(os.path.join(self.root, name)):
+                try:
+                    os.remove(os.path.join(access_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def collect(self, now=None):
+        """Deletes expired entries, then least recently used ones until under quota. Returns the paths removed."""
+        now = time.time() if now is None else now
+        removed = []
+        with self._lock:
+            self._drop_stale_markers()
+            entries = self.entries()
+            total = sum(size for _, _, size in entries)
+            for path, last_used, size in entries:
+                idle = now - last_used
+                if idle < self.min_age_seconds:
+                    # Sorted by last use: everything after this is recent too.
+                    break
+                if self.ttl_seconds is not None and idle > self.ttl_seconds:
+                    reason = 'ttl'
+                elif self.max_bytes is not None and total > self.max_bytes:
+                    reason = 'quota'
+                else:
+                    continue
+                if self._remove(path, reason):
+                    removed.append(path)
+                    total -= size
+        if removed:
+            logger.info(f"Removed {len(removed)} entries from {self.root}; {total / 2**20:.0f} MB left")
+        if self.max_bytes is not None and total > self.max_bytes:
+            logger.warning(f"{self.root} holds {total / 2**20:.0f} MB, over its {self.max_bytes / 2**20:.0f} MB "
+                           f"quota, but everything left was used in the last {self.min_age_seconds:.0f}s")
+        return removed
+
+
+class Collector:
+    """Runs collect() on a set of stores from a daemon thread."""
+
+    def __init__(self, stores, interval_seconds=STORE_GC_INTERVAL_SECONDS):
+        self.stores = stores
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        for store in self.stores:
+            try:
+                store.collect()
+            except Exception as e:
+                logger.error(f"Garbage collection of {store.root} failed: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None and self.interval_seconds > 0:
+            self._thread = threading.Thread(target=self._loop, name='store-gc', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
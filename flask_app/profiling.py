@@ -0,0 +1,185 @@
+# profiling.py
+"""
+Opt-in per-request profiling.
+
+With PROFILING_ENABLED=1, a request carrying the `X-Profile: 1` header (or
+`?profile=1`) runs under cProfile and tracemalloc. When it finishes,
+<PROFILE_DIR>/<request id>.prof (pstats data, e.g. for snakeviz) and
+<request id>.txt (hottest functions, top allocation sites, peak traced
+memory) are written, and the request ID is logged and returned in the
+X-Request-ID response header. Async jobs started by a profiled request are
+profiled the same way in their worker thread, under the same request ID.
+
+When PROFILING_ENABLED is off, install() registers nothing, so requests pay
+nothing for this module.
+
+cProfile only sees the thread it was started in; work fanned out to the
+remix pool shows up as time spent waiting on it. tracemalloc is process-wide,
+so allocations of concurrent requests are included in a profile.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger("remixer-backend.profiling")
+
+ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# If set, the X-Profile header must carry this value instead of 1.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP_FUNCTIONS', '40'))
+PROFILE_TOP_ALLOCATIONS = int(os.environ.get('PROFILE_TOP_ALLOCATIONS', '25'))
+# Stack depth recorded per allocation; deeper is more useful but slower.
+TRACEMALLOC_FRAMES = int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES', '8'))
+
+HEADER = 'X-Profile'
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_SAFE_ID = re.compile(r'[^A-Za-z0-9_.-]')
+
+# Set by install(); wrap() is a no-op until then.
+_installed = False
+
+# tracemalloc is global; it runs while at least one profile is open.
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracing_users += 1
+        return tracemalloc.take_snapshot()
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+        return snapshot, peak
+
+
+def _write_report(request_id, label, profiler, elapsed, allocations, peak, directory):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, request_id)
+    out = io.StringIO()
+    out.write(f"{label}\nrequest id: {request_id}\nwall time: {elapsed:.3f}s\n")
+    out.write(f"peak traced memory: {peak / 1e6:.1f} MB\n\n")
+    if profiler is not None:
+        profiler.dump_stats(base + '.prof')
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    else:
+        out.write("cProfile was busy with another profile; only allocations were recorded.\n\n")
+    out.write(f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites (growth during the request):\n")
+    for stat in allocations[:PROFILE_TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        out.write(f"  {stat.size_diff / 1e6:+10.2f} MB {stat.count_diff:+8d} blocks  {frame.filename}:{frame.lineno}\n")
+    with open(base + '.txt', 'w') as f:
+        f.write(out.getvalue())
+    return base + '.prof', base + '.txt'
+
+
+@contextmanager
+def profile(request_id, label, directory=None):
+    """Profiles the enclosed block in this thread and writes the report for request_id."""
+    directory = directory or PROFILE_DIR
+    start_snapshot = _start_tracing()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows a single active cProfile per process.
+        profiler = None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+        end_snapshot, peak = _stop_tracing()
+        allocations = end_snapshot.compare_to(start_snapshot, 'lineno')
+        paths = _write_report(request_id, label, profiler, elapsed, allocations, peak, directory)
+        logger.info(f"[{request_id}] Profile of {label} ({elapsed:.2f}s) written to {paths[1]}")
+
+
+def requested():
+    """True if the current request asked to be profiled (and is allowed to)."""
+    flag = request.headers.get(HEADER) or request.args.get('profile')
+    if not flag:
+        return False
+    if PROFILE_TOKEN:
+        return flag == PROFILE_TOKEN
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def current_request_id():
+    """The request ID of the profiled request being handled, or None."""
+    return g.get('profile_request_id')
+
+
+def wrap(fn, label):
+    """
+    Returns fn profiled under the current request's ID, for work handed to
+    another thread (e.g. the job queue). Returns fn unchanged when the
+    current request is not being profiled.
+    """
+    request_id = current_request_id() if _installed else None
+    if request_id is None:
+        return fn
+
+    def profiled(*args, **kwargs):
+        with profile(request_id + '.job', label):
+            return fn(*args, **kwargs)
+    return profiled
+
+
+def install(app, enabled=None):
+    """Registers the profiling hooks on app if profiling is enabled."""
+    global _installed
+    if not (ENABLED if enabled is None else enabled):
+        return False
+    _installed = True
+
+    @app.before_request
+    def start_profile():
+        if not requested():
+            return
+        request_id = _SAFE_ID.sub('', request.headers.get(REQUEST_ID_HEADER, ''))[:64] or uuid.uuid4().hex
+        g.profile_request_id = request_id
+        g.profile = profile(request_id, f"{request.method} {request.path}")
+        logger.info(f"[{request_id}] Profiling {request.method} {request.path}")
+        g.profile.__enter__()
+
+    @app.after_request
+    def tag_response(response):
+        request_id = current_request_id()
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def finish_profile(exc):
+        session = g.pop('profile', None)
+        if session is not None:
+            session.__exit__(None, None, None)
+
+    logger.info(f"Per-request profiling enabled, writing to {PROFILE_DIR}")
+    return True
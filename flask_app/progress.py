@@ -0,0 +1,89 @@
+# progress.py
+"""
+Progress reporting for async jobs, streamed to clients as Server-Sent Events.
+
+Code running inside a job calls report(stage, fraction) as work advances
+(yt-dlp download hooks, separation windows, remix stages); outside a job it
+is a no-op. Each job keeps only its latest progress plus a version number,
+and GET /jobs/<id>/events streams changes as they happen.
+
+A stream holds no state beyond the version it last sent and sleeps on the
+job's condition variable between events, with a comment line every
+SSE_HEARTBEAT_SECONDS to keep proxies from closing it. An idle stream
+therefore costs one parked thread and no CPU.
+"""
+import contextvars
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+# Concurrent event streams per worker; further requests get 503.
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '256'))
+
+_current_job = contextvars.ContextVar('current_job', default=None)
+_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+@contextmanager
+def bind(job):
+    """Routes report() calls made in the enclosed block to job."""
+    token = _current_job.set(job)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+def report(stage, fraction=None, **detail):
+    """
+    Records progress of the current job: stage name, fraction done
+    (0.0-1.0, None if unknown) and any JSON-serializable details.
+    """
+    job = _current_job.get()
+    if job is not None:
+        job.set_progress(stage, fraction, detail)
+
+
+def format_event(event, data, event_id=None):
+    """Formats one SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def acquire_stream():
+    """Reserves a stream slot. Returns False if SSE_MAX_STREAMS are open."""
+    return _streams.acquire(blocking=False)
+
+
+def release_stream():
+    _streams.release()
+
+
+def event_stream(job, last_version=-1, heartbeat=SSE_HEARTBEAT_SECONDS):
+    """
+    Yields SSE messages for job: a `progress` event whenever its status or
+    progress changes, then a final `done` event carrying the result.
+    Messages are tagged with the job version, so a reconnecting EventSource
+    (Last-Event-ID) resumes without repeats.
+    """
+    # Tell EventSource to wait a bit before reconnecting after a drop.
+    yield 'retry: 3000\n\n'
+    while True:
+        if not job.wait_for_change(last_version, heartbeat):
+            yield ': keepalive\n\n'
+            continue
+        # Read done first: a finished job's snapshot is final.
+        done = job.done
+        snapshot = job.to_dict()
+        last_version = snapshot['version']
+        if done:
+            snapshot.update(result=job.result, status_code=job.status_code)
+            yield format_event('done', snapshot, last_version)
+            return
+        yield format_event('progress', snapshot, last_version)
@@ -0,0 +1,340 @@
+# remix_engine.py
+"""
+In-memory remix engine.
+
+Each stem is decoded once into a float32 array shaped (channels, samples).
+Tempo, pitch, reverb, gain and mixing all operate on those arrays, and only
+the final mix is encoded, so a remix never round-trips through temp files.
+"""
+import multiprocessing
+import os
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import librosa
+
+import audio_io
+import metrics
+import stem_store
+from reverb import convolution_reverb
+from stem_cache import content_hash, transformed_stems
+
+# STFT settings for the tempo/pitch phase vocoder (librosa's defaults).
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# How many stem channels are stretched/shifted at once, and on what kind of
+# pool. Threads work because the FFT and resampling code releases the GIL;
+# 'process' sidesteps the GIL entirely at the cost of copying the audio.
+REMIX_PARALLELISM = int(os.environ.get('REMIX_PARALLELISM', str(os.cpu_count() or 1)))
+REMIX_EXECUTOR = os.environ.get('REMIX_EXECUTOR', 'thread')
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(kind, workers):
+    """Returns a long-lived pool so workers (and librosa imports) are reused across remixes."""
+    with _executors_lock:
+        key = (kind, workers)
+        if key not in _executors:
+            if kind == 'process':
+                # Spawn rather than fork: the app runs threads that a fork would orphan.
+                _executors[key] = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                _executors[key] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='remix')
+        return _executors[key]
+
+
+def load_stem(path, sr=None, offset=0.0, duration=None):
+    """
+    Decodes an audio file into a float32 (channels, samples) array at sr
+    (default: the canonical rate of audio_io). Returns (audio, sample_rate).
+    Pass offset/duration (seconds) to decode only an excerpt.
+
+    Separated stems with a .npy copy (see stem_store) are memory-mapped
+    instead of decoded; the result is then a read-only view of the file.
+    """
+    stored = stem_store.load(path)
+    if stored is not None:
+        y, native_sr = stored
+        start = int(round(offset * native_sr))
+        stop = None if duration is None else start + int(round(duration * native_sr))
+        y = y[:, start:stop]
+        if sr is None or sr == native_sr:
+            return y, native_sr
+        return _per_channel(lambda channel: librosa.resample(channel, orig_sr=native_sr, target_sr=sr), y), sr
+    return audio_io.load(path, sr=sr or audio_io.CANONICAL_SAMPLE_RATE, offset=offset, duration=duration)
+
+
+def save(path, y, sr):
+    """Encodes a (channels, samples) array to a 16-bit WAV file."""
+    audio_io.save(path, y, sr, fmt='wav')
+
+
+def encode(y, sr, fmt='ogg'):
+    """Encodes a (channels, samples) array in memory. Returns the file bytes."""
+    return audio_io.encode(y, sr, fmt)
+
+
+def _per_channel(fn, y):
+    return np.stack([fn(channel) for channel in y]).astype(np.float32, copy=False)
+
+
+def time_stretch(y, rate):
+    """Changes tempo without changing pitch. rate > 1.0 speeds up."""
+    if rate == 1.0:
+        return y
+    return _per_channel(lambda channel: librosa.effects.time_stretch(channel, rate=rate), y)
+
+
+def pitch_shift(y, sr, n_steps):
+    """Shifts pitch by n_steps semitones without changing tempo."""
+    if n_steps == 0:
+        return y
+    return _per_channel(lambda channel: librosa.effects.pitch_shift(channel, sr=sr, n_steps=n_steps), y)
+
+
+def reverb(y, sr, amount):
+    """
+    Applies convolution reverb (see reverb.py).
+    amount runs from 0.0 (none) to 1.0 (max).
+    """
+    if amount <= 0.0:
+        return y
+    with metrics.stage('reverb'):
+        return convolution_reverb(y, sr, amount)
+
+
+def db_to_gain(db):
+    return np.float32(10 ** (db / 20))
+
+
+def apply_gain(y, gain_db):
+    if gain_db == 0:
+        return y
+    return y * db_to_gain(gain_db)
+
+
+def mix(*stems):
+    """
+    Sums stems into one track, padding shorter stems with silence and
+    upmixing mono stems to the widest channel count. The result is clipped
+    to [-1, 1].
+    """
+    with metrics.stage('mix'):
+        channels = max(stem.shape[0] for stem in stems)
+        length = max(stem.shape[1] for stem in stems)
+        out = np.zeros((channels, length), dtype=np.float32)
+        for stem in stems:
+            out[:, :stem.shape[1]] += stem if stem.shape[0] == channels else stem[:1]
+        return np.clip(out, -1.0, 1.0, out=out)
+
+
+def analyze(channel):
+    """Returns the STFT of a 1-D signal, as consumed by synthesize()."""
+    # The analysis only exists for the phase vocoder, so it counts as tempo work.
+    with metrics.stage('tempo'):
+        return librosa.stft(channel, n_fft=N_FFT, hop_length=HOP_LENGTH)
+
+
+def synthesize(stft, length, sr, tempo=1.0, n_steps=0):
+    """
+    Changes tempo and pitch together from one STFT of a signal of `length`
+    samples.
+
+    A pitch shift is a time stretch by the inverse pitch ratio followed by a
+    resample back to the original duration, so both changes fold into a
+    single phase-vocoder pass at rate tempo / ratio plus at most one
+    resample, instead of a stretch pass followed by pitch_shift's own
+    stretch and resample.
+    """
+    pitch_rate = 2.0 ** (-float(n_steps) / 12)
+    stretch_rate = tempo * pitch_rate
+    with metrics.stage('tempo'):
+        if stretch_rate != 1.0:
+            stft = librosa.phase_vocoder(stft, rate=stretch_rate, hop_length=HOP_LENGTH)
+        y = librosa.istft(stft, hop_length=HOP_LENGTH, length=int(round(length / stretch_rate)))
+    if n_steps != 0:
+        with metrics.stage('pitch'):
+            y = librosa.resample(y, orig_sr=float(sr) / pitch_rate, target_sr=sr)
+    return librosa.util.fix_length(y, size=int(round(length / tempo))).astype(np.float32, copy=False)
+
+
+def time_pitch(channel, sr, tempo=1.0, n_steps=0):
+    """Applies a tempo change and a pitch shift to a 1-D signal in one STFT pass."""
+    if tempo == 1.0 and n_steps == 0:
+        return channel
+    return synthesize(analyze(channel), len(channel), sr, tempo, n_steps)
+
+
+def transform_stem(y, sr, tempo=1.0, pitch=0):
+    """Applies the tempo and pitch changes of a remix to one stem."""
+    if tempo == 1.0 and pitch == 0:
+        return y
+    return _per_channel(lambda channel: time_pitch(channel, sr, tempo, pitch), y)
+
+
+def _transform_channel(channel, sr, tempo, pitch):
+    return transform_stem(channel[np.newaxis], sr, tempo, pitch)[0]
+
+
+def transform_stems(stems, sr, tempo=1.0, pitch=0, parallelism=None, executor=None, cache=None):
+    """
+    Applies transform_stem to every stem, running the channels of all stems
+    concurrently on up to `parallelism` workers. Each channel goes through
+    exactly the same code as in serial mode, so the output is identical.
+
+    With a cache (see stem_cache.LRUCache), results are looked up by stem
+    content, sample rate, tempo and pitch, and only missing stems are
+    computed. Cached arrays are read-only.
+    """
+    if tempo == 1.0 and pitch == 0:
+        return list(stems)
+    if cache is None:
+        return _transform_stems(stems, sr, tempo, pitch, parallelism, executor)
+    keys = [(content_hash(y), sr, tempo, pitch) for y in stems]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        computed = _transform_stems([stems[i] for i in missing], sr, tempo, pitch, parallelism, executor)
+        for i, y in zip(missing, computed):
+            y.flags.writeable = False
+            cache.put(keys[i], y, y.nbytes)
+            results[i] = y
+    return results
+
+
+def _transform_stems(stems, sr, tempo, pitch, parallelism, executor):
+    parallelism = REMIX_PARALLELISM if parallelism is None else parallelism
+    if parallelism <= 1:
+        return [transform_stem(y, sr, tempo, pitch) for y in stems]
+    channels = [channel for y in stems for channel in y]
+    pool = _get_executor(executor or REMIX_EXECUTOR, min(parallelism, len(channels)))
+    processed = iter(pool.map(_transform_channel, channels, repeat(sr), repeat(tempo), repeat(pitch)))
+    return [np.stack([next(processed) for _ in range(y.shape[0])]) for y in stems]
+
+
+def _transform_channel_multi(channel, sr, transforms):
+    """Analyzes a channel once and synthesizes every (tempo, pitch) in transforms from it."""
+    stft = analyze(channel)
+    return [synthesize(stft, len(channel), sr, tempo, pitch) for tempo, pitch in transforms]
+
+
+def transform_stems_multi(stems, sr, transforms, parallelism=None, cache=None, executor=None):
+    """
+    Like transform_stems for several (tempo, pitch) pairs at once. Each
+    channel's STFT is computed once and shared by all pairs, and channels are
+    processed concurrently (one STFT in memory per worker) on the same kind of
+    pool as transform_stems.
+    Returns {(tempo, pitch): [transformed stems]}.
+    """
+    results = {(1.0, 0): list(stems)}
+    keys = {}
+    pending = {}
+    for index, y in enumerate(stems):
+        for transform in transforms:
+            if transform in results and results[transform][index] is not None:
+                continue
+            results.setdefault(transform, [None] * len(stems))
+            if cache is not None:
+                if index not in keys:
+                    keys[index] = content_hash(y)
+                cached = cache.get((keys[index], sr) + transform)
+                if cached is not None:
+                    results[transform][index] = cached
+                    continue
+            pending.setdefault(index, []).append(transform)
+
+    tasks = [(index, c) for index, missing in pending.items() for c in range(stems[index].shape[0])]
+    parallelism = REMIX_PARALLELISM if parallelism is None else parallelism
+    if tasks:
+        channels = [stems[index][c] for index, c in tasks]
+        channel_transforms = [pending[index] for index, _ in tasks]
+        if parallelism <= 1:
+            outputs = map(_transform_channel_multi, channels, repeat(sr), channel_transforms)
+        else:
+            pool = _get_executor(executor or REMIX_EXECUTOR, min(parallelism, len(tasks)))
+            outputs = pool.map(_transform_channel_multi, channels, repeat(sr), channel_transforms)
+        per_stem = {}
+        for (index, _), channel_outputs in zip(tasks, outputs):
+            per_stem.setdefault(index, []).append(channel_outputs)
+        for index, channels in per_stem.items():
+            for i, transform in enumerate(pending[index]):
+                y = np.stack([channel_outputs[i] for channel_outputs in channels])
+                if cache is not None:
+                    y.flags.writeable = False
+                    cache.put((keys[index], sr) + transform, y, y.nbytes)
+                results[transform][index] = y
+    return results
+
+
+def _finish(vocals, accompaniment, sr, reverb_amount=0.0, vocals_gain=0, acc_gain=0):
+    vocals = reverb(vocals, sr, reverb_amount)
+    return mix(apply_gain(vocals, vocals_gain), apply_gain(accompaniment, acc_gain))
+
+
+def render_batch(vocals, accompaniment, sr, variants, parallelism=None, cache=transformed_stems, executor=None):
+    """
+    Renders several remixes of one stem pair. variants is a list of dicts
+    with optional tempo, pitch, reverb, vocals_gain and acc_gain keys.
+
+    Every distinct (tempo, pitch) is computed once from a single STFT per
+    channel, then the reverb/gain/mix stage of the variants runs in parallel.
+    Yields the remixes in the order of variants, each as soon as it is ready,
+    with at most `parallelism` finished but not yet consumed. Transformed
+    stems are dropped once the last variant using them is mixed, so callers
+    that encode each remix before taking the next never hold every variant.
+    """
+    def transform_of(variant):
+        return (float(variant.get('tempo', 1.0)), float(variant.get('pitch', 0)))
+
+    transforms = list(dict.fromkeys(t for t in map(transform_of, variants) if t != (1.0, 0)))
+    transformed = transform_stems_multi([vocals, accompaniment], sr, transforms, parallelism, cache, executor)
+    users = Counter(map(transform_of, variants))
+    lock = threading.Lock()
+
+    def finish(variant):
+        transform = transform_of(variant)
+        stem_vocals, stem_acc = transformed[transform]
+        remix = _finish(
+            stem_vocals, stem_acc, sr,
+            reverb_amount=float(variant.get('reverb', 0.0)),
+            vocals_gain=float(variant.get('vocals_gain', 0)),
+            acc_gain=float(variant.get('acc_gain', 0)))
+        with lock:
+            users[transform] -= 1
+            if not users[transform]:
+                del transformed[transform]
+        return remix
+
+    parallelism = REMIX_PARALLELISM if parallelism is None else parallelism
+    if parallelism <= 1:
+        for variant in variants:
+            yield finish(variant)
+        return
+    pool = _get_executor('thread', max(1, min(parallelism, len(variants))))
+    window = deque()
+    for variant in variants:
+        if len(window) >= parallelism:
+            yield window.popleft().result()
+        window.append(pool.submit(finish, variant))
+    while window:
+        yield window.popleft().result()
+
+
+def render(vocals, accompaniment, sr, tempo=1.0, pitch=0, reverb_amount=0.0, vocals_gain=0, acc_gain=0,
+           parallelism=None, cache=transformed_stems):
+    """
+    Renders a remix from decoded stems sharing sample rate sr.
+    Reverb is applied to the vocals only. Stems are transformed in parallel
+    (see transform_stems) and only joined at the mix; tempo/pitch results
+    are memoized in `cache` so changing only reverb or gain skips the STFT work.
+    """
+    vocals, accompaniment = transform_stems(
+        [vocals, accompaniment], sr, tempo, pitch, parallelism, cache=cache)
+    return _finish(vocals, accompaniment, sr, reverb_amount, vocals_gain, acc_gain)
@@ -0,0 +1,170 @@
+# separation_cache.py
+"""
+Content-addressed cache of separated stems.
+
+Entries are keyed by a hash of the source file bytes plus the model name, so
+re-uploading a track (under any filename) reuses the stems from the first
+separation instead of running inference again. The cache is kept under a
+disk budget by evicting the least recently used entries.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import metrics
+
+logger = logging.getLogger("remixer-backend.cache")
+
+CACHE_DIR = os.environ.get('SEPARATION_CACHE_DIR', os.path.join('cache', 'separations'))
+CACHE_MAX_BYTES = int(os.environ.get('SEPARATION_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+# Marker file whose mtime records when an entry was last used.
+_LAST_USED = '.last_used'
+_READ_CHUNK = 1024 * 1024
+
+
+def file_digest(path):
+    """Returns a hashlib.sha256 object fed with the contents of path."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest
+
+
+def cache_key(digest, model_name):
+    """Combines a source-content hex digest and the model name into an entry key."""
+    return hashlib.sha256(f"{model_name}:{digest}".encode()).hexdigest()
+
+
+def _link_or_copy(src, dst):
+    # Hard links keep a cached stem and its materialized copies on the same
+    # inode, so a hit costs no extra disk space or copy time.
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class SeparationCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def key_for(self, audio_file_path, model_name):
+        return cache_key(file_digest(audio_file_path).hexdigest(), model_name)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        """Returns {file_name: path} for a cached entry, or None on a miss."""
+        entry = self._entry_dir(key)
+        stems = {}
+        if os.path.isdir(entry):
+            stems = {
+                name: os.path.join(entry, name)
+                for name in os.listdir(entry) if name != _LAST_USED
+            }
+        if not stems:
+            self.misses += 1
+            metrics.record_cache('separation', False)
+            return None
+        self._touch(entry)
+        self.hits += 1
+        metrics.record_cache('separation', True)
+        return stems
+
+    def materialize(self, key, dest_dir):
+        """Places the cached files for key into dest_dir. Returns {file_name: path}."""
+        stems = self.lookup(key)
+        if stems is None:
+            return None
+        os.makedirs(dest_dir, exist_ok=True)
+        placed = {}
+        for name, src in stems.items():
+            dst = os.path.join(dest_dir, name)
+            _link_or_copy(src, dst)
+            placed[name] = dst
+        return placed
+
+    def store(self, key, stem_paths):
+        """Adds the given stem files under key, then enforces the disk budget."""
+        entry = self._entry_dir(key)
+        if os.path.isdir(entry):
+            self._touch(entry)
+            return
+        # Build the entry under a temporary name and rename it into place so
+        # concurrent readers never see a half-written entry.
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        for src in stem_paths:
+            _link_or_copy(src, os.path.join(tmp, os.path.basename(src)))
+        self._touch(tmp)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another request stored the same content first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                entry = self._entry_dir(name)
+                if name.startswith('.tmp-') or not os.path.isdir(entry):
+                    continue
+                size = _dir_size(entry)
+                total += size
+                entries.append((self._last_used(entry), size, entry))
+            entries.sort()
+            for _, size, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                logger.info(f"Evicting separation cache entry {os.path.basename(entry)}")
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+            return total
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'max_bytes': self.max_bytes}
+
+    @staticmethod
+    def _touch(entry):
+        marker = os.path.join(entry, _LAST_USED)
+        with open(marker, 'a'):
+            pass
+        now = time.time()
+        os.utime(marker, (now, now))
+
+    @staticmethod
+    def _last_used(entry):
+        try:
+            return os.path.getmtime(os.path.join(entry, _LAST_USED))
+        except OSError:
+            return 0.0
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+# Shared by every request handled in this process.
+cache = SeparationCache()
@@ -0,0 +1,254 @@
+# separator_pool.py
+"""
+Process-wide registry of Spleeter separators.
+
+Building a Separator and running it for the first time constructs the
+TensorFlow graph and loads the model checkpoint. On short clips that costs
+more than the separation itself, so the pool does it once per process and
+hands the same warm instance to every request.
+
+Several stem layouts are available (2, 4 and 5 stems). Models are loaded
+on first use and stay resident while they fit in SEPARATOR_MEMORY_BUDGET_MB;
+loading another model evicts the least recently used idle ones first.
+
+The budget only counts the size of the models currently loaded. Evicting a
+model drops the pool's reference, but TensorFlow rarely returns graph and
+session memory to the OS, so the process RSS may not shrink. The pool
+checks RSS after evicting and logs a warning when it did not fall; size
+the container for every model that traffic may load, not for the budget.
+"""
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger("remixer-backend.separator")
+
+DEFAULT_MODEL = 'spleeter:2stems'
+
+# Stem layouts offered to clients: model name -> stems it produces, and a
+# rough resident size used until the real growth has been measured.
+MODELS = {
+    'spleeter:2stems': {'stems': ('vocals', 'accompaniment'), 'memory_mb': 600},
+    'spleeter:4stems': {'stems': ('vocals', 'drums', 'bass', 'other'), 'memory_mb': 1100},
+    'spleeter:5stems': {'stems': ('vocals', 'drums', 'bass', 'piano', 'other'), 'memory_mb': 1350},
+}
+
+# Warm the default model when a gunicorn worker boots (see gunicorn.conf.py).
+WARMUP_ON_BOOT = os.environ.get('SEPARATOR_WARMUP', '1') == '1'
+MEMORY_BUDGET_MB = int(os.environ.get('SEPARATOR_MEMORY_BUDGET_MB', '2048'))
+# Measured load growth further than this factor from a model's estimate is
+# taken to be allocations by other request threads, and the estimate is used.
+MEASURE_TOLERANCE = 2.0
+
+
+class UnknownModel(ValueError):
+    """Raised for a model name or stem count that is not in MODELS."""
+
+
+def resolve_model(stems=None, model=None):
+    """
+    Returns the model name for a request that asked for a stem count
+    (2, 4 or 5) and/or a model name; the default model if neither is given.
+    """
+    if model:
+        if model not in MODELS:
+            raise UnknownModel(f"Unknown model {model!r}; choose one of {sorted(MODELS)}")
+        return model
+    if stems in (None, ''):
+        return DEFAULT_MODEL
+    name = f"spleeter:{stems}stems"
+    if name not in MODELS:
+        counts = sorted(len(info['stems']) for info in MODELS.values())
+        raise UnknownModel(f"Unsupported stem count {stems!r}; choose one of {counts}")
+    return name
+
+
+def stem_names(model_name):
+    return MODELS[model_name]['stems']
+
+
+def _build_separator(model_name):
+    """Creates a Spleeter separator and forces graph/checkpoint loading."""
+    import numpy as np
+    from spleeter.separator import Separator
+    from spleeter.utils.logging import logger as spleeter_logger
+
+    # Spleeter can be very verbose; this reduces the log noise.
+    spleeter_logger.setLevel('ERROR')
+    # It will download the model on the first run.
+    separator = Separator(model_name)
+    # The TensorFlow graph is only built on the first separation, so run one
+    # on a second of silence to pay that cost up front.
+    separator.separate(np.zeros((44100, 2), dtype=np.float32))
+    return separator
+
+
+def _resident_bytes():
+    """Current RSS of this process, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SeparatorPool:
+    """
+    Keeps loaded separators per model name, evicting the least recently used
+    idle ones when a new model would exceed the memory budget.
+
+    Spleeter's TensorFlow predictor is not safe to drive from several threads
+    at once, so each model has its own lock held for the duration of a
+    separation. A model whose lock is held is never evicted.
+    """
+
+    def __init__(self, factory=None, memory_budget_mb=MEMORY_BUDGET_MB, measure=_resident_bytes):
+        self._factory = factory or _build_separator
+        self._budget = memory_budget_mb * 1024 * 1024
+        self._measure = measure
+        self._lock = threading.Lock()
+        # Loaded separators, least recently used first.
+        self._separators = OrderedDict()
+        self._memory = {}
+        self._model_locks = {}
+        self._stats = {}
+
+    def _model_lock(self, model_name):
+        with self._lock:
+            if model_name not in self._model_locks:
+                self._model_locks[model_name] = threading.Lock()
+                self._stats[model_name] = {
+                    'loaded': False,
+                    'load_seconds': None,
+                    'loaded_at': None,
+                    'memory_mb': None,
+                    'cold_requests': 0,
+                    'warm_requests': 0,
+                    'evictions': 0,
+                }
+            return self._model_locks[model_name]
+
+    def _estimate(self, model_name):
+        return MODELS.get(model_name, {}).get('memory_mb', 0) * 1024 * 1024
+
+    def _plausible(self, model_name, measured):
+        estimate = self._estimate(model_name)
+        return estimate / MEASURE_TOLERANCE <= measured <= estimate * MEASURE_TOLERANCE
+
+    def _make_room(self, model_name):
+        """Evicts idle models, least recently used first, until model_name fits the budget."""
+        needed = self._estimate(model_name)
+        with self._lock:
+            candidates = [name for name in self._separators if name != model_name]
+        evicted = 0
+        before = self._measure() if candidates else None
+        for victim in candidates:
+            with self._lock:
+                if sum(self._memory.values()) + needed <= self._budget:
+                    return
+            victim_lock = self._model_locks[victim]
+            # A model in use keeps its lock; skip it rather than wait.
+            if not victim_lock.acquire(blocking=False):
+                continue
+            try:
+                with self._lock:
+                    self._separators.pop(victim, None)
+                    freed = self._memory.pop(victim, 0)
+                    self._stats[victim].update(loaded=False, memory_mb=None)
+                    self._stats[victim]['evictions'] += 1
+                evicted += freed
+                logger.info(f"Evicted separator model {victim} (~{freed / 2**20:.0f} MB) to load {model_name}")
+            finally:
+                victim_lock.release()
+        gc.collect()
+        if evicted:
+            after = self._measure()
+            if before is not None and after is not None and before - after < evicted / 2:
+                logger.warning(f"RSS fell by {max(before - after, 0) / 2**20:.0f} MB after evicting "
+                               f"~{evicted / 2**20:.0f} MB of separator models; TensorFlow keeps freed memory, so "
+                               f"the process may use more than the {self._budget / 2**20:.0f} MB budget")
+        with self._lock:
+            used = sum(self._memory.values())
+        if used + needed > self._budget:
+            logger.warning(f"Loading {model_name} exceeds the separator memory budget "
+                           f"({(used + needed) / 2**20:.0f} of {self._budget / 2**20:.0f} MB); other models are busy")
+
+    def _load(self, model_name):
+        """Loads model_name if needed. Caller must hold the model lock."""
+        with self._lock:
+            if model_name in self._separators:
+                self._separators.move_to_end(model_name)
+                return False
+        self._make_room(model_name)
+        logger.info(f"Loading separator model {model_name}")
+        before = self._measure()
+        start = time.perf_counter()
+        separator = self._factory(model_name)
+        elapsed = time.perf_counter() - start
+        after = self._measure()
+        # Other request threads allocate and free while the model loads, so
+        # the RSS growth is only used when it is close to the estimate.
+        grown = after - before if before is not None and after is not None else 0
+        memory = grown if self._plausible(model_name, grown) else self._estimate(model_name)
+        with self._lock:
+            self._separators[model_name] = separator
+            self._memory[model_name] = memory
+            self._stats[model_name].update(
+                loaded=True, load_seconds=round(elapsed, 3), loaded_at=time.time(),
+                memory_mb=round(memory / 2**20, 1))
+        logger.info(f"Separator model {model_name} loaded in {elapsed:.2f}s (~{memory / 2**20:.0f} MB)")
+        return True
+
+    def warm_up(self, model_name=DEFAULT_MODEL):
+        """Loads model_name ahead of the first request."""
+        with self._model_lock(model_name):
+            self._load(model_name)
+
+    @contextmanager
+    def acquire(self, model_name=DEFAULT_MODEL):
+        """
+        Yields a ready separator for model_name, loading it on first use.
+        The separator is reserved for the caller until the block exits.
+        """
+        with self._model_lock(model_name):
+            cold = self._load(model_name)
+            with self._lock:
+                stats = self._stats[model_name]
+                if cold:
+                    stats['cold_requests'] += 1
+                else:
+                    stats['warm_requests'] += 1
+                separator = self._separators[model_name]
+            logger.info(f"Using {'cold' if cold else 'warm'} separator for {model_name}")
+            yield separator
+
+    def loaded(self):
+        """Names of the resident models, least recently used first."""
+        with self._lock:
+            return list(self._separators)
+
+    def stats(self):
+        """Returns load, memory and warm/cold usage counters per model."""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def memory(self):
+        """
+        Returns the memory budget and the estimated use of loaded models, in
+        MB, with the process RSS for comparison (None where unavailable).
+        """
+        resident = self._measure()
+        with self._lock:
+            return {
+                'budget_mb': round(self._budget / 2**20, 1),
+                'used_mb': round(sum(self._memory.values()) / 2**20, 1),
+                'resident_mb': round(resident / 2**20, 1) if resident is not None else None,
+            }
+
+
+# Shared by every request handled in this process.
+pool = SeparatorPool()
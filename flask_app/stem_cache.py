@@ -0,0 +1,83 @@
+# stem_cache.py
+"""
+In-memory cache of transformed stems.
+
+Remix sliders usually change one parameter at a time. Tempo/pitch output is
+cached by (stem content hash, tempo, pitch), so a reverb- or gain-only change
+reuses the stretched and shifted audio and only redoes the cheap stages.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+STEM_CACHE_MAX_MB = int(os.environ.get('STEM_CACHE_MAX_MB', '512'))
+
+
+def content_hash(y):
+    """Hashes an array's shape, dtype and contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{y.shape}{y.dtype}".encode())
+    digest.update(memoryview(y if y.flags.c_contiguous else y.copy()).cast('B'))
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that evicts least recently used entries beyond
+    max_bytes. Lookups are counted in the metrics under `name`, if given.
+    """
+
+    def __init__(self, max_bytes, name=None):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if self.name:
+            metrics.record_cache(self.name, entry is not None)
+        return None if entry is None else entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# Tempo/pitch-transformed stems shared by every remix in this process.
+transformed_stems = LRUCache(STEM_CACHE_MAX_MB * 1024 * 1024, name='transformed_stems')
@@ -0,0 +1,118 @@
+# stem_store.py
+"""
+Raw float32 copies of separated stems for zero-copy loading.
+
+Next to each stem WAV the separator writes <stem>.npy, a (channels, samples)
+float32 array, and <stem>.json with its sample rate. Remixes open the .npy
+with np.memmap instead of decoding the WAV, so loading a stem costs nothing
+up front and concurrent workers share the same page cache.
+"""
+import json
+import os
+
+import numpy as np
+
+import audio_io
+import metrics
+
+
+def npy_path(wav_path):
+    return os.path.splitext(wav_path)[0] + '.npy'
+
+
+def meta_path(wav_path):
+    return os.path.splitext(wav_path)[0] + '.json'
+
+
+def sidecar_paths(wav_path):
+    """The files written by write_npy for wav_path."""
+    return [npy_path(wav_path), meta_path(wav_path)]
+
+
+class NpyWriter:
+    """
+    Writes the .npy/.json pair of wav_path from float32 (channels, frames)
+    blocks as they are produced, typically alongside the encoder writing the
+    WAV itself, so the WAV never has to be decoded again. Frames beyond
+    `frames` are dropped and missing ones stay zero.
+    """
+
+    def __init__(self, wav_path, sample_rate, channels, frames):
+        self.array_path, self.info_path = npy_path(wav_path), meta_path(wav_path)
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self._tmp_path = self.array_path + '.tmp'
+        self._array = np.lib.format.open_memmap(self._tmp_path, mode='w+', dtype=np.float32, shape=(channels, frames))
+        self._start = 0
+
+    def write(self, block):
+        block = block[:, :max(self.frames - self._start, 0)]
+        # Match the 16-bit WAV, which clips at full scale.
+        np.clip(block, -1.0, 1.0, out=self._array[:, self._start:self._start + block.shape[1]])
+        self._start += block.shape[1]
+
+    def close(self):
+        self._array.flush()
+        self._array = None
+        # .npy.tmp -> .npy only once complete, so readers never map a partial file.
+        os.replace(self._tmp_path, self.array_path)
+        with open(self.info_path, 'w') as meta:
+            json.dump({'sample_rate': self.sample_rate}, meta)
+        return self.array_path
+
+    def abort(self):
+        self._array = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_array(wav_path, y, sample_rate):
+    """Writes the .npy/.json pair of wav_path from its audio, a (channels, samples) array, without decoding."""
+    with NpyWriter(wav_path, sample_rate, y.shape[0], y.shape[1]) as writer:
+        writer.write(y)
+    return writer.array_path
+
+
+def write_npy(wav_path):
+    """
+    Converts a stem WAV into its .npy/.json pair, block by block so memory
+    use stays flat. Does nothing if the pair already exists. Used where only
+    the WAV is at hand (e.g. cache entries from before the .npy copies).
+    """
+    array_path, info_path = npy_path(wav_path), meta_path(wav_path)
+    if os.path.exists(array_path) and os.path.exists(info_path):
+        return array_path
+    with metrics.stage('decode'):
+        return _write_npy(wav_path)
+
+
+def _write_npy(wav_path):
+    info = audio_io.probe(wav_path)
+    sample_rate = info['sample_rate']
+    frames = int(round(info['duration'] * sample_rate))
+    with NpyWriter(wav_path, sample_rate, info['channels'], frames) as writer:
+        for block in audio_io.iter_blocks(wav_path, sr=sample_rate, channels=info['channels']):
+            writer.write(block)
+    return writer.array_path
+
+
+def load(wav_path):
+    """
+    Returns (read-only memmap of shape (channels, samples), sample_rate) for
+    a stem WAV, or None if no .npy copy exists.
+    """
+    array_path, info_path = npy_path(wav_path), meta_path(wav_path)
+    if not (os.path.exists(array_path) and os.path.exists(info_path)):
+        return None
+    with open(info_path) as meta:
+        sample_rate = json.load(meta)['sample_rate']
+    return np.load(array_path, mmap_mode='r'), sample_rate
@@ -0,0 +1,98 @@
+import threading
+import time
+import unittest
+
+import metrics
+from admission import AdmissionController, Cost, Overloaded, remix_cost, separation_cost
+
+MB = 1024 * 1024
+
+
+class CostModelTestCase(unittest.TestCase):
+    def test_separation_cost_grows_with_duration_and_stems(self):
+        short, long = separation_cost(60), separation_cost(240)
+        self.assertAlmostEqual(long.seconds, 4 * short.seconds)
+        self.assertGreater(separation_cost(60, stems=5).seconds, short.seconds)
+
+    def test_chunked_separation_memory_is_bounded(self):
+        self.assertEqual(separation_cost(3600).memory_bytes, separation_cost(7200).memory_bytes)
+
+    def test_batched_separation_reserves_padded_audio(self):
+        # Clips shorter than a Spleeter segment (512 x 1024 samples, ~11.9s) occupy a whole one in a batch.
+        self.assertEqual(separation_cost(5).memory_bytes, separation_cost(10).memory_bytes)
+        self.assertLess(separation_cost(10).memory_bytes, separation_cost(13).memory_bytes)
+
+    def test_stretching_costs_more_than_mixing(self):
+        plain = remix_cost(180, [{'reverb': 0.3}])
+        stretched = remix_cost(180, [{'tempo': 1.2}])
+        self.assertGreater(stretched.seconds, plain.seconds)
+        self.assertAlmostEqual(remix_cost(180, [{'tempo': 1.2}] * 3).seconds, 3 * stretched.seconds)
+
+
+class AdmissionControllerTestCase(unittest.TestCase):
+    def test_backlog_budget_rejects_with_retry_after(self):
+        controller = AdmissionController(backlog_seconds=100, memory_bytes=1024 * MB, workers=2)
+        controller.reserve('separate', Cost(80, MB))
+        before = metrics.admission_rejections.value(kind='separate', reason='backlog')
+        with self.assertRaises(Overloaded) as raised:
+            controller.reserve('separate', Cost(60, MB))
+        self.assertEqual(raised.exception.reason, 'backlog')
+        # 40s over budget, drained by two workers.
+        self.assertEqual(raised.exception.retry_after, 20)
+        self.assertEqual(metrics.admission_rejections.value(kind='separate', reason='backlog'), before + 1)
+
+    def test_oversized_request_runs_alone(self):
+        controller = AdmissionController(backlog_seconds=10, memory_bytes=10 * MB)
+        ticket = controller.reserve('separate', Cost(50, 50 * MB))
+        ticket.start()
+        ticket.finish()
+        self.assertEqual(controller.state()['backlog_seconds'], 0)
+        self.assertEqual(controller.state()['memory_mb'], 0)
+
+    def test_waits_for_memory(self):
+        controller = AdmissionController(backlog_seconds=1000, memory_bytes=100 * MB)
+        first = controller.reserve('remix', Cost(1, 80 * MB))
+        first.start()
+        second = controller.reserve('remix', Cost(1, 50 * MB))
+        started = threading.Event()
+
+        def run():
+            second.start()
+            started.set()
+            second.finish()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.1)
+        self.assertFalse(started.is_set())
+        self.assertEqual(controller.state()['waiting'], 1)
+        first.finish()
+        thread.join(5)
+        self.assertTrue(started.is_set())
+        self.assertEqual(controller.state()['running'], 0)
+
+    def test_wait_queue_is_bounded(self):
+        controller = AdmissionController(backlog_seconds=1000, memory_bytes=100 * MB, max_waiting=0,
+                                         max_wait_seconds=0.1)
+        controller.reserve('remix', Cost(1, 80 * MB)).start()
+        rejected = []
+        guarded = controller.guard(controller.reserve('remix', Cost(1, 50 * MB)), lambda: ({}, 200),
+                                   on_reject=lambda: rejected.append(True))
+        payload, status = guarded()
+        self.assertEqual(status, 429)
+        self.assertIn('retry_after', payload)
+        self.assertEqual(rejected, [True])
+        # The rejected request gave back its backlog reservation.
+        self.assertEqual(controller.state()['backlog_seconds'], 1)
+
+    def test_guard_records_cost_accuracy(self):
+        controller = AdmissionController()
+        before = metrics.admission_cost_ratio.count(kind='test')
+        guarded = controller.guard(controller.reserve('test', Cost(0.01, MB)), lambda x: ({'x': x}, 200))
+        self.assertEqual(guarded(3), ({'x': 3}, 200))
+        self.assertEqual(metrics.admission_cost_ratio.count(kind='test'), before + 1)
+        self.assertEqual(controller.state()['running'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
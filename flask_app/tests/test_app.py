@@ -1,7 +1,15 @@
 import io
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import patch
-from flask_app.app import app
+from unittest.mock import Mock, patch
+from flask_app.app import app, UPLOAD_FOLDER
+from jobs import QueueFull
+import numpy as np
+import stem_store
 
 class AppTestCase(unittest.TestCase):
     def setUp(self):
@@ -43,6 +51,101 @@ class AppTestCase(unittest.TestCase):
         response = self.app.post('/process', data='notjson', content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_raw_upload_rejects_unsafe_filename(self):
+        for params in ({'filename': '..'}, {'filename': '../..'}):
+            response = self.app.post('/upload', query_string=params, data=b'audio',
+                                     content_type='application/octet-stream')
+            self.assertEqual(response.status_code, 400)
+        response = self.app.post('/upload', data=b'audio', content_type='application/octet-stream',
+                                 headers={'X-Filename': '/'})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('flask_app.app.job_queue.submit', side_effect=QueueFull('full'))
+    def test_rejected_upload_is_discarded(self, mock_submit):
+        response = self.app.post('/upload', query_string={'filename': '../rejected.mp3', 'async': '1'},
+                                 data=b'audio', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'rejected.mp3')))
+        self.assertFalse(os.path.exists(os.path.join(os.pardir, 'rejected.mp3')))
+
+    def test_inline_work_is_capped(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow_remix(*args, **kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return None
+
+        stems = {'vocals_path': 'song/vocals.wav', 'accompaniment_path': 'song/accompaniment.wav'}
+        with patch('flask_app.app.inline_work', threading.BoundedSemaphore(1)), \
+                patch('flask_app.app.process_remix', side_effect=slow_remix):
+            threads = [threading.Thread(target=lambda: app.test_client().post('/process', json=stems))
+                       for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(peak[0], 1)
+
+    def test_batch_rejects_malformed_variants(self):
+        stems = {'vocals_path': 'song/vocals.wav', 'accompaniment_path': 'song/accompaniment.wav'}
+        for variants in (['fast'], [{'tempo': 'fast'}], [{'pitch': None}], [{}, {'reverb': 'nan'}]):
+            response = self.app.post('/process_batch', json=dict(stems, variants=variants))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(b'Variant', response.data)
+
+    @patch('flask_app.app.job_queue.get')
+    def test_rejected_job_result_has_retry_after(self, mock_get):
+        mock_get.return_value = Mock(done=True, status_code=429, result={'error': 'busy', 'retry_after': 7})
+        response = self.app.get('/jobs/abc/result')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '7')
+
+    def test_preview_rejects_bad_offset(self):
+        stems = {'vocals_path': 'song/vocals.wav', 'accompaniment_path': 'song/accompaniment.wav'}
+        for offset in (-1, 'nan', 'soon'):
+            response = self.app.post('/preview', json=dict(stems, offset=offset))
+            self.assertEqual(response.status_code, 400)
+
+    def test_preview_rejects_bad_duration(self):
+        stems = {'vocals_path': 'song/vocals.wav', 'accompaniment_path': 'song/accompaniment.wav'}
+        for duration in (0, -5, 'nan'):
+            response = self.app.post('/preview', json=dict(stems, duration=duration))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(b'duration', response.data)
+
+    def test_preview_rejects_bad_settings(self):
+        stems = {'vocals_path': 'song/vocals.wav', 'accompaniment_path': 'song/accompaniment.wav'}
+        for settings in ({'tempo': 0}, {'tempo': -1}, {'tempo': 'nan'}, {'tempo': 'fast'}, {'pitch': 'inf'},
+                         {'pitch': None}, {'reverb': 1.5}, {'reverb': -0.1}):
+            response = self.app.post('/preview', json=dict(stems, **settings))
+            self.assertEqual(response.status_code, 400, settings)
+
+    def test_preview_rejects_offset_past_the_end(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stems = {}
+            for name in ('vocals', 'accompaniment'):
+                # A one-second stem with its .npy copy, so its length is known without decoding.
+                wav = os.path.join(tmp, f"{name}.wav")
+                open(wav, 'wb').close()
+                np.save(stem_store.npy_path(wav), np.zeros((2, 44100), dtype=np.float32))
+                with open(stem_store.meta_path(wav), 'w') as f:
+                    json.dump({'sample_rate': 44100}, f)
+                stems[f"{name}_path"] = wav
+            response = self.app.post('/preview', json=dict(stems, offset=1.5))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(b'past the end', response.data)
+            # At half speed the remix lasts two seconds.
+            with patch('flask_app.app.render_preview', return_value=b'ogg') as render:
+                response = self.app.post('/preview', json=dict(stems, offset=1.5, tempo=0.5))
+            self.assertEqual(response.status_code, 200)
+            render.assert_called_once()
+
     def test_process_url_no_url(self):
         response = self.app.post('/process_url', json={})
         self.assertEqual(response.status_code, 400)
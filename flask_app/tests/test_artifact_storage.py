@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from flask import Flask
+
+from artifact_storage import LocalStorage, ObjectStorage, key_for
+
+
+class FakeS3Client:
+    """The subset of the boto3 S3 client used by ObjectStorage, backed by a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = (f.read(), ExtraArgs)
+        self.uploads += 1
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return (f"https://storage.example/{Params['Bucket']}/{Params['Key']}"
+                f"?expires={ExpiresIn}&disposition={Params['ResponseContentDisposition']}")
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.makedirs(os.path.join('output', 'song'))
+        self.path = os.path.join('output', 'song', 'vocals.wav')
+        with open(self.path, 'wb') as f:
+            f.write(b'RIFF' + b'\0' * 100)
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_key_is_relative_to_working_directory(self):
+        self.assertEqual(key_for(self.path), 'output/song/vocals.wav')
+        with self.assertRaises(ValueError):
+            key_for(os.path.join(self.tmp, os.pardir, 'elsewhere.wav'))
+
+    def test_local_sends_file(self):
+        with self.app.test_request_context():
+            response = LocalStorage(accel_prefix='').download(self.path)
+            response.direct_passthrough = False
+            self.assertEqual(response.get_data(), b'RIFF' + b'\0' * 100)
+            self.assertIn('attachment', response.headers['Content-Disposition'])
+
+    def test_local_answers_ranges_and_revalidation(self):
+        storage = LocalStorage(accel_prefix='')
+        with self.app.test_request_context(headers={'Range': 'bytes=4-9'}):
+            response = storage.download(self.path, etag='abc')
+            response.direct_passthrough = False
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.get_data(), b'\0' * 6)
+        with self.app.test_request_context(headers={'If-None-Match': '"abc"'}):
+            self.assertEqual(storage.download(self.path, etag='abc').status_code, 304)
+
+    def test_local_x_accel_redirect(self):
+        with self.app.test_request_context():
+            response = LocalStorage(accel_prefix='/protected').download(self.path)
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/protected/output/song/vocals.wav')
+        self.assertEqual(response.get_data(), b'')
+        self.assertIn('filename="vocals.wav"', response.headers['Content-Disposition'])
+        self.assertIn('audio/', response.headers['Content-Type'])
+
+    def test_object_storage_redirects_to_presigned_url(self):
+        client = FakeS3Client()
+        storage = ObjectStorage(bucket='stems', prefix='prod/', client=client, expires_seconds=600)
+        with self.app.test_request_context():
+            response = storage.download(self.path)
+        self.assertEqual(response.status_code, 302)
+        location = urlparse(response.headers['Location'])
+        self.assertEqual(location.path, '/stems/prod/output/song/vocals.wav')
+        self.assertEqual(parse_qs(location.query)['expires'], ['600'])
+        body, extra = client.objects[('stems', 'prod/output/song/vocals.wav')]
+        self.assertEqual(body, b'RIFF' + b'\0' * 100)
+        self.assertIn('audio/', extra['ContentType'])
+
+    def test_object_storage_uploads_each_version_once(self):
+        client = FakeS3Client()
+        storage = ObjectStorage(bucket='stems', client=client)
+        storage.put(self.path)
+        storage.put(self.path)
+        self.assertEqual(client.uploads, 1)
+        with open(self.path, 'ab') as f:
+            f.write(b'more')
+        storage.put(self.path)
+        self.assertEqual(client.uploads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
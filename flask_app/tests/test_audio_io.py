@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import audio_io
+
+SR = 22050
+
+
+@unittest.skipUnless(shutil.which(audio_io.FFMPEG) and shutil.which(audio_io.FFPROBE), 'ffmpeg is not installed')
+class AudioIOTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        t = np.arange(SR * 2) / SR
+        self.audio = np.stack([0.5 * np.sin(2 * np.pi * 440 * t), 0.25 * np.sin(2 * np.pi * 220 * t)]).astype(np.float32)
+        self.wav = os.path.join(self.tmp, 'tone.wav')
+        audio_io.save(self.wav, self.audio, SR)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_probe(self):
+        info = audio_io.probe(self.wav)
+        self.assertEqual(info['sample_rate'], SR)
+        self.assertEqual(info['channels'], 2)
+        self.assertAlmostEqual(info['duration'], 2.0, places=2)
+
+    def test_round_trip(self):
+        y, sr = audio_io.load(self.wav, sr=SR)
+        self.assertEqual(sr, SR)
+        self.assertEqual(y.dtype, np.float32)
+        self.assertEqual(y.shape, self.audio.shape)
+        # 16-bit PCM quantization.
+        np.testing.assert_allclose(y, self.audio, atol=1e-4)
+
+    def test_excerpt_resample_and_downmix(self):
+        y, sr = audio_io.load(self.wav, sr=SR // 2, channels=1, offset=0.5, duration=1.0)
+        self.assertEqual(sr, SR // 2)
+        self.assertEqual(y.shape[0], 1)
+        self.assertAlmostEqual(y.shape[1], SR // 2, delta=32)
+
+    def test_encode_compressed(self):
+        data = audio_io.encode(self.audio, SR, 'ogg')
+        self.assertTrue(data.startswith(b'OggS'))
+        with self.assertRaises(ValueError):
+            audio_io.encode(self.audio, SR, 'xyz')
+
+    def test_decode_error(self):
+        bogus = os.path.join(self.tmp, 'bogus.wav')
+        with open(bogus, 'wb') as f:
+            f.write(b'not audio')
+        with self.assertRaises(audio_io.AudioIOError):
+            audio_io.load(bogus)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import audio_io
+import remix_engine
+from audio_processor import PREVIEW_SAMPLE_RATE, render_preview
+from stem_cache import transformed_stems
+
+SR = 44100
+SECONDS = 12
+
+
+@unittest.skipUnless(shutil.which(audio_io.FFMPEG), 'ffmpeg is not installed')
+class PreviewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # A ramp whose value gives the time it was taken from: t / 24.
+        ramp = np.arange(SR * SECONDS, dtype=np.float32) / SR / 24
+        self.vocals = os.path.join(self.tmp, 'vocals.wav')
+        self.accompaniment = os.path.join(self.tmp, 'accompaniment.wav')
+        audio_io.save(self.vocals, np.stack([ramp, ramp]), SR)
+        audio_io.save(self.accompaniment, np.zeros((2, SR * SECONDS), dtype=np.float32), SR)
+        patcher = patch.object(remix_engine, 'encode', side_effect=lambda y, sr, fmt: (y, sr))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_excerpt_starts_at_offset_after_preroll(self):
+        excerpt, sr = render_preview(self.vocals, self.accompaniment, offset=5, duration=2)
+        self.assertEqual(sr, PREVIEW_SAMPLE_RATE)
+        self.assertEqual(excerpt.shape, (2, 2 * PREVIEW_SAMPLE_RATE))
+        # The second of pre-roll decoded before the offset is not part of the excerpt.
+        self.assertAlmostEqual(float(excerpt[0, 0]), 5 / 24, delta=5e-3)
+        self.assertAlmostEqual(float(excerpt[0, -1]), 7 / 24, delta=5e-3)
+
+    def test_excerpt_length_is_in_remix_time(self):
+        stats = transformed_stems.stats()
+        excerpt, sr = render_preview(self.vocals, self.accompaniment, tempo=2.0, offset=2, duration=3)
+        self.assertEqual(excerpt.shape, (2, 3 * sr))
+        # Excerpts never reach the transformed-stem cache.
+        self.assertEqual(transformed_stems.stats(), stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
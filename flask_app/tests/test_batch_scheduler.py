@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from batch_scheduler import BatchScheduler, pack
+from separator_pool import SeparatorPool
+
+
+class RecordingSeparator:
+    """Halves the input into "vocals" and records the length of each call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def separate(self, waveform):
+        self.calls.append(len(waveform))
+        return {'vocals': waveform * 0.5, 'accompaniment': waveform * 0.5}
+
+
+class FailingSeparator:
+    def separate(self, waveform):
+        raise RuntimeError("model failed")
+
+
+def run_concurrently(scheduler, waveforms):
+    results = [None] * len(waveforms)
+    errors = [None] * len(waveforms)
+
+    def run(i):
+        try:
+            results[i] = scheduler.separate('spleeter:2stems', waveforms[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(waveforms))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+class BatchSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.waveforms = [rng.standard_normal((n, 2)).astype(np.float32) for n in (1000, 2500, 700, 1800, 1200)]
+
+    def make_scheduler(self, separator, **kwargs):
+        return BatchScheduler(SeparatorPool(factory=lambda name: separator), align=1024, **kwargs)
+
+    def test_pack_aligns_and_separates_waveforms(self):
+        packed, offsets = pack(self.waveforms[:3], align=1024, guard=256)
+        self.assertEqual(offsets, [0, 2048, 5120])
+        self.assertEqual(len(packed), 6144)
+        np.testing.assert_array_equal(packed[2048:4548], self.waveforms[1])
+        self.assertFalse(packed[1000:2048].any())
+
+    def test_concurrent_requests_share_a_forward_pass(self):
+        separator = RecordingSeparator()
+        scheduler = self.make_scheduler(separator, window_seconds=2.0, max_batch=3)
+        results, errors = run_concurrently(scheduler, self.waveforms[:3])
+        self.assertEqual(errors, [None] * 3)
+        self.assertEqual(len(separator.calls), 1)
+        for waveform, result in zip(self.waveforms, results):
+            np.testing.assert_array_equal(result['vocals'], waveform * 0.5)
+            np.testing.assert_array_equal(result['accompaniment'], waveform * 0.5)
+
+    def test_batches_are_capped(self):
+        separator = RecordingSeparator()
+        scheduler = self.make_scheduler(separator, window_seconds=0.5, max_batch=2)
+        results, errors = run_concurrently(scheduler, self.waveforms)
+        self.assertEqual(errors, [None] * 5)
+        self.assertGreaterEqual(len(separator.calls), 3)
+        for waveform, result in zip(self.waveforms, results):
+            self.assertEqual(result['vocals'].shape, waveform.shape)
+            np.testing.assert_array_equal(result['vocals'], waveform * 0.5)
+
+    def test_batches_are_capped_by_packed_length(self):
+        separator = RecordingSeparator()
+        scheduler = self.make_scheduler(separator, window_seconds=1.0, max_batch=8, max_samples=13000)
+        long = np.ones((20000, 2), dtype=np.float32)
+        results, errors = run_concurrently(scheduler, self.waveforms + [long])
+        self.assertEqual(errors, [None] * 6)
+        # A waveform longer than the budget runs alone; every other pass stays within it.
+        self.assertIn(20000, separator.calls)
+        self.assertTrue(all(length <= 13000 for length in separator.calls if length != 20000))
+        for waveform, result in zip(self.waveforms + [long], results):
+            np.testing.assert_array_equal(result['vocals'], waveform * 0.5)
+
+    def test_request_that_fills_the_budget_does_not_wait(self):
+        separator = RecordingSeparator()
+        scheduler = self.make_scheduler(separator, window_seconds=5.0, max_batch=4, max_samples=13000)
+        # Over the budget, and short of it by less than one aligned segment.
+        for length in (20000, 8000):
+            started = time.monotonic()
+            scheduler.separate('spleeter:2stems', np.ones((length, 2), dtype=np.float32))
+            self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(separator.calls, [20000, 8000])
+
+    def test_single_request_is_separated_directly(self):
+        separator = RecordingSeparator()
+        scheduler = self.make_scheduler(separator, window_seconds=0.0, max_batch=4)
+        result = scheduler.model('spleeter:2stems').separate(self.waveforms[0])
+        self.assertEqual(separator.calls, [1000])
+        np.testing.assert_array_equal(result['vocals'], self.waveforms[0] * 0.5)
+
+    def test_errors_reach_every_caller(self):
+        scheduler = self.make_scheduler(FailingSeparator(), window_seconds=0.5, max_batch=3)
+        _, errors = run_concurrently(scheduler, self.waveforms[:3])
+        for error in errors:
+            self.assertIsInstance(error, RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
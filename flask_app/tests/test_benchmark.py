@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import benchmark
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_synthetic_track_is_deterministic(self):
+        a = benchmark.synthetic_track(1, 2, sr=8000)
+        b = benchmark.synthetic_track(1, 2, sr=8000)
+        self.assertEqual(a.shape, (2, 8000))
+        self.assertEqual(a.dtype, np.float32)
+        np.testing.assert_array_equal(a, b)
+        self.assertEqual(benchmark.synthetic_track(1, 1, sr=8000).shape, (1, 8000))
+
+    def test_stub_separator_stems_sum_to_input(self):
+        waveform = benchmark.synthetic_track(1, 2, sr=8000).T
+        stems = benchmark.StubSeparator().separate(waveform)
+        self.assertEqual(set(stems), {'vocals', 'accompaniment'})
+        np.testing.assert_allclose(stems['vocals'] + stems['accompaniment'], waveform, atol=1e-6)
+
+    def test_compare_flags_only_regressions_beyond_tolerance(self):
+        baseline = {
+            'a': {'throughput': 10.0},
+            'b': {'throughput': 10.0},
+            'c': {'throughput': 10.0},
+        }
+        results = {
+            'a': {'throughput': 8.5},   # -15%: within tolerance
+            'b': {'throughput': 7.0},   # -30%: regression
+            'c': {'throughput': 20.0},  # faster
+            'd': {'throughput': 1.0},   # not in the baseline
+        }
+        regressions = benchmark.compare(results, baseline, tolerance=0.2)
+        self.assertEqual([r[0] for r in regressions], ['b'])
+        self.assertAlmostEqual(regressions[0][3], -0.3)
+
+    def test_missing_baseline_fails_before_running(self):
+        with tempfile.TemporaryDirectory() as tmp, patch.object(benchmark, 'Benchmark') as bench:
+            missing = os.path.join(tmp, 'baseline.json')
+            self.assertEqual(benchmark.main(['--model', 'stub', '--baseline', missing]), 2)
+            bench.assert_not_called()
+            bench.return_value.results = {}
+            args = ['--model', 'stub', '--baseline', missing, '--lengths', '1', '--channels', '1']
+            self.assertEqual(benchmark.main(args + ['--allow-missing-baseline']), 0)
+            self.assertEqual(benchmark.main(args + ['--save-baseline']), 0)
+            self.assertTrue(os.path.exists(missing))
+            self.assertEqual(benchmark.main(args), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import audio_io
+import stem_store
+from chunked_separation import iter_windows, separate_to_file_chunked, separate_windows, stitch
+
+SR = 8000
+
+
+def fake_separate(waveform):
+    """Stand-in model: a smoothing filter whose output is wrong near window edges."""
+    kernel = np.hanning(65)
+    kernel /= kernel.sum()
+    smooth = np.stack([np.convolve(ch, kernel, mode='same') for ch in waveform.T], axis=1)
+    return {'vocals': smooth, 'accompaniment': waveform - smooth}
+
+
+def run_chunked(audio, window, overlap, parallelism=1):
+    out = {}
+    stitch(
+        separate_windows(lambda start, length: audio[start:start + length], fake_separate,
+                         len(audio), window, overlap, parallelism),
+        overlap,
+        lambda name, frames: out.setdefault(name, []).append(frames))
+    return {name: np.concatenate(parts) for name, parts in out.items()}
+
+
+class ChunkedSeparationTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        t = np.arange(SR * 10) / SR
+        tone = 0.5 * np.sin(2 * np.pi * 220 * t)
+        self.audio = np.stack([tone, tone], axis=1) + 0.05 * rng.standard_normal((len(t), 2))
+
+    def test_windows_cover_track(self):
+        windows = list(iter_windows(1000, 300, 50))
+        self.assertEqual(windows[0], (0, 300))
+        self.assertEqual(sum(length for _, length in windows) - 50 * (len(windows) - 1), 1000)
+        self.assertEqual(windows[-1][0] + windows[-1][1], 1000)
+        self.assertGreater(windows[-1][1], 50)
+
+    def test_overlap_must_be_shorter_than_window(self):
+        with self.assertRaises(ValueError):
+            list(iter_windows(1000, 100, 100))
+
+    def test_seams_match_full_track_separation(self):
+        full = fake_separate(self.audio)
+        chunked = run_chunked(self.audio, window=2 * SR, overlap=SR // 4)
+        for name in full:
+            self.assertEqual(chunked[name].shape, full[name].shape)
+            # Ignore the track edges, where both versions see the same boundary.
+            error = np.abs(chunked[name] - full[name])[64:-64]
+            self.assertLess(error.max(), 0.01)
+
+    def test_parallel_matches_serial(self):
+        serial = run_chunked(self.audio, window=2 * SR, overlap=SR // 4)
+        parallel = run_chunked(self.audio, window=2 * SR, overlap=SR // 4, parallelism=3)
+        for name in serial:
+            np.testing.assert_array_equal(serial[name], parallel[name])
+
+    @unittest.skipUnless(shutil.which(audio_io.FFMPEG), 'ffmpeg is not installed')
+    def test_writes_npy_copies_without_decoding(self):
+        audio = 0.5 * self.audio.astype(np.float32)
+        separator = type('Separator', (), {'separate': staticmethod(fake_separate)})()
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(stem_store.audio_io, 'iter_blocks', side_effect=AssertionError('decoded a stem')):
+            paths = separate_to_file_chunked(separator, os.path.join(tmp, 'song.mp3'), tmp, sample_rate=SR,
+                                             chunk_seconds=2, overlap_seconds=0.25, decoded=audio)
+            expected = run_chunked(audio, window=2 * SR, overlap=SR // 4)
+            for name, path in paths.items():
+                stored, sr = stem_store.load(path)
+                self.assertEqual(sr, SR)
+                np.testing.assert_allclose(stored, np.clip(expected[name].T, -1.0, 1.0), atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import unittest
+from jobs import JobQueue, QueueFull, FINISHED, FAILED
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.queue = JobQueue(max_workers=1, max_pending=2, history=10)
+
+    def wait(self, job):
+        for _ in range(200):
+            if job.done:
+                return
+            threading.Event().wait(0.01)
+        self.fail(f"job {job.id} did not finish")
+
+    def test_job_result(self):
+        job = self.queue.submit('test', lambda x: ({'value': x}, 200), 3)
+        self.wait(job)
+        self.assertEqual(job.status, FINISHED)
+        self.assertEqual(job.result, {'value': 3})
+        self.assertIs(self.queue.get(job.id), job)
+
+    def test_error_status_marks_job_failed(self):
+        job = self.queue.submit('test', lambda: ({'error': 'bad'}, 500))
+        self.wait(job)
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.status_code, 500)
+
+    def test_exception_marks_job_failed(self):
+        def boom():
+            raise RuntimeError('boom')
+        job = self.queue.submit('test', boom)
+        self.wait(job)
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.result, {'error': 'boom'})
+
+    def test_queue_limit(self):
+        release = threading.Event()
+        first = self.queue.submit('test', lambda: (release.wait(), ({}, 200))[1])
+        second = self.queue.submit('test', lambda: ({}, 200))
+        with self.assertRaises(QueueFull):
+            self.queue.submit('test', lambda: ({}, 200))
+        release.set()
+        self.wait(first)
+        self.wait(second)
+
+
+if __name__ == '__main__':
+    unittest.main()
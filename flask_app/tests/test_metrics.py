@@ -0,0 +1,52 @@
+import unittest
+import metrics
+from stem_cache import LRUCache
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram_render(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.', ['stage'], buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage='mix')
+        histogram.observe(0.5, stage='mix')
+        histogram.observe(5.0, stage='mix')
+        lines = histogram.render()
+        self.assertEqual(lines[:2], ['# HELP test_seconds Test histogram.', '# TYPE test_seconds histogram'])
+        self.assertIn('test_seconds_bucket{stage="mix",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="mix",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="mix",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{stage="mix"} 5.55', lines)
+        self.assertIn('test_seconds_count{stage="mix"} 3', lines)
+
+    def test_counter_labels(self):
+        counter = metrics.Counter('test_total', 'Test counter.', ['result'])
+        counter.inc(result='hit')
+        counter.inc(2, result='hit')
+        self.assertEqual(counter.value(result='hit'), 3)
+        self.assertIn('test_total{result="hit"} 3', counter.render())
+        with self.assertRaises(ValueError):
+            counter.inc(outcome='hit')
+
+    def test_stage_records_duration(self):
+        before = metrics.stage_seconds.count(stage='mix')
+        with metrics.stage('mix'):
+            pass
+        self.assertEqual(metrics.stage_seconds.count(stage='mix'), before + 1)
+
+    def test_named_cache_counts_lookups(self):
+        cache = LRUCache(1024, name='test_cache')
+        cache.get('a')
+        cache.put('a', 1, 8)
+        cache.get('a')
+        self.assertEqual(metrics.cache_requests.value(cache='test_cache', result='miss'), 1)
+        self.assertEqual(metrics.cache_requests.value(cache='test_cache', result='hit'), 1)
+
+    def test_registry_render(self):
+        text = metrics.registry.render()
+        self.assertIn('# TYPE remixer_stage_seconds histogram', text)
+        self.assertIn('# TYPE remixer_cache_requests_total counter', text)
+        self.assertIn('remixer_peak_rss_bytes ', text)
+        self.assertTrue(text.endswith('\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import workspace
+from output_store import OutputStore
+
+HOUR = 3600
+
+
+def make_entry(root, name, size, age, now):
+    """Creates a stem-folder-like entry of `size` bytes last written `age` seconds before now."""
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    file_path = os.path.join(path, 'vocals.wav')
+    with open(file_path, 'wb') as f:
+        f.write(b'\0' * size)
+    for p in (file_path, path):
+        os.utime(p, (now - age, now - age))
+    return path
+
+
+class OutputStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_expired_entries_are_removed(self):
+        store = OutputStore(self.root, ttl_seconds=24 * HOUR, min_age_seconds=HOUR)
+        make_entry(self.root, 'old', 10, 30 * HOUR, self.now)
+        make_entry(self.root, 'fresh', 10, 2 * HOUR, self.now)
+        removed = store.collect(self.now)
+        self.assertEqual([os.path.basename(path) for path in removed], ['old'])
+        self.assertEqual(os.listdir(self.root), ['fresh'])
+
+    def test_quota_evicts_least_recently_used(self):
+        store = OutputStore(self.root, ttl_seconds=None, max_bytes=250, min_age_seconds=HOUR)
+        for name, age in (('a', 5 * HOUR), ('b', 4 * HOUR), ('c', 3 * HOUR)):
+            make_entry(self.root, name, 100, age, self.now)
+        store.collect(self.now)
+        self.assertEqual(sorted(os.listdir(self.root)), ['b', 'c'])
+
+    def test_recently_used_entries_survive_quota(self):
+        store = OutputStore(self.root, ttl_seconds=None, max_bytes=50, min_age_seconds=HOUR)
+        make_entry(self.root, 'a', 100, 10, self.now)
+        make_entry(self.root, 'b', 100, 20, self.now)
+        self.assertEqual(store.collect(self.now), [])
+        self.assertEqual(store.usage(), 200)
+
+    def test_touch_defers_expiry(self):
+        store = OutputStore(self.root, ttl_seconds=24 * HOUR, min_age_seconds=HOUR)
+        path = make_entry(self.root, 'song', 10, 30 * HOUR, self.now)
+        store.touch(os.path.join(path, 'vocals.wav'))
+        self.assertEqual(store.collect(), [])
+        # Paths outside the store are ignored.
+        store.touch(os.path.join(tempfile.gettempdir(), 'elsewhere.wav'))
+
+    def test_touch_keeps_file_mtimes(self):
+        store = OutputStore(self.root, ttl_seconds=24 * HOUR, min_age_seconds=HOUR)
+        folder = make_entry(self.root, 'song', 10, 30 * HOUR, self.now)
+        upload = os.path.join(self.root, 'upload.wav')
+        with open(upload, 'wb') as f:
+            f.write(b'\0' * 10)
+        os.utime(upload, (self.now - 30 * HOUR, self.now - 30 * HOUR))
+        paths = [folder, os.path.join(folder, 'vocals.wav'), upload]
+        before = [os.stat(path).st_mtime_ns for path in paths]
+        store.touch(os.path.join(folder, 'vocals.wav'))
+        store.touch(upload)
+        self.assertEqual([os.stat(path).st_mtime_ns for path in paths], before)
+        self.assertEqual(sorted(os.path.basename(path) for path, _, _ in store.entries()), ['song', 'upload.wav'])
+        self.assertEqual(store.collect(), [])
+
+    def test_markers_go_with_their_entries(self):
+        store = OutputStore(self.root, ttl_seconds=24 * HOUR, min_age_seconds=0)
+        old = make_entry(self.root, 'old', 10, 30 * HOUR, self.now)
+        gone = make_entry(self.root, 'gone', 10, 2 * HOUR, self.now)
+        store.touch(old)
+        store.touch(gone)
+        shutil.rmtree(gone)
+        # Expired by the clock passed in, despite the touch.
+        self.assertEqual(store.collect(self.now + 48 * HOUR), [old])
+        self.assertEqual(os.listdir(os.path.join(self.root, '.access')), [])
+
+
+class WorkspaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        patcher = patch.object(workspace, 'SCRATCH_DIR', os.path.join(self.tmp, 'scratch'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_scratch_is_private_and_removed(self):
+        with workspace.scratch() as first, workspace.scratch() as second:
+            self.assertNotEqual(first, second)
+            with open(os.path.join(first, 'remix.wav'), 'wb') as f:
+                f.write(b'data')
+        self.assertEqual(os.listdir(workspace.SCRATCH_DIR), [])
+
+    def test_publish_replaces_destination(self):
+        dest = os.path.join(self.tmp, 'output', 'song', 'remix.wav')
+        os.makedirs(os.path.dirname(dest))
+        with open(dest, 'wb') as f:
+            f.write(b'old')
+        with workspace.scratch() as scratch_dir:
+            src = os.path.join(scratch_dir, 'remix.wav')
+            with open(src, 'wb') as f:
+                f.write(b'new')
+            workspace.publish(src, dest)
+            self.assertFalse(os.path.exists(src))
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+
+    def test_publish_copies_across_filesystems(self):
+        src = workspace.scratch_file('.wav')
+        with open(src, 'wb') as f:
+            f.write(b'data')
+        dest = os.path.join(self.tmp, 'out.wav')
+        real_replace = os.replace
+
+        def cross_device(a, b):
+            if a == src:
+                raise OSError(18, 'Invalid cross-device link')
+            return real_replace(a, b)
+
+        with patch('workspace.os.replace', side_effect=cross_device):
+            workspace.publish(src, dest)
+        self.assertFalse(os.path.exists(src))
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['out.wav', 'scratch'])
+
+
+if __name__ == '__main__':
+    unittest.main()
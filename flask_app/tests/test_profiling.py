@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask, jsonify
+import profiling
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/work')
+    def work():
+        data = [bytearray(1024) for _ in range(100)]
+        return jsonify({'blocks': len(data)})
+
+    return app
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.original_dir = profiling.PROFILE_DIR
+        profiling.PROFILE_DIR = self.tmp
+
+    def tearDown(self):
+        profiling.PROFILE_DIR = self.original_dir
+        shutil.rmtree(self.tmp)
+
+    def test_disabled_registers_no_hooks(self):
+        app = make_app()
+        self.assertFalse(profiling.install(app, enabled=False))
+        self.assertEqual(app.before_request_funcs, {})
+        self.assertEqual(app.teardown_request_funcs, {})
+
+    def test_profiles_only_flagged_requests(self):
+        app = make_app()
+        self.assertTrue(profiling.install(app, enabled=True))
+        client = app.test_client()
+        response = client.get('/work')
+        self.assertNotIn(profiling.REQUEST_ID_HEADER, response.headers)
+        self.assertEqual(os.listdir(self.tmp), [])
+
+        response = client.get('/work', headers={'X-Profile': '1', 'X-Request-ID': 'abc123'})
+        self.assertEqual(response.headers[profiling.REQUEST_ID_HEADER], 'abc123')
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['abc123.prof', 'abc123.txt'])
+        with open(os.path.join(self.tmp, 'abc123.txt')) as f:
+            report = f.read()
+        self.assertIn('GET /work', report)
+        self.assertIn('allocation sites', report)
+
+    def test_query_flag_and_generated_id(self):
+        app = make_app()
+        profiling.install(app, enabled=True)
+        response = app.test_client().get('/work?profile=1')
+        request_id = response.headers[profiling.REQUEST_ID_HEADER]
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, request_id + '.txt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import threading
+import unittest
+import progress
+from jobs import JobQueue, Job, FINISHED
+
+
+def parse(message):
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+class ProgressTestCase(unittest.TestCase):
+    def test_report_outside_job_is_noop(self):
+        progress.report('download', 0.5)
+
+    def test_report_inside_bound_job(self):
+        job = Job('test')
+        with progress.bind(job):
+            progress.report('separation', 0.5, window=1, windows=2)
+        self.assertEqual(job.progress, {'stage': 'separation', 'fraction': 0.5, 'window': 1, 'windows': 2})
+
+    def test_updates_within_stage_are_coalesced(self):
+        job = Job('test')
+        job.set_progress('download', 0.0)
+        version = job.version
+        for i in range(1, 50):
+            job.set_progress('download', i / 100)
+        # Latest value is always kept even when watchers are not woken.
+        self.assertEqual(job.progress['fraction'], 0.49)
+        self.assertEqual(job.version, version)
+        job.set_progress('separation', 0.0)
+        self.assertEqual(job.version, version + 1)
+
+    def test_wait_for_change_times_out(self):
+        job = Job('test')
+        self.assertFalse(job.wait_for_change(job.version, 0.01))
+        self.assertTrue(job.wait_for_change(job.version - 1, 0.01))
+
+    def test_event_stream_follows_job_to_completion(self):
+        queue = JobQueue(max_workers=1)
+        started, release = threading.Event(), threading.Event()
+
+        def work():
+            progress.report('remix', 0.0, step='decode')
+            started.set()
+            release.wait(5)
+            progress.report('remix', 1.0, step='done')
+            return {'remix_url': '/download/x'}, 200
+
+        job = queue.submit('remix', work)
+        started.wait(5)
+        stream = progress.event_stream(job, heartbeat=0.01)
+        self.assertTrue(next(stream).startswith('retry:'))
+        event, data = parse(next(stream))
+        self.assertEqual(event, 'progress')
+        self.assertEqual(data['progress']['stage'], 'remix')
+        # Nothing new: the stream sends a heartbeat comment.
+        self.assertEqual(next(stream), ': keepalive\n\n')
+        release.set()
+        messages = [m for m in stream if not m.startswith(':')]
+        event, data = parse(messages[-1])
+        self.assertEqual(event, 'done')
+        self.assertEqual(data['status'], FINISHED)
+        self.assertEqual(data['result'], {'remix_url': '/download/x'})
+
+
+if __name__ == '__main__':
+    unittest.main()
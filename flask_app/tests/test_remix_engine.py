@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import audio_io
+import remix_engine
+import stem_store
+from stem_cache import LRUCache
+
+SR = 22050
+
+
+def tone(freq, seconds=1.0, channels=2):
+    t = np.arange(int(SR * seconds)) / SR
+    return np.stack([0.3 * np.sin(2 * np.pi * freq * t)] * channels).astype(np.float32)
+
+
+class RemixEngineTestCase(unittest.TestCase):
+    def test_mix_pads_and_upmixes(self):
+        stereo = tone(440, 1.0)
+        mono = tone(220, 0.5, channels=1)
+        out = remix_engine.mix(stereo, mono)
+        self.assertEqual(out.shape, stereo.shape)
+        np.testing.assert_allclose(out[:, :mono.shape[1]], stereo[:, :mono.shape[1]] + mono, atol=1e-6)
+        np.testing.assert_array_equal(out[:, mono.shape[1]:], stereo[:, mono.shape[1]:])
+
+    def test_mix_clips(self):
+        loud = np.ones((2, 10), dtype=np.float32)
+        self.assertEqual(remix_engine.mix(loud, loud).max(), 1.0)
+
+    def test_render_applies_gains_before_mixing(self):
+        vocals, acc = tone(440), tone(220)
+        out = remix_engine.render(vocals, acc, SR, vocals_gain=-6, acc_gain=6, cache=None)
+        self.assertEqual(out.shape, vocals.shape)
+        self.assertEqual(out.dtype, np.float32)
+        expected = np.clip(vocals * 10 ** (-6 / 20) + acc * 10 ** (6 / 20), -1.0, 1.0)
+        np.testing.assert_allclose(out, expected, atol=1e-6)
+
+    def test_render_without_changes_is_the_plain_mix(self):
+        vocals, acc = tone(440), tone(220, 0.5)
+        out = remix_engine.render(vocals, acc, SR, cache=None)
+        np.testing.assert_array_equal(out, remix_engine.mix(vocals, acc))
+
+    def test_reverb_keeps_shape(self):
+        stem = tone(440)
+        out = remix_engine.reverb(stem, SR, 0.5)
+        self.assertEqual(out.shape, stem.shape)
+        self.assertEqual(out.dtype, np.float32)
+        self.assertIs(remix_engine.reverb(stem, SR, 0.0), stem)
+
+    def test_time_pitch_changes_length_and_frequency(self):
+        channel = tone(440, channels=1)[0]
+        out = remix_engine.time_pitch(channel, SR, tempo=2.0, n_steps=12)
+        self.assertEqual(len(out), len(channel) // 2)
+        spectrum = np.abs(np.fft.rfft(out))
+        peak = np.argmax(spectrum) * SR / len(out)
+        self.assertAlmostEqual(peak, 880, delta=10)
+
+    def test_parallel_matches_serial(self):
+        stems = [tone(440), tone(220)]
+        serial = remix_engine.transform_stems(stems, SR, tempo=1.25, pitch=2, parallelism=1)
+        parallel = remix_engine.transform_stems(stems, SR, tempo=1.25, pitch=2, parallelism=4)
+        for a, b in zip(serial, parallel):
+            self.assertEqual(a.shape, b.shape)
+            np.testing.assert_array_equal(a, b)
+
+    def test_cache_reuses_transformed_stems(self):
+        cache = LRUCache(max_bytes=10 * 1024 * 1024)
+        stems = [tone(440), tone(220)]
+        first = remix_engine.transform_stems(stems, SR, tempo=1.25, pitch=2, parallelism=1, cache=cache)
+        second = remix_engine.transform_stems(stems, SR, tempo=1.25, pitch=2, parallelism=1, cache=cache)
+        self.assertEqual(cache.stats()['hits'], 2)
+        for a, b in zip(first, second):
+            self.assertIs(a, b)
+            self.assertFalse(b.flags.writeable)
+        remix_engine.transform_stems(stems, SR, tempo=1.5, pitch=2, parallelism=1, cache=cache)
+        self.assertEqual(cache.stats()['misses'], 4)
+
+    def test_batch_matches_individual_renders(self):
+        vocals, acc = tone(440), tone(220)
+        variants = [
+            {'tempo': 1.25, 'pitch': 2},
+            {'tempo': 1.25, 'pitch': 2, 'reverb': 0.5},
+            {'pitch': -3, 'vocals_gain': -6},
+            {},
+        ]
+        batch = list(remix_engine.render_batch(vocals, acc, SR, variants, parallelism=2, cache=None))
+        self.assertEqual(len(batch), len(variants))
+        for variant, out in zip(variants, batch):
+            expected = remix_engine.render(
+                vocals, acc, SR,
+                tempo=variant.get('tempo', 1.0), pitch=variant.get('pitch', 0),
+                reverb_amount=variant.get('reverb', 0.0), vocals_gain=variant.get('vocals_gain', 0),
+                parallelism=1, cache=None)
+            np.testing.assert_array_equal(out, expected)
+
+    def test_batch_uses_configured_executor(self):
+        kinds = []
+        get_executor = remix_engine._get_executor
+
+        def record(kind, workers):
+            kinds.append(kind)
+            return get_executor('thread', workers)
+
+        with patch.object(remix_engine, 'REMIX_EXECUTOR', 'process'), \
+                patch.object(remix_engine, '_get_executor', side_effect=record):
+            remix_engine.transform_stems_multi([tone(440)], SR, [(1.25, 0)], parallelism=2)
+        self.assertEqual(kinds, ['process'])
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        cache = LRUCache(max_bytes=10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 4)
+        self.assertEqual(cache.get('a'), 'A')
+        cache.put('c', 'C', 4)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.get('c'), 'C')
+        cache.put('huge', 'H', 11)
+        self.assertIsNone(cache.get('huge'))
+
+
+@unittest.skipUnless(shutil.which(audio_io.FFMPEG), 'ffmpeg is not installed')
+class StemStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.wav = os.path.join(self.tmp, 'vocals.wav')
+        audio_io.save(self.wav, tone(440), SR)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_stem_uses_memmap(self):
+        decoded, _ = remix_engine.load_stem(self.wav, sr=SR)
+        stem_store.write_npy(self.wav)
+        mapped, sr = remix_engine.load_stem(self.wav)
+        self.assertEqual(sr, SR)
+        self.assertIsInstance(mapped, np.memmap)
+        np.testing.assert_array_equal(mapped, decoded)
+
+    def test_excerpt_and_resample_from_memmap(self):
+        stem_store.write_npy(self.wav)
+        excerpt, sr = remix_engine.load_stem(self.wav, offset=0.25, duration=0.5)
+        self.assertEqual(excerpt.shape, (2, SR // 2))
+        resampled, sr = remix_engine.load_stem(self.wav, sr=SR // 2)
+        self.assertEqual(sr, SR // 2)
+        self.assertEqual(resampled.shape, (2, SR // 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
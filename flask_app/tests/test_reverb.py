@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+import reverb
+
+SR = 8000
+
+
+class ReverbTestCase(unittest.TestCase):
+    def test_partitioned_convolution_matches_direct(self):
+        rng = np.random.default_rng(0)
+        x = rng.standard_normal((2, 5000)).astype(np.float32)
+        # Taps spanning several partitions, not a multiple of the block size.
+        ir = rng.standard_normal((2, 1500)).astype(np.float32)
+        out = reverb.convolve(x, ir, block_size=256)
+        expected = np.stack([np.convolve(x[c], ir[c])[:x.shape[1]] for c in range(2)])
+        np.testing.assert_allclose(out, expected, atol=1e-3)
+
+    def test_impulse_response_decays(self):
+        ir = reverb.synthetic_impulse_response(SR, 1.0, channels=2)
+        self.assertEqual(ir.shape[0], 2)
+        np.testing.assert_allclose(np.sum(ir ** 2, axis=1), 1.0, rtol=1e-4)
+        early = np.abs(ir[:, :SR // 10]).max()
+        late = np.abs(ir[:, -SR // 10:]).max()
+        self.assertLess(late, early / 100)
+
+    def test_amount_controls_tail_length(self):
+        impulse = np.zeros((1, 4 * SR), dtype=np.float32)
+        impulse[0, 0] = 1.0
+        short = reverb.convolution_reverb(impulse, SR, 0.1)
+        long = reverb.convolution_reverb(impulse, SR, 1.0)
+        self.assertGreater(np.sum(long[0, 2 * SR:] ** 2), np.sum(short[0, 2 * SR:] ** 2))
+        self.assertIs(reverb.convolution_reverb(impulse, SR, 0.0), impulse)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+import audio_io
+import audio_separator
+import stem_store
+from separation_cache import SeparationCache, cache_key
+from separator_pool import DEFAULT_MODEL
+
+
+class SeparationCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = SeparationCache(root=os.path.join(self.tmp, 'cache'), max_bytes=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_key_depends_on_content_and_model(self):
+        a = self.write('a.wav', b'same audio')
+        b = self.write('b.wav', b'same audio')
+        c = self.write('c.wav', b'other audio')
+        self.assertEqual(self.cache.key_for(a, 'spleeter:2stems'), self.cache.key_for(b, 'spleeter:2stems'))
+        self.assertNotEqual(self.cache.key_for(a, 'spleeter:2stems'), self.cache.key_for(c, 'spleeter:2stems'))
+        self.assertNotEqual(self.cache.key_for(a, 'spleeter:2stems'), self.cache.key_for(a, 'spleeter:4stems'))
+
+    def test_store_and_materialize(self):
+        stems = [self.write('vocals.wav', b'v' * 10), self.write('accompaniment.wav', b'a' * 10)]
+        self.assertIsNone(self.cache.materialize('k', os.path.join(self.tmp, 'out')))
+        self.cache.store('k', stems)
+        placed = self.cache.materialize('k', os.path.join(self.tmp, 'out'))
+        self.assertEqual(set(placed), {'vocals.wav', 'accompaniment.wav'})
+        with open(placed['vocals.wav'], 'rb') as f:
+            self.assertEqual(f.read(), b'v' * 10)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 10000
+        for key in ('old', 'stale', 'new'):
+            self.cache.store(key, [self.write(f'{key}.wav', b'x' * 400)])
+            time.sleep(0.02)
+        # A lookup refreshes 'old', leaving 'stale' as the least recently used entry.
+        self.assertIsNotNone(self.cache.lookup('old'))
+        self.cache.max_bytes = 900
+        self.cache.evict()
+        self.assertIsNotNone(self.cache.lookup('old'))
+        self.assertIsNone(self.cache.lookup('stale'))
+        self.assertIsNotNone(self.cache.lookup('new'))
+
+
+
+@unittest.skipUnless(shutil.which(audio_io.FFMPEG) and shutil.which(audio_io.FFPROBE), 'ffmpeg is not installed')
+class CacheHitSidecarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = SeparationCache(root=os.path.join(self.tmp, 'cache'), max_bytes=10 ** 8)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_stale_sidecars_are_rebuilt_on_a_hit(self):
+        cached = os.path.join(self.tmp, 'cached')
+        os.makedirs(cached)
+        stems = []
+        for name in ('vocals', 'accompaniment'):
+            stems.append(os.path.join(cached, f"{name}.wav"))
+            audio_io.save(stems[-1], np.full((2, 44100), 0.25, dtype=np.float32), 44100)
+        # An entry from before .npy copies existed: WAVs only.
+        self.cache.store(cache_key('digest', DEFAULT_MODEL), stems)
+        song = os.path.join(self.tmp, 'out', 'song')
+        os.makedirs(song)
+        # Another song of the same name was separated into the folder earlier.
+        for name in ('vocals', 'accompaniment'):
+            path = os.path.join(song, f"{name}.wav")
+            audio_io.save(path, np.full((2, 22050), -0.5, dtype=np.float32), 44100)
+            stem_store.write_npy(path)
+        source = os.path.join(self.tmp, 'song.mp3')
+        with open(source, 'wb') as f:
+            f.write(b'audio')
+        with patch.object(audio_separator, 'cache', self.cache):
+            vocals_path, _ = audio_separator.separate_audio(source, os.path.join(self.tmp, 'out'),
+                                                            source_digest='digest')
+        stored, sr = stem_store.load(vocals_path)
+        self.assertEqual(stored.shape, (2, 44100))
+        np.testing.assert_allclose(stored, 0.25, atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
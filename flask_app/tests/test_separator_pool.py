@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+import audio_io
+import stem_store
+from audio_separator import write_accompaniment
+from separator_pool import SeparatorPool, UnknownModel, resolve_model
+
+MB = 1024 * 1024
+
+
+class FakeMemory:
+    """Resident size that grows by each model's size when it is built."""
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.resident = 0
+
+    def factory(self, model_name):
+        self.resident += self.sizes[model_name]
+        return object()
+
+    def measure(self):
+        return self.resident
+
+
+class SeparatorPoolTestCase(unittest.TestCase):
+    def make_pool(self, budget_mb, sizes):
+        memory = FakeMemory(sizes)
+        return SeparatorPool(factory=memory.factory, memory_budget_mb=budget_mb, measure=memory.measure)
+
+    def test_resolve_model(self):
+        self.assertEqual(resolve_model(), 'spleeter:2stems')
+        self.assertEqual(resolve_model(stems='4'), 'spleeter:4stems')
+        self.assertEqual(resolve_model(stems=5), 'spleeter:5stems')
+        self.assertEqual(resolve_model(model='spleeter:4stems'), 'spleeter:4stems')
+        with self.assertRaises(UnknownModel):
+            resolve_model(stems=3)
+        with self.assertRaises(UnknownModel):
+            resolve_model(model='demucs')
+
+    def test_least_recently_used_model_is_evicted(self):
+        pool = self.make_pool(2000, {'spleeter:2stems': 600 * MB, 'spleeter:4stems': 700 * MB,
+                                     'spleeter:5stems': 700 * MB})
+        with pool.acquire('spleeter:2stems'):
+            pass
+        with pool.acquire('spleeter:4stems'):
+            pass
+        with pool.acquire('spleeter:2stems'):
+            pass
+        # 5stems (estimated 1350 MB) does not fit next to both; 4stems was used least recently.
+        with pool.acquire('spleeter:5stems'):
+            pass
+        self.assertNotIn('spleeter:4stems', pool.loaded())
+        self.assertEqual(pool.stats()['spleeter:4stems']['evictions'], 1)
+        self.assertEqual(pool.stats()['spleeter:2stems']['memory_mb'], 600)
+
+    def test_implausible_measurement_falls_back_to_estimate(self):
+        # Another thread allocated 3 GB while the model loaded.
+        pool = self.make_pool(4096, {'spleeter:2stems': 3000 * MB})
+        with pool.acquire():
+            pass
+        self.assertEqual(pool.stats()['spleeter:2stems']['memory_mb'], 600)
+
+    def test_eviction_that_frees_nothing_is_reported(self):
+        # FakeMemory never shrinks, like TensorFlow keeping an evicted model's memory.
+        pool = self.make_pool(1000, {'spleeter:2stems': 600 * MB, 'spleeter:4stems': 1000 * MB})
+        with pool.acquire('spleeter:2stems'):
+            pass
+        with self.assertLogs('remixer-backend.separator', level='WARNING') as logs:
+            with pool.acquire('spleeter:4stems'):
+                pass
+        self.assertIn('RSS fell by 0 MB', logs.output[0])
+        self.assertEqual(pool.memory()['resident_mb'], 1600)
+
+    def test_busy_model_is_not_evicted(self):
+        pool = self.make_pool(1000, {'spleeter:2stems': 600 * MB, 'spleeter:4stems': 700 * MB})
+        entered, release = threading.Event(), threading.Event()
+
+        def hold():
+            with pool.acquire('spleeter:2stems'):
+                entered.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait(5)
+        try:
+            with pool.acquire('spleeter:4stems'):
+                self.assertEqual(pool.loaded(), ['spleeter:2stems', 'spleeter:4stems'])
+        finally:
+            release.set()
+            holder.join()
+        self.assertEqual(pool.stats()['spleeter:2stems']['evictions'], 0)
+
+    def test_warm_model_is_reused(self):
+        pool = self.make_pool(2048, {'spleeter:2stems': 600 * MB})
+        with pool.acquire() as first:
+            pass
+        with pool.acquire() as second:
+            pass
+        self.assertIs(first, second)
+        stats = pool.stats()['spleeter:2stems']
+        self.assertEqual((stats['cold_requests'], stats['warm_requests']), (1, 1))
+
+    def test_warm_up_makes_first_request_warm(self):
+        pool = self.make_pool(2048, {'spleeter:2stems': 600 * MB})
+        pool.warm_up()
+        self.assertEqual(pool.loaded(), ['spleeter:2stems'])
+        with pool.acquire():
+            pass
+        stats = pool.stats()['spleeter:2stems']
+        self.assertEqual((stats['cold_requests'], stats['warm_requests']), (0, 1))
+        self.assertIsNotNone(stats['load_seconds'])
+
+    def test_separator_is_used_by_one_thread_at_a_time(self):
+        pool = self.make_pool(2048, {'spleeter:2stems': 600 * MB})
+        active, overlaps = [0], []
+        lock = threading.Lock()
+
+        def use():
+            with pool.acquire():
+                with lock:
+                    active[0] += 1
+                    overlaps.append(active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=use) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(overlaps), 1)
+        stats = pool.stats()['spleeter:2stems']
+        self.assertEqual((stats['cold_requests'], stats['warm_requests']), (1, 3))
+
+
+@unittest.skipUnless(shutil.which(audio_io.FFMPEG) and shutil.which(audio_io.FFPROBE), 'ffmpeg is not installed')
+class AccompanimentTestCase(unittest.TestCase):
+    def test_sums_non_vocal_stems(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name, level in (('drums', 0.25), ('bass', 0.5)):
+                path = os.path.join(tmp, f"{name}.wav")
+                audio_io.save(path, np.full((2, 44100), level, dtype=np.float32), 44100)
+                stem_store.write_npy(path)
+                paths.append(path)
+            target = os.path.join(tmp, 'accompaniment.wav')
+            write_accompaniment(paths, target, block_frames=300)
+            mixed, sr = audio_io.load(target)
+            self.assertEqual(sr, 44100)
+            self.assertEqual(mixed.shape, (2, 44100))
+            np.testing.assert_allclose(mixed, 0.75, atol=1e-3)
+            # The .npy copy is written alongside, not decoded from the WAV.
+            stored, stored_sr = stem_store.load(target)
+            self.assertEqual(stored_sr, 44100)
+            np.testing.assert_array_equal(stored, np.full((2, 44100), 0.75, dtype=np.float32))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import audio_io
+import metrics
+import transcode_cache
+import workspace
+from output_store import OutputStore
+from transcode_cache import TranscodeCache, content_digest, etag_for
+
+
+class ContentDigestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'vocals.wav')
+        with open(self.path, 'wb') as f:
+            f.write(b'audio')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_digest_follows_content(self):
+        copy = os.path.join(self.tmp, 'copy.wav')
+        shutil.copyfile(self.path, copy)
+        self.assertEqual(content_digest(self.path), content_digest(copy))
+        with open(copy, 'ab') as f:
+            f.write(b'!')
+        self.assertNotEqual(content_digest(self.path), content_digest(copy))
+
+    def test_digest_survives_store_touch(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with patch.object(transcode_cache, 'file_digest', wraps=transcode_cache.file_digest) as file_digest:
+            digest = content_digest(self.path)
+            OutputStore(self.tmp).touch(self.path)
+            self.assertEqual(content_digest(self.path), digest)
+        self.assertEqual(file_digest.call_count, 1)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+
+    def test_digest_follows_replaced_file(self):
+        digest = content_digest(self.path)
+        info = os.stat(self.path)
+        replacement = os.path.join(self.tmp, 'new.wav')
+        with open(replacement, 'wb') as f:
+            f.write(b'AUDIO')
+        # Same size and mtime, different file.
+        os.utime(replacement, ns=(info.st_atime_ns, info.st_mtime_ns))
+        os.replace(replacement, self.path)
+        self.assertNotEqual(content_digest(self.path), digest)
+
+    def test_etag_names_the_variant(self):
+        digest = content_digest(self.path)
+        self.assertEqual(etag_for(digest), digest[:32])
+        self.assertEqual(etag_for(digest, 'opus'), digest[:32] + '-opus')
+
+
+@unittest.skipUnless(shutil.which(audio_io.FFMPEG) and shutil.which(audio_io.FFPROBE), 'ffmpeg is not installed')
+class TranscodeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        patcher = patch.object(workspace, 'SCRATCH_DIR', os.path.join(self.tmp, 'scratch'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = os.path.join(self.tmp, 'vocals.wav')
+        t = np.arange(44100) / 44100
+        audio_io.save(self.source, np.stack([0.3 * np.sin(2 * np.pi * 440 * t)] * 2).astype(np.float32), 44100)
+        self.cache = TranscodeCache(os.path.join(self.tmp, 'transcodes'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_variant_is_encoded_once(self):
+        digest = content_digest(self.source)
+        hits = metrics.cache_requests.value(cache='transcode', result='hit')
+        path = self.cache.get(self.source, digest, 'flac')
+        mtime = os.stat(path).st_mtime_ns
+        self.assertEqual(path, self.cache.get(self.source, digest, 'flac'))
+        # A hit leaves the variant's mtime alone.
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+        self.assertEqual(metrics.cache_requests.value(cache='transcode', result='hit'), hits + 1)
+        self.assertEqual(os.listdir(self.cache.root), [f"{digest}.flac"])
+        self.assertEqual(os.listdir(workspace.SCRATCH_DIR), [])
+        # FLAC is lossless: the variant decodes to the same samples.
+        original, _ = audio_io.load(self.source)
+        variant, _ = audio_io.load(path)
+        np.testing.assert_allclose(variant, original, atol=1e-4)
+
+    def test_lossy_variant_is_smaller(self):
+        path = self.cache.get(self.source, content_digest(self.source), 'mp3')
+        self.assertLess(os.path.getsize(path), os.path.getsize(self.source) / 4)
+        self.assertEqual(audio_io.probe(path)['channels'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
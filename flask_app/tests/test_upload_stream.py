@@ -0,0 +1,87 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from flask import Flask, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+import audio_io
+import upload_stream
+import workspace
+
+
+def make_app(folder):
+    class Request(upload_stream.StreamingRequest):
+        upload_folder = folder
+        early_decode = False
+
+    app = Flask(__name__)
+    app.request_class = Request
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        file = request.files['file']
+        path = file.stream.commit(os.path.join(folder, file.filename))
+        return jsonify({'path': path, 'sha256': file.stream.hexdigest(), 'decoded': file.stream.decoded_path})
+
+    return app
+
+
+class UploadFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_commit_hashes_inline(self):
+        data = os.urandom(3 * upload_stream.UPLOAD_CHUNK_BYTES + 17)
+        upload = upload_stream.stream_to_file(io.BytesIO(data), self.tmp, early_decode=False)
+        dest = upload.commit(os.path.join(self.tmp, 'song.wav'))
+        upload.close()
+        self.assertEqual(upload.hexdigest(), hashlib.sha256(data).hexdigest())
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(self.tmp), ['song.wav'])
+
+    def test_size_limit(self):
+        with self.assertRaises(RequestEntityTooLarge):
+            upload_stream.stream_to_file(io.BytesIO(b'x' * 2048), self.tmp, max_bytes=1024, early_decode=False)
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_uncommitted_upload_is_removed(self):
+        upload = upload_stream.UploadFile(self.tmp, early_decode=False)
+        upload.write(b'partial')
+        upload.close()
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_multipart_streams_into_folder(self):
+        data = os.urandom(100000)
+        response = make_app(self.tmp).test_client().post(
+            '/upload', data={'file': (io.BytesIO(data), 'track.flac')}, content_type='multipart/form-data')
+        body = response.get_json()
+        self.assertEqual(body['sha256'], hashlib.sha256(data).hexdigest())
+        self.assertEqual(os.listdir(self.tmp), ['track.flac'])
+
+    @unittest.skipUnless(shutil.which(audio_io.FFMPEG) and shutil.which(audio_io.FFPROBE), 'ffmpeg is not installed')
+    def test_early_decode(self):
+        t = np.arange(44100) / 44100
+        audio = np.stack([0.5 * np.sin(2 * np.pi * 440 * t)] * 2).astype(np.float32)
+        source = os.path.join(tempfile.mkdtemp(dir=self.tmp), 'source.wav')
+        audio_io.save(source, audio, 44100)
+        scratch = os.path.join(self.tmp, 'scratch')
+        with open(source, 'rb') as f, patch.object(workspace, 'SCRATCH_DIR', scratch):
+            upload = upload_stream.stream_to_file(f, self.tmp, early_decode=True)
+        upload.commit(os.path.join(self.tmp, 'song.wav'))
+        # Decoded frames stay in scratch, out of the upload folder.
+        self.assertEqual(os.path.dirname(upload.decoded_path), scratch)
+        decoded = audio_io.load_raw(upload.decoded_path)
+        expected, _ = audio_io.load(source, sr=44100, channels=2)
+        np.testing.assert_array_equal(decoded, expected.T)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import yt_audio_downloader as downloader
+
+
+class VideoIdTestCase(unittest.TestCase):
+    def test_url_forms(self):
+        for url in [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42',
+            'https://youtu.be/dQw4w9WgXcQ?si=abc',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+            'https://www.youtube.com/embed/dQw4w9WgXcQ',
+        ]:
+            self.assertEqual(downloader.extract_video_id(url), 'dQw4w9WgXcQ', url)
+
+    def test_unrecognized(self):
+        self.assertIsNone(downloader.extract_video_id('https://example.com/track.mp3'))
+        self.assertIsNone(downloader.extract_video_id('https://www.youtube.com/watch?v=short'))
+
+
+class DownloadCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def touch(self, name):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(b'audio')
+        return path
+
+    def test_find_cached_ignores_partial_files(self):
+        self.touch('dQw4w9WgXcQ.native.webm.part')
+        os.makedirs(os.path.join(self.tmp, 'dQw4w9WgXcQ.native'))
+        self.assertIsNone(downloader.find_cached('dQw4w9WgXcQ', self.tmp, 'native'))
+        path = self.touch('dQw4w9WgXcQ.native.webm')
+        self.assertEqual(downloader.find_cached('dQw4w9WgXcQ', self.tmp, 'native'), path)
+
+    def test_find_cached_is_keyed_by_mode(self):
+        # Neither an upload-style name nor the other mode's download counts as a hit.
+        self.touch('dQw4w9WgXcQ.mp3')
+        native = self.touch('dQw4w9WgXcQ.native.webm')
+        self.assertIsNone(downloader.find_cached('dQw4w9WgXcQ', self.tmp, 'wav'))
+        wav = self.touch('dQw4w9WgXcQ.wav.wav')
+        self.assertEqual(downloader.find_cached('dQw4w9WgXcQ', self.tmp, 'wav'), wav)
+        self.assertEqual(downloader.find_cached('dQw4w9WgXcQ', self.tmp, 'native'), native)
+
+    def test_downloads_are_named_by_mode(self):
+        template = downloader._ydl_options(self.tmp, 'wav')['outtmpl']
+        self.assertEqual(template, os.path.join(self.tmp, '%(id)s.wav.%(ext)s'))
+
+    def test_default_folder_is_not_uploads(self):
+        self.assertNotEqual(os.path.normpath(downloader.DOWNLOAD_FOLDER), 'uploads')
+
+    def test_cache_hit_skips_download(self):
+        path = self.touch('dQw4w9WgXcQ.native.m4a')
+        with patch.object(downloader, '_download') as download:
+            result = downloader.download_youtube_audio('https://youtu.be/dQw4w9WgXcQ', self.tmp, mode='native')
+        self.assertEqual(result, path)
+        download.assert_not_called()
+
+    def test_cache_miss_downloads(self):
+        target = os.path.join(self.tmp, 'dQw4w9WgXcQ.native.webm')
+
+        def fake_download(url, output_path, mode):
+            return self.touch(f'dQw4w9WgXcQ.{mode}.webm')
+
+        url = 'https://youtu.be/dQw4w9WgXcQ'
+        with patch.object(downloader, '_download', side_effect=fake_download) as download:
+            self.assertEqual(downloader.download_youtube_audio(url, self.tmp, mode='native'), target)
+            self.assertEqual(downloader.download_youtube_audio(url, self.tmp, mode='native'), target)
+        self.assertEqual(download.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
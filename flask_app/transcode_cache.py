@@ -0,0 +1,88 @@
+# transcode_cache.py
+"""
+Compressed variants of stems and remixes for download, and their ETags.
+
+Downloads can ask for ?format=opus|mp3|flac|ogg instead of the stored WAV.
+A variant is encoded once and kept under TRANSCODE_CACHE_DIR as
+<content sha256>.<format>, so the same audio is never encoded twice, even
+under another file name. The directory is garbage-collected like the
+output folders (see output_store.py), with TRANSCODE_CACHE_MAX_MB as its
+quota.
+
+ETags are derived from the content hash of the stored file, so a
+re-separated stem with identical audio keeps its ETag and browsers keep
+their copy.
+"""
+import logging
+import os
+import threading
+
+import audio_io
+import metrics
+import workspace
+from separation_cache import file_digest
+from stem_cache import LRUCache
+
+logger = logging.getLogger("remixer-backend.transcode")
+
+TRANSCODE_CACHE_DIR = os.environ.get('TRANSCODE_CACHE_DIR', os.path.join('cache', 'transcodes'))
+TRANSCODE_CACHE_MAX_BYTES = int(os.environ.get('TRANSCODE_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+# Content hashes by (path, inode, mtime, size); each entry counts as 1, so this holds 4096 files.
+# Nothing that merely reads a file changes these: stores record use on
+# marker files (see output_store.py), not on the file's mtime.
+_digests = LRUCache(4096)
+
+
+def content_digest(path):
+    """SHA-256 hex digest of the file at path, remembered until the file changes."""
+    info = os.stat(path)
+    key = (os.path.abspath(path), info.st_ino, info.st_mtime_ns, info.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        digest = file_digest(path).hexdigest()
+        _digests.put(key, digest, 1)
+    return digest
+
+
+def etag_for(digest, fmt=None):
+    """Strong ETag value (unquoted) for a file, or for its variant in fmt."""
+    return digest[:32] if fmt is None else f"{digest[:32]}-{fmt}"
+
+
+class TranscodeCache:
+    def __init__(self, root=TRANSCODE_CACHE_DIR):
+        self.root = root
+        self._locks_guard = threading.Lock()
+        self._locks = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def path_for(self, digest, fmt):
+        return os.path.join(self.root, f"{digest}.{fmt}")
+
+    def get(self, source_path, digest, fmt):
+        """Returns the path of source_path (whose content hash is digest) encoded as fmt, encoding it on a miss."""
+        path = self.path_for(digest, fmt)
+        with self._lock(path):
+            hit = os.path.exists(path)
+            metrics.record_cache('transcode', hit)
+            if hit:
+                # The caller marks the variant used in its store (touch_artifact in app.py).
+                return path
+            logger.info(f"Encoding {source_path} as {fmt}")
+            scratch_path = workspace.scratch_file('.' + fmt)
+            try:
+                audio_io.transcode(source_path, scratch_path, fmt)
+                workspace.publish(scratch_path, path)
+            finally:
+                if os.path.exists(scratch_path):
+                    os.remove(scratch_path)
+        return path
+
+
+# Shared by every request handled in this process.
+transcodes = TranscodeCache()
@@ -0,0 +1,116 @@
+# upload_stream.py
+"""
+Streaming uploads.
+
+Uploaded files are written straight into the upload folder chunk by chunk
+while the request body is read, instead of being spooled to a temporary
+file and copied afterwards. The same pass computes the SHA-256 used as the
+separation cache key and, optionally, feeds ffmpeg so the audio is already
+decoded (into a scratch file, see workspace.py) by the time the upload
+completes.
+"""
+import hashlib
+import logging
+import os
+import uuid
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import audio_io
+import workspace
+
+logger = logging.getLogger("remixer-backend.upload")
+
+UPLOAD_FOLDER = 'uploads'
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_MB', '1024')) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Decode uploads while they arrive (see audio_io.PipeDecoder).
+EARLY_DECODE = os.environ.get('UPLOAD_EARLY_DECODE', '1') == '1'
+
+
+class UploadFile:
+    """
+    Writable, readable file for one upload. Bytes are written to a hidden
+    .part file in directory and hashed as they arrive; commit() moves the
+    file to its final name. An upload that is never committed is deleted
+    when closed.
+    """
+
+    def __init__(self, directory=UPLOAD_FOLDER, max_bytes=UPLOAD_MAX_BYTES, early_decode=EARLY_DECODE):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.decoded_path = None
+        self._file = open(self.path, 'wb+')
+        self._digest = hashlib.sha256()
+        self._decoder = None
+        if early_decode:
+            try:
+                self._decoder = audio_io.PipeDecoder(workspace.scratch_file('.f32'))
+            except OSError as e:
+                logger.warning(f"Early decode unavailable: {e}")
+        self._committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Uploads are limited to {self.max_bytes} bytes")
+        self._digest.update(data)
+        if self._decoder is not None:
+            self._decoder.feed(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def commit(self, dest_path):
+        """Moves the completed upload to dest_path. Returns dest_path."""
+        self._file.close()
+        if self._decoder is not None:
+            if self._decoder.finish():
+                # Left in scratch; whoever consumes it deletes it.
+                self.decoded_path = self._decoder.out_path
+            else:
+                logger.info(f"Could not decode {dest_path} while uploading; it will be decoded from disk")
+        os.replace(self.path, dest_path)
+        self.path = dest_path
+        self._committed = True
+        return dest_path
+
+    def close(self):
+        if self._committed:
+            return
+        self._file.close()
+        if self._decoder is not None:
+            self._decoder.abort()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._committed = True
+
+    def __getattr__(self, name):
+        # read(), seek(), tell() and friends go to the underlying file.
+        return getattr(self._file, name)
+
+
+def stream_to_file(stream, directory=UPLOAD_FOLDER, max_bytes=UPLOAD_MAX_BYTES, early_decode=EARLY_DECODE):
+    """Copies a raw request body into an UploadFile. Returns the (uncommitted) UploadFile."""
+    upload = UploadFile(directory, max_bytes, early_decode)
+    try:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b''):
+            upload.write(chunk)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+class StreamingRequest(Request):
+    """Request class whose multipart file parts are streamed into UploadFiles."""
+
+    upload_folder = UPLOAD_FOLDER
+    early_decode = EARLY_DECODE
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadFile(self.upload_folder, early_decode=self.early_decode)
@@ -0,0 +1,66 @@
+# workspace.py
+"""
+Per-job scratch space.
+
+Intermediate files (early-decoded uploads, remixes being encoded) are
+written under SCRATCH_DIR in a directory or file name unique to the job,
+so concurrent jobs on the same song never share a path. Finished artifacts
+are moved into place with publish(), which is atomic when the scratch
+directory is on the same filesystem as the destination; readers never see
+a half-written file.
+
+Point SCRATCH_DIR at a tmpfs (e.g. /dev/shm/remixer) to keep intermediates
+in RAM. Published artifacts are then copied once onto the output disk.
+Scratch left behind by a crashed worker is removed by the background
+collector (see output_store.py).
+"""
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR', 'scratch')
+
+
+def scratch_file(suffix=''):
+    """Returns a new, unused path in the scratch directory. The caller deletes the file."""
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    return os.path.join(SCRATCH_DIR, uuid.uuid4().hex + suffix)
+
+
+@contextmanager
+def scratch(prefix='job-'):
+    """Yields a private scratch directory that is deleted when the block exits."""
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_DIR)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def publish(src, dest):
+    """
+    Moves a finished file from scratch to dest, replacing any existing file
+    atomically. Across filesystems (scratch on tmpfs) the file is copied next
+    to dest first and then renamed. Returns dest.
+    """
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    try:
+        os.replace(src, dest)
+    except OSError:
+        staging = os.path.join(os.path.dirname(dest), f".{uuid.uuid4().hex}.part")
+        try:
+            shutil.copyfile(src, staging)
+            os.replace(staging, dest)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        os.remove(src)
+    return dest
+
+
+def unique_name(stem, ext):
+    """A file name that no other job will pick, e.g. remix_3f2a9c1d.wav."""
+    return f"{stem}_{uuid.uuid4().hex[:12]}{ext}"
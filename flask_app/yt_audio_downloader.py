@@ -1,36 +1,134 @@
 # yt_audio_downloader.py
 """
 Download audio from a YouTube URL and save it as a file.
+
+Files are named after the video ID and ingest mode, so a video that was
+already fetched is reused instead of downloaded again. They are kept in
+their own directory (YOUTUBE_DOWNLOAD_DIR), apart from uploads, so an
+uploaded file can never pass for a cached download. By default the native
+audio stream is kept as is; the separator decodes it directly, so
+transcoding it to MP3 first would only cost time and a lossy generation.
 """
+import glob
+import logging
 import os
-import yt_dlp
+import re
+import threading
+
+import audio_io
+import metrics
+import progress
+
+logger = logging.getLogger("remixer-backend.youtube")
+
+# 'native' keeps the downloaded stream (webm/opus, m4a, ...); 'wav' decodes it
+# once to 16-bit PCM at the separator's sample rate.
+INGEST_MODE = os.environ.get('YOUTUBE_INGEST_MODE', 'native')
+# Only this module writes here; /upload cannot name files in it.
+DOWNLOAD_FOLDER = os.environ.get('YOUTUBE_DOWNLOAD_DIR', os.path.join('cache', 'downloads'))
+
+_VIDEO_ID = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/|/v/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])')
+# Leftovers of interrupted downloads or conversions.
+_PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+_locks_guard = threading.Lock()
+_locks = {}
+
+
+def extract_video_id(url):
+    """Returns the 11-character video ID in a YouTube URL, or None if there is none."""
+    match = _VIDEO_ID.search(url or '')
+    return match.group(1) if match else None
+
+
+def find_cached(video_id, output_path=DOWNLOAD_FOLDER, mode=None):
+    """Returns the path of a completed download of video_id in ingest mode in output_path, or None."""
+    prefix = f"{video_id}.{mode or INGEST_MODE}."
+    for path in sorted(glob.glob(os.path.join(glob.escape(output_path), glob.escape(prefix) + '*'))):
+        if os.path.isfile(path) and not path.endswith(_PARTIAL_SUFFIXES) and '.temp.' not in path:
+            return path
+    return None
+
+
+def _video_lock(video_id):
+    with _locks_guard:
+        return _locks.setdefault(video_id, threading.Lock())
+
 
-def download_youtube_audio(url, output_path='uploads'):
+def _progress_hook(status):
+    """Forwards yt-dlp download progress to the current job."""
+    if status.get('status') == 'downloading':
+        total = status.get('total_bytes') or status.get('total_bytes_estimate')
+        downloaded = status.get('downloaded_bytes') or 0
+        progress.report(
+            'download', min(downloaded / total, 1.0) if total else None,
+            downloaded_bytes=downloaded, total_bytes=total, speed=status.get('speed'), eta=status.get('eta'))
+    elif status.get('status') == 'finished':
+        progress.report('download', 1.0)
+
+
+def _ydl_options(output_path, mode):
+    options = {
+        'format': 'bestaudio/best',
+        'outtmpl': os.path.join(output_path, f'%(id)s.{mode}.%(ext)s'),
+        'noplaylist': True,
+        'quiet': True,
+        'progress_hooks': [_progress_hook],
+    }
+    if mode == 'wav':
+        options['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'wav'}]
+        options['postprocessor_args'] = {
+            'extractaudio': ['-ar', str(audio_io.CANONICAL_SAMPLE_RATE), '-ac', '2'],
+        }
+    return options
+
+
+def _download(url, output_path, mode):
+    import yt_dlp
+
+    with metrics.stage('download'), yt_dlp.YoutubeDL(_ydl_options(output_path, mode)) as ydl:
+        info = ydl.extract_info(url, download=True)
+        if mode == 'wav':
+            return os.path.splitext(ydl.prepare_filename(info))[0] + '.wav'
+        # Post-processing-free downloads record their final path here.
+        downloads = info.get('requested_downloads') or [{}]
+        return downloads[0].get('filepath') or ydl.prepare_filename(info)
+
+
+def download_youtube_audio(url, output_path=DOWNLOAD_FOLDER, mode=None):
     """
-    Downloads audio from a YouTube URL and saves it as an mp3 file in the output_path.
-    Returns the path to the downloaded file, or None if failed.
+    Downloads audio from a YouTube URL into output_path as
+    <video id>.<mode>.<ext>. If that video was downloaded in that mode
+    before, the existing file is returned without touching the network.
+
+    Args:
+        url (str): The URL of the YouTube video.
+        output_path (str): The directory where the audio file is saved.
+        mode (str): 'native' or 'wav'; defaults to YOUTUBE_INGEST_MODE.
+
+    Returns:
+        str: The path to the audio file, or None if the download failed.
     """
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
+    mode = mode or INGEST_MODE
+    os.makedirs(output_path, exist_ok=True)
+    video_id = extract_video_id(url)
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'quiet': True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            mp3_filename = os.path.splitext(filename)[0] + '.mp3'
-            if os.path.exists(mp3_filename):
-                return mp3_filename
-            else:
-                return None
+        if video_id is None:
+            # Unrecognized URL form: let yt-dlp resolve the ID.
+            path = _download(url, output_path, mode)
+        else:
+            with _video_lock(video_id):
+                path = find_cached(video_id, output_path, mode)
+                metrics.record_cache('download', path is not None)
+                if path:
+                    logger.info(f"Reusing download of {video_id}: {path}")
+                    progress.report('download', 1.0, cached=True)
+                    return path
+                path = _download(url, output_path, mode)
+        if path and os.path.exists(path):
+            return path
+        logger.error(f"Download of {url} finished but {path} is missing")
+        return None
     except Exception as e:
-        print(f"Error downloading audio: {e}")
+        logger.error(f"Error downloading audio: {e}")
         return None
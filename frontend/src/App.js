@@ -12,6 +12,7 @@ export function App() {
   const [pitch, setPitch] = useState(0);
   const [effectMix, setEffectMix] = useState(0);
   const [loading, setLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const fileInputRef = useRef();
 
   // Backend status check
@@ -22,6 +23,46 @@ export function App() {
       .catch(() => setStatus('Backend not reachable'));
   }, []);
 
+  // Follow a backend job over Server-Sent Events until it finishes.
+  // Resolves with {ok, data} like a synchronous fetch would.
+  const followJob = (jobId) => new Promise((resolve) => {
+    const source = new EventSource(`${process.env.REACT_APP_API_URL}/jobs/${jobId}/events`);
+    source.addEventListener('progress', (e) => {
+      const job = JSON.parse(e.data);
+      setProgress(job.progress ? job.progress : { stage: job.status, fraction: null });
+    });
+    source.addEventListener('done', (e) => {
+      const job = JSON.parse(e.data);
+      source.close();
+      setProgress(null);
+      resolve({ ok: job.status_code < 400, data: job.result || {} });
+    });
+    source.onerror = () => {
+      // EventSource reconnects by itself; only give up once it has closed.
+      if (source.readyState === EventSource.CLOSED) {
+        setProgress(null);
+        resolve({ ok: false, data: { error: 'Lost connection to backend.' } });
+      }
+    };
+  });
+
+  // Submit work with async=1 and wait for it through the progress stream.
+  const runJob = async (path, options) => {
+    const response = await fetch(`${process.env.REACT_APP_API_URL}${path}`, options);
+    const data = await response.json();
+    if (response.status !== 202 || !data.job_id) {
+      return { ok: response.ok, data };
+    }
+    setProgress({ stage: 'queued', fraction: null });
+    return followJob(data.job_id);
+  };
+
+  const describeProgress = (p) => {
+    const labels = { queued: 'Waiting in queue', running: 'Starting', download: 'Downloading', separation: 'Separating stems', remix: 'Rendering remix' };
+    const label = labels[p.stage] || p.stage;
+    return p.fraction == null ? `${label}...` : `${label}: ${Math.round(p.fraction * 100)}%`;
+  };
+
   // Handle file selection
   const handleFileChange = (e) => {
     const selected = Array.from(e.target.files);
@@ -56,13 +97,12 @@ export function App() {
     setLoading(true);
     setMessage('Sending URL to backend...');
     try {
-      const response = await fetch(`${process.env.REACT_APP_API_URL}/process_url`, {
+      const { ok, data } = await runJob('/process_url', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ url: youtubeUrl.trim() })
+        body: JSON.stringify({ url: youtubeUrl.trim(), async: true })
       });
-      const data = await response.json();
-      if (response.ok) {
+      if (ok) {
         setMessage(data.message || 'URL processed successfully!');
       } else {
         setMessage(data.error || 'Failed to process URL.');
@@ -83,13 +123,13 @@ export function App() {
     setMessage('Uploading files...');
     const formData = new FormData();
     files.forEach(f => formData.append('file', f));
+    formData.append('async', '1');
     try {
-      const response = await fetch(`${process.env.REACT_APP_API_URL}/upload`, {
+      const { ok, data } = await runJob('/upload', {
         method: 'POST',
         body: formData
       });
-      const data = await response.json();
-      if (response.ok) {
+      if (ok) {
         setMessage(data.message || 'Files uploaded!');
         setRemixReady(true);
       } else {
@@ -158,7 +198,21 @@ export function App() {
           background: '#4a5568', padding: 20, borderRadius: 10, marginBottom: 20, border: '1px solid #63b3ed',
           minHeight: 50, display: 'flex', alignItems: 'center', justifyContent: 'center', fontStyle: 'italic'
         }}>
-          {loading ? <span>Loading...</span> : <span>{message}</span>}
+          {loading ? (
+            progress ? (
+              <div style={{ width: '100%' }}>
+                <span>{describeProgress(progress)}</span>
+                {progress.fraction != null && (
+                  <div style={{ marginTop: 10, height: 8, background: '#2d3748', borderRadius: 4 }}>
+                    <div style={{
+                      width: `${Math.round(progress.fraction * 100)}%`, height: '100%',
+                      background: '#63b3ed', borderRadius: 4, transition: 'width 0.3s'
+                    }} />
+                  </div>
+                )}
+              </div>
+            ) : <span>Loading...</span>
+          ) : <span>{message}</span>}
         </div>
         <div className="input-section" style={{
           background: '#4a5568', padding: 20, borderRadius: 10, marginBottom: 20, border: '1px solid #63b3ed'